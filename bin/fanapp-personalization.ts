@@ -52,6 +52,7 @@ const fanAppPersonalizationStack = new FanAppPersonalizationStack(
 // Nested stack; No need to speicfy a synthetizer for nested stacks;
 new DataIngestionContentStack(fanAppPersonalizationStack, dataIngestionContentStackName, {
   fanAppContentDdbTableName: fanAppPersonalizationStack.fanAppContentDdbTableName,
+  fanAppSyncStateDdbTable: fanAppPersonalizationStack.fanAppSyncStateDdbTable,
   lambdaCommonLayer: fanAppPersonalizationStack.commonLambdaLayer,
 });
 
@@ -65,6 +66,7 @@ new DataProcessingContentStack(fanAppPersonalizationStack, dataProcessingContent
     fanAppPersonalizationStack.fanAppPersonalisationNewsDatasetGroup,
   fanAppContentDdbTableName: fanAppPersonalizationStack.fanAppContentDdbTableName,
   fanAppContentDdbTable: fanAppPersonalizationStack.fanAppContentDdbTable,
+  fanAppSyncStateDdbTable: fanAppPersonalizationStack.fanAppSyncStateDdbTable,
   lambdaCommonLayer: fanAppPersonalizationStack.commonLambdaLayer,
 });
 
@@ -15,20 +15,23 @@
 import json
 import boto3
 import sys
-from dynamodb_json import json_util as json2
 import csv
-import pandas as pd
-from pandas.io.json import json_normalize
-from io import StringIO
 import os
-import time
-from time import sleep
+import glob
+import gzip
+import io
 from datetime import datetime
+from functools import partial
+from urllib.parse import urlparse
+from common_ddb_json_util import decode_item, decode_items
+from common_resource_util import find_dataset_arn, find_schema_arn
+from common_pipeline_util import read_pages_in_parallel
 
 
 client = boto3.client('dynamodb')
 personalize = boto3.client('personalize')
 ssm = boto3.client('ssm')
+s3 = boto3.client('s3')
 
 p13n =  os.environ['P13N']
 stage = os.environ["STAGE"]
@@ -38,6 +41,32 @@ news_group_arn = os.environ["NEWS_GROUP_ARN"]
 s3_name = os.environ["CONTENT_BUCKET"]
 role_import_arn = os.environ["ROLE_IMPORT"]
 ddb_table = os.environ['CONTENT_TABLE']
+scan_segments = int(os.environ.get('SCAN_SEGMENTS', 4))
+# 'scan' reads the live content table, 'export' a DynamoDB table export (s3://bucket/prefix or a local directory)
+content_source = os.environ.get('CONTENT_SOURCE', 'scan')
+export_location = os.environ.get('EXPORT_LOCATION', '')
+export_workers = int(os.environ.get('EXPORT_WORKERS', 4))
+export_page_size = 1000
+# S3 parts are at least 5MB (but the last one)
+csv_part_size = max(5, int(os.environ.get('CSV_PART_SIZE_MB', 8))) * 1024 * 1024
+
+# only the attributes needed by the items datasets are read
+content_projection = {
+    'ProjectionExpression': '#id, #type, #meta.#channel, #meta.#place, #meta.#description, '
+                            '#meta.#duration, #meta.#thumb, #meta.#title, #meta.#tags',
+    'ExpressionAttributeNames': {
+        '#id': 'contentId',
+        '#type': 'contentType',
+        '#meta': 'contentMetadata',
+        '#channel': 'channel',
+        '#place': 'place',
+        '#description': 'description',
+        '#duration': 'durationMs',
+        '#thumb': 'thumb',
+        '#title': 'name_title',
+        '#tags': 'tags',
+    },
+}
 
 news_schema = {
         "type": "record",
@@ -144,10 +173,9 @@ def check_dataset(dataset_group_arn,type_dataset):
     type_dataset: the type of dataset we want to build (Users, items or interactions)
     :return boolean saying if the dataset already exist or not, and if exist, return also the ARN of it 
     '''
-    response = personalize.list_datasets(datasetGroupArn=dataset_group_arn,maxResults=100)
-    for dataset in response["datasets"]:
-        if dataset["datasetType"] == type_dataset:
-            return True, dataset["datasetArn"]
+    dataset_arn = find_dataset_arn(dataset_group_arn, type_dataset)
+    if dataset_arn:
+        return True, dataset_arn
     return(False,"")
 
 
@@ -156,24 +184,84 @@ def check_schema(schema_name):
     schema_name: the name of the schema we want to test 
     :return boolean saying if the schema already exist or not, and if exist, return also the ARN of it 
     '''
-    response = personalize.list_schemas(maxResults=100)
-    for schema in response["schemas"]:
-        if schema["name"] == schema_name:
-            return True, schema["schemaArn"]
+    schema_arn = find_schema_arn(schema_name)
+    if schema_arn:
+        return True, schema_arn
     return(False,"")
 
 
-def create_personalize_dataset(final_data, bucket, name, dataset_group_arn, content_schema):
-    # S3 part----- VIDEO
-    # creating a pandas dataframe based on list object and flattening json object into table format
-    df = json_normalize(final_data) 
-    
-    # writing the dataframe to csv and uploading on S3 bucket
-    csv_buffer = StringIO()
-    df.to_csv(csv_buffer)
-    s3_resource = boto3.resource('s3')
-    s3_resource.Object(bucket, f'{name}-content-meta.csv').put(Body=csv_buffer.getvalue())
-    
+class S3MultipartUpload:
+    '''
+    Uploads the bytes written to an S3 object in parts of part_size,
+    so that at most one part is held in memory
+    '''
+
+    def __init__(self, bucket, key, part_size=csv_part_size):
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.size = 0
+        self._buffer = bytearray()
+        self._parts = []
+        self._upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+
+    def write(self, data):
+        self._buffer += data
+        self.size += len(data)
+        if len(self._buffer) >= self.part_size:
+            self._upload_part()
+
+    def _upload_part(self):
+        part_number = len(self._parts) + 1
+        response = s3.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                  PartNumber=part_number, Body=bytes(self._buffer))
+        self._parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+        self._buffer.clear()
+
+    def complete(self):
+        if self._buffer or not self._parts:
+            self._upload_part()
+        s3.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                     MultipartUpload={'Parts': self._parts})
+
+    def abort(self):
+        s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+
+
+class ItemsCsvWriter:
+    '''
+    Streams the rows of an items dataset to S3 as a CSV file, the columns
+    in the order of the fields of the dataset schema
+    '''
+
+    def __init__(self, bucket, key, content_schema):
+        self.fieldnames = [field["name"] for field in content_schema["fields"]]
+        self.rows = 0
+        self._upload = S3MultipartUpload(bucket, key)
+        self._csv = csv.DictWriter(self, fieldnames=self.fieldnames, extrasaction='ignore')
+
+    def __enter__(self):
+        self._csv.writeheader()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self._upload.complete()
+            print(f"Uploaded {self.rows} rows ({self._upload.size} bytes) to s3://{self._upload.bucket}/{self._upload.key}")
+        else:
+            self._upload.abort()
+
+    def write(self, text):
+        # called by the csv writer
+        self._upload.write(text.encode('utf-8'))
+
+    def writerow(self, row):
+        self._csv.writerow(row)
+        self.rows += 1
+
+
+def create_personalize_dataset(bucket, name, dataset_group_arn, content_schema):
+    # S3 part----- the {name}-content-meta.csv file has been written by the ItemsCsvWriter
 
     # Personalize part------
     # Create schema for Personalize dataset
@@ -212,26 +300,26 @@ def create_personalize_dataset(final_data, bucket, name, dataset_group_arn, cont
         content_dataset_arn = create_content_dataset['datasetArn']
     # #test if work
     # print(json.dumps(create_content_dataset, indent=2))
-    
-    # Populating Personalize dataset by reading file from S3
-    
+
+    ssm_response = ssm.put_parameter(
+        Name=f"/{p13n}/{stage}/{name}ContentDataSetArn",
+        Description=f'Content Dataset ARN for {name}',
+        Value=content_dataset_arn,
+        Type='String',
+        Overwrite=True
+    )
+    return content_dataset_arn
+
+
+def import_personalize_dataset(bucket, name, content_dataset_arn):
+    '''
+    Populates the Personalize dataset from the {name}-content-meta.csv file;
+    the state machine calls it once the dataset is ACTIVE
+    :return: str the ARN of the import job
+    '''
     s3_bucket = bucket
     s3_object = f'{name}-content-meta.csv'
 
-    #finally import all to the dataset
-    max_time = time.time() + 15*60 # 15 mins
-    while time.time() < max_time:
-        describe_dataset_group_response = personalize.describe_dataset(
-        datasetArn = content_dataset_arn
-        )
-        status = describe_dataset_group_response["dataset"]["status"]
-        print("DatasetGroup: {}".format(status))
-    
-        if status == "ACTIVE" or status == "CREATE FAILED":
-            break
-        
-        time.sleep(10)
-    
     time_now = datetime.now().strftime("%Y%m%d%H%m")
     create_dataset_import_job_response_bulk = personalize.create_dataset_import_job(
         jobName = f"{p13n}{name}-content-import-bulk-{stage}-{time_now}",
@@ -243,63 +331,171 @@ def create_personalize_dataset(final_data, bucket, name, dataset_group_arn, cont
         roleArn = role_import_arn
     )
 
-    users_dataset_import_job_arn_bulk = create_dataset_import_job_response_bulk['datasetImportJobArn']
-
-    ssm_response = ssm.put_parameter(
-        Name=f"/{p13n}/{stage}/{name}ContentDataSetArn",
-        Description=f'Content Dataset ARN for {name}',
-        Value=content_dataset_arn,
-        Type='String',
-        Overwrite=True
-    )
-    return content_dataset_arn
+    return create_dataset_import_job_response_bulk['datasetImportJobArn']
 
 def replaceIfEmpty(fieldValue):
+     if fieldValue is None:
+        return "-"
+     fieldValue = str(fieldValue) #numbers (e.g. durationMs) are decoded as int
      if (not fieldValue.strip()):
         return "-"
      return fieldValue
 
+
+def to_item_row(i):
+    '''
+    Maps an item of the content table to a row of the items dataset
+    :param dict i: The item (plain json)
+    :return: dict json_obj: None when the item has to be skipped
+    '''
+    json_obj = {}
+    if (not  i.get("contentId")):
+        return None #just skip empty contentId (be resilient!)
+    # extracting each item from the content table
+    json_obj["ITEM_ID"] = i["contentId"]
+    # json_obj["CONTENT_URL"] = i["contentURL"]
+    json_obj["CONTENT_TYPE"] = replaceIfEmpty(i["contentType"])
+
+    # extracting data from the channel meta-data mapping attribute
+    if i["contentType"] == "news":
+        json_obj["CHANNEL"] = replaceIfEmpty(i["contentMetadata"]["channel"])
+        json_obj["PLACE"] = replaceIfEmpty(i["contentMetadata"]["place"])
+        # json_obj["THUMB_DESC"] = i["contentMetadata"]["thumbDesc"]
+    if i["contentType"] == "video":
+        json_obj["DESCRIPTION"] = replaceIfEmpty(i["contentMetadata"]["description"])
+        json_obj["DURATION"] = replaceIfEmpty(i["contentMetadata"]["durationMs"])
+    json_obj["THUMB"] = replaceIfEmpty(i["contentMetadata"]["thumb"])
+    json_obj["NAME_TITLE"] = replaceIfEmpty(i["contentMetadata"]["name_title"])
+
+    # extracting tags and joining using | operator based on the items dataset requirement for Personalize
+    json_obj["TAGS"] = i["contentMetadata"]["tags"] #tags can be nullable
+    return json_obj
+
+
+def scan_segment(segment, total_segments):
+    '''
+    Scans one segment of the content table following LastEvaluatedKey
+    :return: generator of pages of items (plain json)
+    '''
+    kwargs = dict(TableName=ddb_table, Segment=segment, TotalSegments=total_segments, **content_projection)
+    while True:
+        response = client.scan(**kwargs)
+        # converting DDB json to normal json format
+        yield decode_items(response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def scan_content_items(total_segments=scan_segments):
+    '''
+    Parallel scan of the whole content table
+    :param int total_segments: The number of segments scanned concurrently
+    :return: generator of items (plain json), page by page as the segments return them
+    '''
+    readers = [partial(scan_segment, segment, total_segments) for segment in range(total_segments)]
+    for page in read_pages_in_parallel(readers, total_segments):
+        yield from page
+
+
+def list_export_files(location):
+    '''
+    Lists the data files of a DynamoDB table export
+    :param str location: s3://bucket/prefix or a local directory
+    :return: list of str file locations (s3:// urls or paths)
+    '''
+    parsed = urlparse(location)
+    if parsed.scheme != 's3':
+        return sorted(glob.glob(os.path.join(location, '**', '*.json.gz'), recursive=True))
+    files = []
+    for response in s3.get_paginator('list_objects_v2').paginate(Bucket=parsed.netloc, Prefix=parsed.path.lstrip('/')):
+        files.extend(f"s3://{parsed.netloc}/{obj['Key']}" for obj in response.get('Contents', []) if obj['Key'].endswith('.json.gz'))
+    return files
+
+
+def open_export_file(location):
+    '''
+    :return: text stream of the decompressed file, read while downloaded
+    '''
+    parsed = urlparse(location)
+    if parsed.scheme != 's3':
+        return gzip.open(location, 'rt', encoding='utf-8')
+    body = s3.get_object(Bucket=parsed.netloc, Key=parsed.path.lstrip('/'))['Body']
+    return io.TextIOWrapper(gzip.GzipFile(fileobj=body), encoding='utf-8')
+
+
+def read_export_file(location, page_size=export_page_size):
+    '''
+    Reads a data file of an export, one {"Item": {...}} DynamoDB json per line
+    :return: generator of pages of items (plain json)
+    '''
+    page = []
+    with open_export_file(location) as lines:
+        for line in lines:
+            if line.strip():
+                page.append(decode_item(json.loads(line)['Item']))
+            if len(page) == page_size:
+                yield page
+                page = []
+    if page:
+        yield page
+
+
+def read_export_items(location, workers=export_workers):
+    '''
+    Reads the items of a DynamoDB table export, the files in parallel
+    :param str location: s3://bucket/prefix or a local directory
+    :return: generator of items (plain json)
+    '''
+    files = list_export_files(location)
+    if not files:
+        raise ValueError(f'no export data files (*.json.gz) found in {location}')
+    print(f"Reading {len(files)} export files from {location}")
+    for page in read_pages_in_parallel([partial(read_export_file, f) for f in files], workers):
+        yield from page
+
+
+def read_content_items(event):
+    '''
+    :return: generator of the items of the content table, from the source asked by the event or the env
+    '''
+    source = event.get('contentSource', content_source)
+    if source == 'export':
+        return read_export_items(event.get('exportLocation', export_location))
+    return scan_content_items()
+
+
 def lambda_handler(event, context):
     # Referencing S3 Bucket and DDB Table to map with Lambda Function 
     bucket =  s3_name
-    data = client.scan(TableName=ddb_table)
 
-    # converting DDB json to normal json format
-    data_new = json2.loads(data) 
-    
-    final_data_video = []
-    final_data_news = []
-    
-    for i in data_new['Items']:
-        json_obj = {}
-        if (not  i["contentId"]):
-            continue #just skip empty contentId (be resilient!)
-        # extracting each item from the content table
-        json_obj["ITEM_ID"] = i["contentId"]
-        # json_obj["CONTENT_URL"] = i["contentURL"]
-        json_obj["CONTENT_TYPE"] = replaceIfEmpty(i["contentType"])
-
-        # extracting data from the channel meta-data mapping attribute
-        if i["contentType"] == "news":
-            json_obj["CHANNEL"] = replaceIfEmpty(i["contentMetadata"]["channel"])
-            json_obj["PLACE"] = replaceIfEmpty(i["contentMetadata"]["place"])
-            # json_obj["THUMB_DESC"] = i["contentMetadata"]["thumbDesc"]
-        if i["contentType"] == "video":
-            json_obj["DESCRIPTION"] = replaceIfEmpty(i["contentMetadata"]["description"])
-            json_obj["DURATION"] = replaceIfEmpty(i["contentMetadata"]["durationMs"])
-        json_obj["THUMB"] = replaceIfEmpty(i["contentMetadata"]["thumb"])
-        json_obj["NAME_TITLE"] = replaceIfEmpty(i["contentMetadata"]["name_title"])
-        
-        # extracting tags and joining using | operator based on the items dataset requirement for Personalize
-        json_obj["TAGS"] = i["contentMetadata"]["tags"] #tags can be nullable
-        
-        # appending extracted data to a list object
-        if i["contentType"] == "video":
-            final_data_video.append(json_obj)
-        elif i["contentType"] == "news":
-            final_data_news.append(json_obj)
+    # the rows are streamed to S3 while the items are read
+    with ItemsCsvWriter(bucket, 'video-content-meta.csv', video_schema) as csv_video, \
+            ItemsCsvWriter(bucket, 'news-content-meta.csv', news_schema) as csv_news:
+        for i in read_content_items(event):
+            json_obj = to_item_row(i)
+            if json_obj is None:
+                continue
+            if i["contentType"] == "video":
+                csv_video.writerow(json_obj)
+            elif i["contentType"] == "news":
+                csv_news.writerow(json_obj)
 
-    video_content_dataset_arn = create_personalize_dataset(final_data_video, bucket, "video", video_group_arn, video_schema)
-    news_content_dataset_arn = create_personalize_dataset(final_data_news, bucket, "news", news_group_arn, news_schema)
+    video_content_dataset_arn = create_personalize_dataset(bucket, "video", video_group_arn, video_schema)
+    news_content_dataset_arn = create_personalize_dataset(bucket, "news", news_group_arn, news_schema)
+
+    # the datasets are imported by import_handler once the state machine has seen them ACTIVE
+    return {'datasetArns': [video_content_dataset_arn, news_content_dataset_arn]}
+
+
+def import_handler(event, context):
+    '''
+    Imports the items CSVs written by lambda_handler
+    :param dict event: {"datasetArns": [video dataset ARN, news dataset ARN]}
+    :return: dict with the ARNs of the import jobs
+    '''
+    video_content_dataset_arn, news_content_dataset_arn = event['datasetArns']
+    video_import_job_arn = import_personalize_dataset(s3_name, "video", video_content_dataset_arn)
+    news_import_job_arn = import_personalize_dataset(s3_name, "news", news_content_dataset_arn)
 
-    return [video_content_dataset_arn, news_content_dataset_arn]
+    return {'datasetImportJobArns': [video_import_job_arn, news_import_job_arn]}
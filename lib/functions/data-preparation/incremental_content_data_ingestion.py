@@ -15,104 +15,142 @@
 import boto3
 import os
 import logging
-import time
-from dynamodb_json import json_util as json2
 from json import dumps
+from collections import Counter
+from common_ddb_json_util import decode_item
+from common_resource_util import get_parameters
+from common_personalize_events_util import PersonalizeEventsClient, calls_needed, coalesce, failed_record_indexes
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 personalize = boto3.client('personalize')
-personalize_events = boto3.client('personalize-events')
-ssm = boto3.client('ssm')
+events_client = PersonalizeEventsClient()
 
 p13n = os.environ['P13N']
 stage = os.environ["STAGE"]
 environment = os.environ["ENVIRONMENT_NAME"]
-video_content_dataset_arn = ssm.get_parameter(
-    Name=f"/{p13n}/{stage}/videoContentDataSetArn")["Parameter"]["Value"]
-news_content_dataset_arn = ssm.get_parameter(
-    Name=f"/{p13n}/{stage}/newsContentDataSetArn")["Parameter"]["Value"]
+video_content_dataset_parameter = f"/{p13n}/{stage}/videoContentDataSetArn"
+news_content_dataset_parameter = f"/{p13n}/{stage}/newsContentDataSetArn"
 
 
 def update_dataset_group(new_content_array, content_dataset_arn):
-    logger.info(f"update_dataset_group for %s", content_dataset_arn)
+    '''
+    Sends the items to the Personalize dataset, 10 per put_items call
+    :return: list of futures of the calls, sent as fast as the put_items TPS allows
+    '''
+    logger.info(f"update_dataset_group for %s: %d items", content_dataset_arn, len(new_content_array))
     logger.info(new_content_array)
     # ingest data to Amazon Personalize dataset
-    response = personalize_events.put_items(
-        datasetArn=content_dataset_arn,
-        items=new_content_array
-    )
-    # max 10tps per second of put_items. putting this 300ms wait to ensure we comply with it
-    time.sleep(0.3)
-    return response["ResponseMetadata"]
+    return events_client.put_items(content_dataset_arn, new_content_array)
 
 
 def clean_item_attribute(src):
+    # the decoded images carry typed values, e.g. the number durationMs
+    src = '' if src is None else str(src)
     if not src.strip():
         return '-'
     return src.replace("'", "\'").replace("\"", "\\\"")
 
 
+def to_personalize_item(new_content):
+    '''
+    Maps the image of a content to an item of the Personalize items datasets
+    :param dict new_content: The NewImage of the stream record (plain json)
+    :return: dict the item for put_items
+    '''
+    json_obj_put = {}
+    json_obj_put["itemId"] = new_content["contentId"]
+
+    properties_json = {}
+    # properties_json["CONTENT_URL"] = new_content["contentURL"]
+    properties_json["contentType"] = new_content["contentType"]
+    properties_json["thumb"] = clean_item_attribute(
+        new_content["contentMetadata"]["thumb"])
+    properties_json["nameTitle"] = clean_item_attribute(
+        new_content["contentMetadata"]["name_title"])
+    # extracting tags and joining using | operator based on the items dataset requirement for Personalize
+    if new_content["contentMetadata"]["tags"].strip():
+        properties_json["tags"] = clean_item_attribute(
+            new_content["contentMetadata"]["tags"])
+
+    # extracting data from the channel meta-data mapping attribute
+    if new_content["contentType"] == "news":
+        properties_json["channel"] = clean_item_attribute(
+            new_content["contentMetadata"]["channel"])
+        properties_json["place"] = clean_item_attribute(
+            new_content["contentMetadata"]["place"])
+    elif new_content["contentType"] == "video":
+        properties_json["description"] = clean_item_attribute(
+            new_content["contentMetadata"]["description"])
+        properties_json["duration"] = clean_item_attribute(
+            new_content["contentMetadata"]["durationMs"])
+
+    json_obj_put["properties"] = dumps(properties_json)
+    return json_obj_put
+
+
 def lambda_handler(event, context):
-    chunk_video = []
-    chunk_news = []
+    video_items = []
+    video_sequence_numbers = []
+    news_items = []
+    news_sequence_numbers = []
+    failed_sequence_numbers = []
     logger.info(event)
 
+    # one GetParameters call, then cached between the invocations of the warm container
+    parameters = get_parameters([video_content_dataset_parameter, news_content_dataset_parameter])
+    video_content_dataset_arn = parameters[video_content_dataset_parameter]
+    news_content_dataset_arn = parameters[news_content_dataset_parameter]
+
+    new_contents = []
     for data in event["Records"]:
         if data["eventName"] == 'REMOVE':
             logger.info("skip item - nothing to do when we remove items")
             continue
 
-        new_content = json2.loads(data["dynamodb"]["NewImage"])
+        sequence_number = data["dynamodb"]["SequenceNumber"]
+        try:
+            new_content = decode_item(data["dynamodb"]["NewImage"])
+            new_contents.append((sequence_number, new_content["contentId"], new_content))
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            logger.exception(f"invalid record %s: %s", sequence_number, e)
+            failed_sequence_numbers.append(sequence_number)
+
+    # only the last image of an item of the batch is sent
+    record_counts = Counter(content_id for _, content_id, _ in new_contents)
+    video_records = news_records = 0
+    for sequence_number, content_id, new_content in coalesce(new_contents, lambda record: record[1]):
         # logger.info("new content:")
         # logger.info(new_content)
-
-        json_obj_put = {}
-        json_obj_put["itemId"] = new_content["contentId"]
-
-        properties_json = {}
-        # properties_json["CONTENT_URL"] = new_content["contentURL"]
-        properties_json["contentType"] = new_content["contentType"]
-        properties_json["thumb"] = clean_item_attribute(
-            new_content["contentMetadata"]["thumb"])
-        properties_json["nameTitle"] = clean_item_attribute(
-            new_content["contentMetadata"]["name_title"])
-        # extracting tags and joining using | operator based on the items dataset requirement for Personalize
-        if new_content["contentMetadata"]["tags"].strip():
-            properties_json["tags"] = clean_item_attribute(
-                new_content["contentMetadata"]["tags"])
-
-        # extracting data from the channel meta-data mapping attribute
-        if new_content["contentType"] == "news":
-            properties_json["channel"] = clean_item_attribute(
-                new_content["contentMetadata"]["channel"])
-            properties_json["place"] = clean_item_attribute(
-                new_content["contentMetadata"]["place"])
-        elif new_content["contentType"] == "video":
-            properties_json["description"] = clean_item_attribute(
-                new_content["contentMetadata"]["description"])
-            properties_json["duration"] = clean_item_attribute(
-                new_content["contentMetadata"]["durationMs"])
-
-        json_obj_put["properties"] = dumps(properties_json)
+        try:
+            json_obj_put = to_personalize_item(new_content)
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            logger.exception(f"invalid content %s (record %s): %s", content_id, sequence_number, e)
+            failed_sequence_numbers.append(sequence_number)
+            continue
 
         if new_content["contentType"] == "video":
-            chunk_video.append(json_obj_put)
-            if len(chunk_video) == 10:
-                update_dataset_group(
-                    chunk_video, video_content_dataset_arn)
-                chunk_video = []
+            video_items.append(json_obj_put)
+            video_sequence_numbers.append(sequence_number)
+            video_records += record_counts[content_id]
         elif new_content["contentType"] == "news":
-            chunk_news.append(json_obj_put)
-            if len(chunk_news) == 10:
-                update_dataset_group(
-                    chunk_news, news_content_dataset_arn)
-                chunk_news = []
-
-    if len(chunk_video) > 0:
-        update_dataset_group(
-            chunk_video, video_content_dataset_arn)
-    if len(chunk_news) > 0:
-        update_dataset_group(
-            chunk_news, news_content_dataset_arn)
+            news_items.append(json_obj_put)
+            news_sequence_numbers.append(sequence_number)
+            news_records += record_counts[content_id]
+
+    # the video and news calls are sent concurrently
+    video_futures = update_dataset_group(video_items, video_content_dataset_arn) if video_items else []
+    news_futures = update_dataset_group(news_items, news_content_dataset_arn) if news_items else []
+    failed_sequence_numbers += [video_sequence_numbers[i] for i in failed_record_indexes(video_futures, len(video_items))]
+    failed_sequence_numbers += [news_sequence_numbers[i] for i in failed_record_indexes(news_futures, len(news_items))]
+
+    # the calls the records of the items sent would have needed without coalescing
+    calls = len(video_futures) + len(news_futures)
+    calls_saved = calls_needed(video_records) + calls_needed(news_records) - calls
+    stats = {'records': len(new_contents), 'sent': len(video_items) + len(news_items),
+             'calls': calls, 'callsSaved': calls_saved, 'failed': len(failed_sequence_numbers)}
+    logger.info(f"put_items stats: %s", stats)
+
+    # the stream is retried from the first failed record only
+    return {"batchItemFailures": [{"itemIdentifier": sequence_number} for sequence_number in failed_sequence_numbers]}
@@ -16,8 +16,10 @@ import json
 import boto3
 import os
 import logging
-import time
-from dynamodb_json import json_util as json2
+from collections import Counter
+from common_ddb_json_util import decode_item
+from common_resource_util import find_dataset_arn
+from common_personalize_events_util import PersonalizeEventsClient, calls_needed, coalesce, failed_record_indexes
 
 # Environment variables
 p13n = os.environ['P13N']
@@ -30,7 +32,7 @@ logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 personalize = boto3.client('personalize')
-personalize_events = boto3.client('personalize-events')
+events_client = PersonalizeEventsClient()
 
 
 def extract_pref(answers):
@@ -94,20 +96,15 @@ def check_data(event):
     return user
 
 
-def users_to_personalize(user_chunk, dataset_arn):
+def users_to_personalize(users, dataset_arn):
     '''
-    Put the new data in the personalize dataset 
-    :user_chunk: array of users to put. max length 10
-    :dataset_group_arn: the arn of the dataset group 
-    :return: response 
+    Put the new data in the personalize dataset, 10 users per put_users call 
+    :users: array of users to put
+    :dataset_arn: the arn of the users dataset 
+    :return: list of futures of the calls, sent as fast as the put_users TPS allows 
     '''
-    logger.info("Add to the personalize dataset %s", dataset_arn)
-    personalize_events.put_users(
-        datasetArn=dataset_arn,
-        users=user_chunk
-    )
-    # max 10tps per second of put_users. putting this 300ms wait to ensure we comply with it
-    time.sleep(0.3)
+    logger.info("Add %d users to the personalize dataset %s", len(users), dataset_arn)
+    return events_client.put_users(dataset_arn, users)
 
 
 def get_dataset_arn(dataset_group_arn, type_dataset):
@@ -116,38 +113,61 @@ def get_dataset_arn(dataset_group_arn, type_dataset):
     type_dataset: the type of dataset we want to build (Users, items or interactions)
     :return the ARN of the dataset of type_dataset in the dataset_group
     '''
-    response = personalize.list_datasets(
-        datasetGroupArn=dataset_group_arn, maxResults=100)
-    dataset_arn = ""
-    for dataset in response["datasets"]:
-        if dataset["datasetType"] == type_dataset:
-            dataset_arn = dataset["datasetArn"]
-    return dataset_arn
+    # cached between the invocations of the warm container
+    return find_dataset_arn(dataset_group_arn, type_dataset) or ""
 
 
 def handler(event, context):
     '''
     Combine all the steps together from taking the inital data from the user table to putting them to the personalize dataset for users 
-    :return responses for each step 
+    :return the records to retry, as batchItemFailures 
     '''
     dataset_arn_news = get_dataset_arn(dataset_group_news_arn, "USERS")
     dataset_arn_videos = get_dataset_arn(dataset_group_videos_arn, "USERS")
 
-    user_chunk = []
+    users = []
+    sequence_numbers = []
+    failed_sequence_numbers = []
     events = event["Records"]
     logger.info(f"handling new user preferences from %d events", len(events))
 
-    for i in range(len(events)):
-        data = events[i]
-        unique_event = json2.loads(data["dynamodb"]["NewImage"])
-        user = check_data(unique_event)
-        user_chunk.append(user)
-
-        if (len(user_chunk) == 10) or (i == len(events) - 1):
-            # Finally put it to the personalize dataset
-            logger.info(f"sending chunk of users: %d", len(user_chunk))
-            users_to_personalize(
-                user_chunk, dataset_arn_news)
-            users_to_personalize(
-                user_chunk, dataset_arn_videos)
-            user_chunk = []
+    new_answers = []
+    for data in events:
+        sequence_number = data["dynamodb"]["SequenceNumber"]
+        try:
+            unique_event = decode_item(data["dynamodb"]["NewImage"])
+            new_answers.append((sequence_number, unique_event["personalizationId"], unique_event))
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            logger.exception(f"invalid record %s: %s", sequence_number, e)
+            failed_sequence_numbers.append(sequence_number)
+
+    # only the last answers of a user of the batch are sent
+    record_counts = Counter(perso_id for _, perso_id, _ in new_answers)
+    user_records = 0
+    for sequence_number, perso_id, unique_event in coalesce(new_answers, lambda record: record[1]):
+        try:
+            user = check_data(unique_event)
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            logger.exception(f"invalid answers of %s (record %s): %s", perso_id, sequence_number, e)
+            failed_sequence_numbers.append(sequence_number)
+            continue
+        users.append(user)
+        sequence_numbers.append(sequence_number)
+        user_records += record_counts[perso_id]
+
+    # Finally put it to both personalize datasets, the calls are sent concurrently
+    news_futures = users_to_personalize(users, dataset_arn_news) if users else []
+    videos_futures = users_to_personalize(users, dataset_arn_videos) if users else []
+    # a user not sent to one of the datasets is retried
+    failed_indexes = set(failed_record_indexes(news_futures, len(users))) | \
+        set(failed_record_indexes(videos_futures, len(users)))
+    failed_sequence_numbers += [sequence_numbers[i] for i in sorted(failed_indexes)]
+
+    # the calls the records of the users sent would have needed without coalescing
+    calls = len(news_futures) + len(videos_futures)
+    stats = {'records': len(events), 'sent': len(users), 'calls': calls,
+             'callsSaved': 2 * calls_needed(user_records) - calls, 'failed': len(failed_sequence_numbers)}
+    logger.info(f"put_users stats: %s", stats)
+
+    # the stream is retried from the first failed record only
+    return {"batchItemFailures": [{"itemIdentifier": sequence_number} for sequence_number in failed_sequence_numbers]}
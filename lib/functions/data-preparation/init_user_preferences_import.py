@@ -18,8 +18,8 @@ import boto3
 from boto3.dynamodb.conditions import Key, Attr
 import os
 import pandas as pd
-import time
 import logging
+from common_resource_util import find_dataset_arn, find_dataset_import_job_arn, find_schema_arn
 
 # Environment variables
 p13n = os.environ['P13N']
@@ -139,15 +139,12 @@ def users_to_s3(user_table, s3_bucket, s3_object_name):
         s3_object_name).put(Body=user_data.to_csv(index=False))
     return (response)
 
-def to_personalize(s3_bucket, s3_object_name, role_import_arn, dataset_type, dataset_group_arn):
+def to_personalize(dataset_type, dataset_group_arn):
     '''
-    put all the user data to a personalize dataset 
-    :s3_bucket: the s3 bucket where to fetch data
-    :s3_object_name: the name of the object where the data are stored  
+    create the personalize dataset for the user data 
     :dataset_group_arn: the arn of the dataset group where to create the dataset
-    :role_import_arn:the role to import data to personalize
     :dataset_type: news or videos 
-    :return response
+    :return the ARN of the users dataset
     '''
     logger.info("Creating the user schema for Personalize")
     users_schema = {
@@ -215,20 +212,19 @@ def to_personalize(s3_bucket, s3_object_name, role_import_arn, dataset_type, dat
         # test if work
         logger.info(json.dumps(create_dataset_response, indent=2))
 
-    # Wait until the dataset is created before imported it
-    status = ""
-    while status != "ACTIVE" and status != "CREATE FAILED":
-        describe_dataset_group_response = personalize.describe_dataset(
-            datasetArn=users_dataset_arn
-        )
-        status = describe_dataset_group_response["dataset"]["status"]
-        logger.info("DatasetGroup: {}".format(status))
+    return users_dataset_arn
 
-        if status == "ACTIVE" or status == "CREATE FAILED":
-            break
-        # wait 1 minute to check again
-        time.sleep(60)
 
+def import_to_personalize(s3_bucket, s3_object_name, role_import_arn, dataset_type, users_dataset_arn):
+    '''
+    put all the user data to the personalize dataset, once it is ACTIVE 
+    :s3_bucket: the s3 bucket where to fetch data
+    :s3_object_name: the name of the object where the data are stored  
+    :role_import_arn:the role to import data to personalize
+    :dataset_type: news or videos 
+    :users_dataset_arn: the arn of the users dataset
+    :return the ARN of the import job
+    '''
     # Finally import all to the dataset
     import_job_name = f'fanapp-{dataset_type}-user-import-bulk-' + stage
     import_job_exist, users_dataset_import_job_arn = check_import_job(
@@ -244,10 +240,7 @@ def to_personalize(s3_bucket, s3_object_name, role_import_arn, dataset_type, dat
             roleArn=role_import_arn
         )
         users_dataset_import_job_arn = create_dataset_import_job_response['datasetImportJobArn']
-
-        response = json.dumps(create_dataset_import_job_response, indent=2)
-        return (response)
-    return ()
+    return users_dataset_import_job_arn
 
 
 def check_schema(schema_name):
@@ -255,10 +248,9 @@ def check_schema(schema_name):
     schema_name: the name of the schema we want to test 
     :return boolean saying if the schema already exist or not, and if exist, return also the ARN of it 
     '''
-    response = personalize.list_schemas(maxResults=100)
-    for schema in response["schemas"]:
-        if schema["name"] == schema_name:
-            return True, schema["schemaArn"]
+    schema_arn = find_schema_arn(schema_name)
+    if schema_arn:
+        return True, schema_arn
     return (False, "")
 
 
@@ -268,11 +260,9 @@ def check_dataset(dataset_group_arn, type_dataset):
     type_dataset: the type of dataset we want to build (Users, items or interactions)
     :return boolean saying if the dataset already exist or not, and if exist, return also the ARN of it 
     '''
-    response = personalize.list_datasets(
-        datasetGroupArn=dataset_group_arn, maxResults=100)
-    for dataset in response["datasets"]:
-        if dataset["datasetType"] == type_dataset:
-            return True, dataset["datasetArn"]
+    dataset_arn = find_dataset_arn(dataset_group_arn, type_dataset)
+    if dataset_arn:
+        return True, dataset_arn
     return (False, "")
 
 
@@ -282,11 +272,9 @@ def check_import_job(dataset_arn, import_job_name):
     import_job_name: the name of the import job we want to create
     :return boolean saying if this import job already exist or not, and if exist, return also the ARN of it 
     '''
-    response = personalize.list_dataset_import_jobs(
-        datasetArn=dataset_arn, maxResults=100)
-    for job in response['datasetImportJobs']:
-        if job["jobName"] == import_job_name:
-            return True, job["datasetImportJobArn"]
+    import_job_arn = find_dataset_import_job_arn(dataset_arn, import_job_name)
+    if import_job_arn:
+        return True, import_job_arn
     return (False, "")
 
 
@@ -296,10 +284,24 @@ def handler(event, context):
     :return responses for each step 
     '''
     # first put processed data to the intermediate Table
-    response1 = users_to_s3(user_table, s3_bucket, s3_object_name)
-    response2 = to_personalize(
-        s3_bucket, s3_object_name, role_import_arn, "videos", dataset_video_group_arn)
-    response3 = to_personalize(
-        s3_bucket, s3_object_name, role_import_arn, "news", dataset_news_group_arn)
+    users_to_s3(user_table, s3_bucket, s3_object_name)
+    videos_dataset_arn = to_personalize("videos", dataset_video_group_arn)
+    news_dataset_arn = to_personalize("news", dataset_news_group_arn)
+
+    # the datasets are imported by import_handler once the state machine has seen them ACTIVE
+    return {'datasetArns': [videos_dataset_arn, news_dataset_arn]}
+
+
+def import_handler(event, context):
+    '''
+    Import the user data put to S3 by the handler to the personalize datasets 
+    :event: {"datasetArns": [videos dataset ARN, news dataset ARN]}
+    :return the ARNs of the import jobs 
+    '''
+    videos_dataset_arn, news_dataset_arn = event["datasetArns"]
+    videos_import_job_arn = import_to_personalize(
+        s3_bucket, s3_object_name, role_import_arn, "videos", videos_dataset_arn)
+    news_import_job_arn = import_to_personalize(
+        s3_bucket, s3_object_name, role_import_arn, "news", news_dataset_arn)
 
-    return (response1, response2, response3)
+    return {'datasetImportJobArns': [videos_import_job_arn, news_import_job_arn]}
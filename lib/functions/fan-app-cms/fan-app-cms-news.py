@@ -13,14 +13,23 @@
 # by AWS under this SOW.
 
 """Process the initial content data"""
-import http.client
-import json
 import logging
 import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
 from urllib.parse import urlparse
 from datetime import datetime, timedelta
 
 import common_http_client_util as httpclientUtil
+from common_json_stream_util import JsonItemsStream
+from common_rate_limit_util import AdaptiveRateLimiter
+from common_pipeline_util import read_pages_in_parallel
+from common_sync_state_util import get_watermark, set_watermark
+from common_ddb_util import content_hash, get_stored_hashes, BulkWriter, CONTENT_HASH_ATTRIBUTE, BATCH_GET_MAX_KEYS
 import boto3
 
 """Initialise variables"""
@@ -30,6 +39,13 @@ dynamodb = boto3.resource('dynamodb')
 content_table = os.environ['CONTENT_TABLE']
 cms_apy_key =  os.environ['CMS_API_KEY']
 cms_host = urlparse(os.environ['CMS_ENDPOINT']).hostname
+CMS_PAGE_WORKERS = int(os.environ.get('CMS_PAGE_WORKERS', 4))
+# pages fetched ahead of the writer
+CMS_PREFETCH_PAGES = int(os.environ.get('CMS_PREFETCH_PAGES', 2))
+CMS_MAX_RPS = float(os.environ.get('CMS_MAX_RPS', 5))
+cmsRateLimiter = AdaptiveRateLimiter(CMS_MAX_RPS, minRate=0.5)
+cmsConnectionPool = httpclientUtil.get_connection_pool(cms_host, maxsize=CMS_PAGE_WORKERS+1, rateLimiter=cmsRateLimiter,
+                                                       maxRetries=int(os.environ.get('CMS_MAX_RETRIES', 5)))
 cdn_host = os.environ['CDN_HOST']
 cms_fan_app_basepath = os.environ['CMS_BASE_PATH']
 cms_fan_app_news_path = cms_fan_app_basepath + "/fan-app-news/published"
@@ -42,6 +58,13 @@ CMS_FAN_APP_NEWS_QUERY_STRING_FORMAT = (
 """&sinceDate=2022-06-28T10:29:30"""
 
 CMS_FAN_APP_NEWS_ITEMS_PER_PAGE = 500
+CMS_NEWS_SYNC_ID = 'cms-news'
+# 'initial' reads all the news, 'incremental' the ones since the watermark of the last successful run
+CMS_SYNC_MODE = os.environ.get('SYNC_MODE', 'incremental')
+# the watermark is moved back a little to catch the news indexed late by the cms
+CMS_WATERMARK_OVERLAP_MINUTES = int(os.environ.get('CMS_WATERMARK_OVERLAP_MINUTES', 30))
+# used by incremental runs until the first watermark is stored
+CMS_DEFAULT_DAYS_AGO = 1
 
 
 def handler(event, context):
@@ -52,77 +75,159 @@ def handler(event, context):
     # logger.info(f'Processing {str(len(event["Records"]))} records in this invocation')
 
     maxItems = event.get('maxItems',0)
-    daysAgo = int(os.environ.get('DAYS_AGO',event.get('daysAgo',0))) #env variable has priority
-    if (daysAgo == 0):
+    runStartedAt = datetime.utcnow().replace(microsecond=0)
+    sinceDate = get_since_date(event, runStartedAt)
+    if sinceDate is None:
         logger.info(f'Extracting CMS data for initial update')
     else:
-        logger.info(f'Extracting CMS data for partial update (daysAgo %d)',daysAgo)
+        logger.info(f'Extracting CMS data for partial update (sinceDate %s)',sinceDate)
     if (maxItems > 0):
         logger.info(f'results will be limited to %d as required via event parameter',maxItems)
     pageSize =  min(maxItems,CMS_FAN_APP_NEWS_ITEMS_PER_PAGE) if (maxItems>0) else CMS_FAN_APP_NEWS_ITEMS_PER_PAGE
-    skip = 0
-    readPage =  readPagedCMSNews(skip,pageSize,daysAgo)
-    totalItems = readPage.get('totalItems',0)
-    totalItems = min(totalItems,maxItems) if (maxItems>0) else totalItems
-    if totalItems > 0 :
-        items = readPage["items"]
-        items = (items[:(maxItems)]) if ( maxItems > 0 and len(items) > maxItems) else items
-        contentIdsWrittenSoFar = []
-        logger.info('Start writing (%s)/(%s) items ',len(items), totalItems)
-        write_to_ddb(items,contentIdsWrittenSoFar)
-        logger.info('Written (%s)/(%s) so far ',skip+len(items), totalItems)
-        skip += pageSize
-        while skip < totalItems:
-            readPage =  readPagedCMSNews(skip,pageSize,daysAgo)
-            items = readPage["items"]
-            items = (items[:maxItems-(skip+len(items))]) if ( maxItems > 0 and skip+len(items) > maxItems) else items
-            logger.info('Continue writing (%s) items',len(items))
-            write_to_ddb(items,contentIdsWrittenSoFar)
-            logger.info('Written (%s)/(%s) so far ',skip+len(items), totalItems)
-            skip += pageSize
-        logger.info('End writing all (%s) items ', totalItems)
-        if (totalItems>len(contentIdsWrittenSoFar)):
-            logger.warning("Got %s elements skipped due to duplicated in CMS call!", (totalItems-len(contentIdsWrittenSoFar)))
-    else:
-      logger.warning('no items found in CMS!')
-    
+    contentIdsWrittenSoFar = set()
+    writeStats = {'written': 0, 'suppressed': 0}
+    totalItems = 0
+    timings = {'fetchSeconds': 0, 'writeSeconds': 0}
+    pipelineTimings = {}
+    # the fetcher thread stays up to CMS_PREFETCH_PAGES pages ahead of the writer
+    fetcher = partial(fetchCMSNewsPages, timings, pageSize, maxItems, sinceDate)
+    for skip, items, totalItems in read_pages_in_parallel([fetcher], 1, CMS_PREFETCH_PAGES, pipelineTimings):
+        if skip == 0 and totalItems > 0:
+            logger.info('Start writing (%s) items ', totalItems)
+        started = time.monotonic()
+        for k, v in write_to_ddb(items,contentIdsWrittenSoFar).items():
+            writeStats[k] += v
+        timings['writeSeconds'] += time.monotonic() - started
+        logger.info('Written (%s)/(%s) so far ',min(skip+pageSize,totalItems), totalItems)
+    timings['fetcherBlockedSeconds'] = pipelineTimings['blockedSeconds']
+    timings['writerWaitingSeconds'] = pipelineTimings['waitingSeconds']
+    # all the pages have been written: the next run can start from here
+    if maxItems == 0:
+        set_watermark(CMS_NEWS_SYNC_ID, runStartedAt.isoformat(), dict(writeStats, items=totalItems))
+    if totalItems == 0:
+        logger.warning('no items found in CMS!')
+        return
+    logger.info('End writing all (%s) items: written (%s) suppressed as unchanged (%s)', totalItems, writeStats['written'], writeStats['suppressed'])
+    logger.info('cms rate (%.2f) calls/s throttles (%s)', cmsRateLimiter.rate, cmsRateLimiter.throttles)
+    if (totalItems>len(contentIdsWrittenSoFar)):
+        logger.warning("Got %s elements skipped due to duplicated in CMS call!", (totalItems-len(contentIdsWrittenSoFar)))
+    # the fetcher blocked means DynamoDB is the bottleneck, the writer waiting means CMS is
+    logger.info('fetch (%.2f)s fetcher blocked (%.2f)s write (%.2f)s writer waiting (%.2f)s', timings['fetchSeconds'],
+                timings['fetcherBlockedSeconds'], timings['writeSeconds'], timings['writerWaitingSeconds'])
+    return dict(timings, **writeStats, items=totalItems, unique=len(contentIdsWrittenSoFar))
 
-def readPagedCMSNews(skip = 0, itemsPerPage = 5, daysAgo = 0):
+def get_since_date(event, runStartedAt):
+    '''
+    Works out the sinceDate of the run: the daysAgo of the event or DAYS_AGO (backfills),
+    otherwise nothing in initial mode and the stored watermark minus the overlap in incremental mode
+    :param datetime runStartedAt: The start of the run
+    :return: str sinceDate, None to read all the news
     '''
-    Extracts the initial upload
-    :return: dict items: The list of cms content from CMS
+    daysAgo = int(event.get('daysAgo',os.environ.get('DAYS_AGO',0)))
+    if daysAgo > 0:
+        return (runStartedAt - timedelta(days = daysAgo)).isoformat()
+    if CMS_SYNC_MODE == 'initial':
+        return None
+    watermark = get_watermark(CMS_NEWS_SYNC_ID)
+    if watermark:
+        return (datetime.fromisoformat(watermark) - timedelta(minutes = CMS_WATERMARK_OVERLAP_MINUTES)).isoformat()
+    logger.info(f'No watermark found, reading the last %s days',CMS_DEFAULT_DAYS_AGO)
+    return (runStartedAt - timedelta(days = CMS_DEFAULT_DAYS_AGO)).isoformat()
+
+def fetchCMSNewsPages(timings, pageSize, maxItems = 0, sinceDate = None):
+    '''
+    Fetcher of the pipeline: reads the pages in order
+    :param dict timings: The fetch seconds are added to it
+    :return: generator of tuples (skip, items, totalItems)
+    '''
+    # the first page tells how many items there are
+    started = time.monotonic()
+    with readPagedCMSNews(0,pageSize,sinceDate) as readPage:
+        items = list(islice(readPage, maxItems) if (maxItems>0) else readPage)
+        pageTotal = readPage.finish().get('total',0)
+    totalItems = min(pageTotal,maxItems) if (maxItems>0) else pageTotal
+    timings['fetchSeconds'] += time.monotonic() - started
+    yield 0, items, totalItems
+    # the other pages are fetched concurrently and returned in order
+    started = time.monotonic()
+    for skip, items in readRemainingCMSNewsPages(pageSize,totalItems,sinceDate):
+        timings['fetchSeconds'] += time.monotonic() - started
+        yield skip, items, totalItems
+        started = time.monotonic()
+
+
+@contextmanager
+def readPagedCMSNews(skip = 0, itemsPerPage = 5, sinceDate = None):
+    '''
+    Streams one page of news from CMS
+    :return: JsonItemsStream readPage: iterating it yields the cms content while it is
+        downloaded, readPage.finish() returns the other fields (e.g. total)
     '''
     #httpclientUtil.initHttpClientDebugLevel(1)
-    readPage = { "totalItems": 0, "items" : [] }
-    conn = http.client.HTTPSConnection(cms_host)
     payload = ''
     headers = {
         'x-api-key': cms_apy_key
     }
     queryString = CMS_FAN_APP_NEWS_QUERY_STRING_FORMAT.format(skip = skip, limit = itemsPerPage)
-    if (daysAgo > 0):
-        today = datetime.utcnow()
-        delta = timedelta(days = daysAgo)
-        sinceDate = today - delta
-        logger.info('End writing daysAgo (%s), delta(%s), sinceDate (%s)', daysAgo,delta,sinceDate)
-        queryString += "&sinceDate="+sinceDate.replace(microsecond=0).isoformat()
+    if sinceDate:
+        queryString += "&sinceDate="+sinceDate
        
     logger.debug(f'asking CMS with query string %s',queryString)
-    conn.request("GET", cms_fan_app_news_path+"?"+queryString, '', headers)
-    res = conn.getresponse()
-    data = res.read()
-    data = json.loads(data.decode("utf-8"))
-    # logger.debug(data)
-    readPage["totalItems"] = data["total"]
-    readPage["items"] = data["items"]
-    return readPage
-
-def write_to_ddb(items, contentIdsWrittenSoFar = [], contentIngestDate=datetime.utcnow()):
+    with cmsConnectionPool.urlopen("GET", cms_fan_app_news_path+"?"+queryString, '', headers) as res:
+        httpclientUtil.raise_for_status(res)
+        yield JsonItemsStream(res)
+
+def readCMSNewsPage(skip = 0, itemsPerPage = 5, sinceDate = None):
     '''
-    Creates the content cache mappings
-    :param dict items: The list of news content from CMS
-    :return:
+    Reads one page of news from CMS
+    :return: list items: the cms content of the page
     '''
+    with readPagedCMSNews(skip,itemsPerPage,sinceDate) as readPage:
+        return list(readPage)
+
+def readRemainingCMSNewsPages(itemsPerPage, totalItems, sinceDate = None, workers = CMS_PAGE_WORKERS):
+    '''
+    Fetches the pages after the first one with a bounded pool of workers
+    :param int itemsPerPage: The size of the pages
+    :param int totalItems: The number of items to read
+    :param int workers: max number of pages read concurrently
+    :return: generator of tuples (skip, items), in the order of the pages
+    '''
+    pendingPages = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for skip in range(itemsPerPage, totalItems, itemsPerPage):
+            pendingPages.append((skip, executor.submit(readCMSNewsPage, skip, min(itemsPerPage, totalItems-skip), sinceDate)))
+            # keep at most one page per worker in flight or waiting to be written
+            if len(pendingPages) >= workers:
+                skip, future = pendingPages.popleft()
+                yield skip, future.result()
+        while pendingPages:
+            skip, future = pendingPages.popleft()
+            yield skip, future.result()
+
+def write_to_ddb(items, contentIdsWrittenSoFar = None, contentIngestDate=datetime.utcnow()):
+    '''
+    Creates the content cache mappings.
+    Items whose content hash matches the cached one are not written again,
+    so that unchanged news do not emit stream records
+    :param iterable items: The news content from CMS, also a stream
+    :param set contentIdsWrittenSoFar: ids already written in this run, updated in place
+    :return: dict stats: written and suppressed items
+    '''
+    if contentIdsWrittenSoFar is None:
+        contentIdsWrittenSoFar = set()
+    stats = {'written': 0, 'suppressed': 0}
+    rows = []
+
+    def write_rows(writer):
+        storedHashes = get_stored_hashes(content_table, 'contentId', [row['contentId'] for row in rows])
+        for row in rows:
+            if storedHashes.get(row['contentId']) == row[CONTENT_HASH_ATTRIBUTE]:
+                stats['suppressed'] += 1
+                continue
+            writer.put_item(Item=row)
+            stats['written'] += 1
+        rows.clear()
 
 #
 #    * *thumb*:  ${readVariableEnv('CDN_HOST')}/items[i].content.thumb.landscape.id
@@ -133,8 +238,7 @@ def write_to_ddb(items, contentIdsWrittenSoFar = [], contentIngestDate=datetime.
 #* *place*: items[i].content.place
 
     # Write the contentId and all other attributes to DynamoDB
-    table = dynamodb.Table(content_table)
-    with table.batch_writer() as writer:
+    with BulkWriter(content_table, ('contentId',)) as writer:
         for item in items:
             tags = ''
             for tag in item['tags']:
@@ -149,7 +253,7 @@ def write_to_ddb(items, contentIdsWrittenSoFar = [], contentIngestDate=datetime.
                 if contentId in contentIdsWrittenSoFar:
                     logger.warning(f"GOT %s already present in this call! Skpping writing to Ddb",contentId)
                     continue
-                writer.put_item(Item={
+                row = {
                     'contentId': contentId,
                     'contentURL': slug, #same as slug?
                     'contentType' : 'news',
@@ -164,6 +268,11 @@ def write_to_ddb(items, contentIdsWrittenSoFar = [], contentIngestDate=datetime.
                         'tags' :  tags ,
                         'place' :  item.get('content',{}).get('place','')
                     }
-                    }
-                )
-                contentIdsWrittenSoFar.append(contentId)
+                }
+                row[CONTENT_HASH_ATTRIBUTE] = content_hash(row)
+                rows.append(row)
+                contentIdsWrittenSoFar.add(contentId)
+                if len(rows) == BATCH_GET_MAX_KEYS:
+                    write_rows(writer)
+        write_rows(writer)
+    return stats
@@ -0,0 +1,127 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+"""Check the status of Personalize resources for the polling loops of the state machines"""
+import os
+import logging
+import boto3
+
+"""Initialise variables"""
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# the waits between two checks grow from the initial to the max wait
+STATUS_INITIAL_WAIT_SECONDS = int(os.environ.get('STATUS_INITIAL_WAIT_SECONDS', 15))
+STATUS_MAX_WAIT_SECONDS = int(os.environ.get('STATUS_MAX_WAIT_SECONDS', 300))
+STATUS_MAX_ATTEMPTS = int(os.environ.get('STATUS_MAX_ATTEMPTS', 100))
+
+ACTIVE = 'ACTIVE'
+PENDING = 'PENDING'
+FAILED = 'FAILED'
+TIMEOUT = 'TIMEOUT'
+
+personalize = boto3.client('personalize')
+
+
+def dataset_status(dataset_arn):
+    return personalize.describe_dataset(datasetArn=dataset_arn)['dataset']['status']
+
+
+def solution_version_status(solution_version_arn):
+    return personalize.describe_solution_version(
+        solutionVersionArn=solution_version_arn)['solutionVersion']['status']
+
+
+def dataset_group_import_statuses(dataset_group_arn):
+    '''
+    Statuses of the datasets of a dataset group and of their latest import job
+    :return: list of str statuses
+    '''
+    statuses = []
+    for page in personalize.get_paginator('list_datasets').paginate(datasetGroupArn=dataset_group_arn):
+        for dataset in page['datasets']:
+            statuses.append(dataset['status'])
+            jobs = []
+            for jobs_page in personalize.get_paginator('list_dataset_import_jobs').paginate(datasetArn=dataset['datasetArn']):
+                jobs.extend(jobs_page['datasetImportJobs'])
+            if jobs:
+                latest_job = max(jobs, key=lambda job: job['creationDateTime'])
+                logger.info(f"{dataset['datasetArn']}: import job {latest_job['jobName']} {latest_job['status']}")
+                statuses.append(latest_job['status'])
+    return statuses
+
+
+CHECKS = {
+    'datasets': lambda arn: [dataset_status(arn)],
+    'solutionVersions': lambda arn: [solution_version_status(arn)],
+    'datasetGroupImports': dataset_group_import_statuses,
+}
+
+
+def overall_status(statuses):
+    '''
+    :param list statuses: The statuses of the resources, e.g. CREATE IN_PROGRESS
+    :return: str ACTIVE when all the resources are, FAILED when one of them failed
+             or when there is no resource to check, else PENDING
+    '''
+    if not statuses:
+        # nothing found to wait for, e.g. no ARN given or a dataset group without datasets
+        return FAILED
+    if any('FAILED' in status or 'STOPPED' in status for status in statuses):
+        return FAILED
+    if all(status == ACTIVE for status in statuses):
+        return ACTIVE
+    return PENDING
+
+
+def next_wait_seconds(attempt, initial_wait, max_wait):
+    '''
+    Exponential wait before the next check
+    :param int attempt: The number of checks done so far (the current one included)
+    '''
+    return min(max_wait, initial_wait * 2 ** (attempt - 1))
+
+
+def handler(event, context):
+    '''
+    expected event as input:
+    {
+        "check": "datasets" | "solutionVersions" | "datasetGroupImports",
+        "arns": ["arn:aws:personalize:..."],
+        "attempt": 0,
+        "initialWaitSeconds": 15,    (optional)
+        "maxWaitSeconds": 300        (optional)
+    }
+    :return: dict with the overall status, the attempt and the seconds to wait before the next check
+    '''
+    check = CHECKS[event['check']]
+    attempt = event.get('attempt', 0) + 1
+    initial_wait = event.get('initialWaitSeconds', STATUS_INITIAL_WAIT_SECONDS)
+    max_wait = event.get('maxWaitSeconds', STATUS_MAX_WAIT_SECONDS)
+
+    statuses = []
+    for arn in event['arns']:
+        statuses.extend(check(arn))
+    status = overall_status(statuses)
+    if status == PENDING and attempt >= STATUS_MAX_ATTEMPTS:
+        status = TIMEOUT
+    logger.info(f"{event['check']} attempt {attempt}: {status} {statuses}")
+
+    return {
+        'check': event['check'],
+        'status': status,
+        'statuses': statuses,
+        'attempt': attempt,
+        'waitSeconds': next_wait_seconds(attempt, initial_wait, max_wait),
+    }
@@ -18,6 +18,7 @@ import os
 import boto3
 import logging
 from botocore.exceptions import ClientError
+from common_resource_util import get_parameter
 
 """Initialise variables"""
 logger = logging.getLogger()
@@ -47,8 +48,8 @@ def create_endpoint(solution_version_arn, campaign_name, name):
     except ClientError as e:
         if e.response['Error']['Code'] == 'ResourceAlreadyExistsException':
             print("Campaign already exists. (", e, ")")
-            existing_campaign_arn = ssm.get_parameter(
-                Name=f"/fan-app{name}/{stage}/Similar_items/campaignArn")["Parameter"]["Value"]
+            existing_campaign_arn = get_parameter(
+                f"/fan-app{name}/{stage}/Similar_items/campaignArn")
             campaign_arn = update_endpoint(
                 solution_version_arn, existing_campaign_arn)
             return campaign_arn
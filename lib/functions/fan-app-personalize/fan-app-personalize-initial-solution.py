@@ -17,6 +17,7 @@ import os
 import logging
 import boto3
 from botocore.exceptions import ClientError
+from common_resource_util import find_solution_arn
 
 """Initialise variables"""
 logger = logging.getLogger()
@@ -50,10 +51,7 @@ def create_solution(dataset_group_arn, dataset_type):
     except ClientError as e:
         if e.response['Error']['Code'] == 'ResourceAlreadyExistsException':
             print("Solution already exists. (", e, ")")
-            solutions = {s["name"]: s["solutionArn"]
-                         for s in personalize.list_solutions()["solutions"]}
-            print(solutions)
-            similar_items_solution_arn = solutions[similar_items_solution_name]
+            similar_items_solution_arn = find_solution_arn(similar_items_solution_name)
             return similar_items_solution_arn
         else:
             print(e)
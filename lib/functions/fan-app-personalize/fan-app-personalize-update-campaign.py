@@ -16,6 +16,7 @@
 import os
 import logging
 import boto3
+from common_resource_util import get_parameters
 
 
 """Initialise variables"""
@@ -24,14 +25,11 @@ logger.setLevel(logging.INFO)
 
 personalize = boto3.client('personalize')
 personalize_runtime = boto3.client('personalize-runtime')
-ssm = boto3.client('ssm')
 
 stage = os.environ["STAGE"]
 environment = os.environ["ENVIRONMENT_NAME"]
-VIDEO_CAMPAIGN_ARN = ssm.get_parameter(
-    Name=f"/fan-appvideo/{stage}/Similar_items/campaignArn")["Parameter"]["Value"]
-NEWS_CAMPAIGN_ARN = ssm.get_parameter(
-    Name=f"/fan-appnews/{stage}/Similar_items/campaignArn")["Parameter"]["Value"]
+VIDEO_CAMPAIGN_PARAMETER = f"/fan-appvideo/{stage}/Similar_items/campaignArn"
+NEWS_CAMPAIGN_PARAMETER = f"/fan-appnews/{stage}/Similar_items/campaignArn"
 
 
 def update_endpoint(campaign_arn, sims_solution_version_arn):
@@ -73,23 +71,27 @@ def is_new_model_better(new_solution_version, old_solution_version):
 
 
 def handler(event, context):
+    campaign_arns = get_parameters([VIDEO_CAMPAIGN_PARAMETER, NEWS_CAMPAIGN_PARAMETER])
+    current_video_campaign_arn = campaign_arns[VIDEO_CAMPAIGN_PARAMETER]
+    current_news_campaign_arn = campaign_arns[NEWS_CAMPAIGN_PARAMETER]
+
     video_current_solution_version = get_current_solution_version(
-        VIDEO_CAMPAIGN_ARN)
+        current_video_campaign_arn)
     update_video_model = is_new_model_better(
         event['Payload'][0], video_current_solution_version)
     if update_video_model == True:
         video_campaign_arn = update_endpoint(
-            VIDEO_CAMPAIGN_ARN, event['Payload'][0])
+            current_video_campaign_arn, event['Payload'][0])
     else:
         video_campaign_arn = None
 
     news_current_solution_version = get_current_solution_version(
-        NEWS_CAMPAIGN_ARN)
+        current_news_campaign_arn)
     update_news_model = is_new_model_better(
         event['Payload'][1], news_current_solution_version)
     if update_news_model == True:
         news_campaign_arn = update_endpoint(
-            NEWS_CAMPAIGN_ARN, event['Payload'][1])
+            current_news_campaign_arn, event['Payload'][1])
     else:
         news_campaign_arn = None
 
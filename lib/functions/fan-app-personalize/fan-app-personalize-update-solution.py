@@ -16,6 +16,7 @@
 import os
 import logging
 import boto3
+from common_resource_util import get_parameters
 
 
 """Initialise variables"""
@@ -24,15 +25,12 @@ logger.setLevel(logging.INFO)
 
 personalize = boto3.client('personalize')
 personalize_runtime = boto3.client('personalize-runtime')
-ssm = boto3.client('ssm')
 
 stage = os.environ["STAGE"]
 environment = os.environ["ENVIRONMENT_NAME"]
 
-VIDEO_SOLUTION_ARN = ssm.get_parameter(
-    Name=f"/fan-appvideo/{stage}/Similar_items/solutionArn")["Parameter"]["Value"]
-NEWS_SOLUTION_ARN = ssm.get_parameter(
-    Name=f"/fan-appnews/{stage}/Similar_items/solutionArn")["Parameter"]["Value"]
+VIDEO_SOLUTION_PARAMETER = f"/fan-appvideo/{stage}/Similar_items/solutionArn"
+NEWS_SOLUTION_PARAMETER = f"/fan-appnews/{stage}/Similar_items/solutionArn"
 
 
 def create_sims_solution_version(sims_solution_arn):
@@ -47,9 +45,10 @@ def create_sims_solution_version(sims_solution_arn):
 
 
 def handler(event, context):
+    solution_arns = get_parameters([VIDEO_SOLUTION_PARAMETER, NEWS_SOLUTION_PARAMETER])
     video_solution_version_arn = create_sims_solution_version(
-        VIDEO_SOLUTION_ARN)
-    news_solution_version_arn = create_sims_solution_version(NEWS_SOLUTION_ARN)
+        solution_arns[VIDEO_SOLUTION_PARAMETER])
+    news_solution_version_arn = create_sims_solution_version(solution_arns[NEWS_SOLUTION_PARAMETER])
 
     solution_version_arn = [
         video_solution_version_arn, news_solution_version_arn]
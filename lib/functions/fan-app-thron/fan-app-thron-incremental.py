@@ -13,15 +13,15 @@
 # by AWS under this SOW.
 
 """Process the initial content data"""
-import json
 import os
 import boto3
 import logging
 import urllib.request
+from itertools import chain
 from urllib.parse import urlparse
-import http.client
 from datetime import date, datetime, timedelta
-from fan_app_thron_utils import authenticate_request,get_thron_config,write_to_ddb,get_thron_public_folder
+from fan_app_thron_utils import get_thron_token,get_thron_config,write_to_ddb,get_thron_public_folder,read_thron_sync_items,THRON_PAGE_SIZE
+from common_sync_state_util import get_watermark, set_watermark, record_failures, load_dead_letters, clear_failures
 
 
 """Initialise variables"""
@@ -32,6 +32,15 @@ thron_cnf_secrets = get_thron_config()
 client_id = thron_cnf_secrets['clientId']
 thronParsedUri = urlparse(os.environ['THRON_HOST'])
 thronUpdatedContentUrlPath = '/api/xcontents/resources/sync/updatedContent/' + client_id
+THRON_INCREMENTAL_SYNC_ID = 'thron-incremental'
+# format of fromDate/toDate and of the stored watermark. The updatedContent API has always been
+# called with days: each run reads again from the day of the watermark, the unchanged items are skipped
+THRON_SYNC_DATE_FORMAT = os.environ.get('THRON_SYNC_DATE_FORMAT', '%Y-%m-%d')
+# the watermark is moved back a little to catch the updates indexed late by thron
+THRON_WATERMARK_OVERLAP_MINUTES = int(os.environ.get('THRON_WATERMARK_OVERLAP_MINUTES', 30))
+THRON_MAX_WINDOW_DAYS = 60
+# an item failing in that many runs is dead-lettered instead of holding back the watermark
+THRON_MAX_ITEM_ATTEMPTS = int(os.environ.get('THRON_MAX_ITEM_ATTEMPTS', 3))
 
 
 def handler(event, context):
@@ -42,64 +51,81 @@ def handler(event, context):
     # logger.info(f'Processing {str(len(event["Records"]))} records in this invocation')
 
     logger.info(f'Authenticating the thron app')
-    x_token_id = authenticate_request()
+    get_thron_token()
 
-    maxItems = event.get('maxItems',0)
+    pageSize = event.get('pageSize',THRON_PAGE_SIZE)
 
     today = date.today()
-    toDate = today.strftime("%Y-%m-%d")
-    daysAgo = int(os.environ.get('DAYS_AGO',event.get('daysAgo',1))) #env variable has priority - default is 1 dayAgo
-    if (daysAgo > 60):
-        logger.warning("thron API doesn't accept requesting updated items older than 2 months ago. 60 dayAgo will be used")
-        daysAgo = 60
-    fromDate = (datetime.now() - timedelta(daysAgo)).strftime('%Y-%m-%d')
-
-    logger.info(f'Asking Thron updated fromDate: %s toDate: %s',fromDate,toDate)
-    items =  create_mappings(x_token_id, fromDate, toDate, maxItems)
+    toDatetime = datetime.utcnow().replace(microsecond=0)
+    fromDatetime = get_from_datetime(event, toDatetime)
+    windows = list(split_windows(fromDatetime, toDatetime))
+    for fromDate, toDate in windows:
+        logger.info(f'Asking Thron updated fromDate: %s toDate: %s',fromDate,toDate)
+    items = chain.from_iterable(create_mappings(fromDate, toDate, pageSize) for fromDate, toDate in windows)
 
     logger.info(f'Writing the mappings to DynamoDB')
-    write_to_ddb(items,today)
+    # the dead-lettered items are not asked again
+    processedIds = load_dead_letters(THRON_INCREMENTAL_SYNC_ID)
+    failedIds = set()
+    stats = write_to_ddb(items,today,skipUnchanged=not event.get('forceRefresh',False),alreadyProcessedIds=processedIds,failedIds=failedIds)
+    retryIds, deadLetterIds = record_failures(THRON_INCREMENTAL_SYNC_ID, failedIds, THRON_MAX_ITEM_ATTEMPTS)
+    stats['deadLettered'] = len(deadLetterIds)
+    watermark = toDatetime.strftime(THRON_SYNC_DATE_FORMAT)
+    if not retryIds:
+        set_watermark(THRON_INCREMENTAL_SYNC_ID, watermark, stats)
+        clear_failures(THRON_INCREMENTAL_SYNC_ID)
+        logger.info(f'Watermark moved to %s',watermark)
+    else:
+        logger.warning(f"%s items failed, the watermark is not moved: the next run will read them again",len(retryIds))
+    return dict(stats, fromDate=windows[0][0], toDate=watermark, watermarkMoved=not retryIds)
+
+def get_from_datetime(event, toDatetime):
+    '''
+    Works out where the sync starts from: the daysAgo of the event (backfill), otherwise
+    the stored watermark minus the overlap, otherwise DAYS_AGO (default 1) before the first run
+    :param datetime toDatetime: The upper bound of the run
+    :return: datetime fromDatetime
+    '''
+    if event.get('daysAgo'):
+        return toDatetime - timedelta(days=int(event['daysAgo']))
+    watermark = get_watermark(THRON_INCREMENTAL_SYNC_ID)
+    if watermark:
+        return datetime.strptime(watermark, THRON_SYNC_DATE_FORMAT) - timedelta(minutes=THRON_WATERMARK_OVERLAP_MINUTES)
+    logger.info(f'No watermark found, falling back to DAYS_AGO')
+    return toDatetime - timedelta(days=int(os.environ.get('DAYS_AGO',1)))
 
-def create_mappings(x_token_id, fromDate, toDate, maxItems = 0):
+def split_windows(fromDatetime, toDatetime):
     '''
-    Extracts the initial upload
-    :param str x_token_id: The id of the app in thron
-    :return: dict items: The list of video content from Thron
+    Splits the range in windows accepted by the thron updatedContent API
+    :return: generator of tuples (fromDate, toDate) formatted with THRON_SYNC_DATE_FORMAT
     '''
+    while True:
+        windowEnd = min(fromDatetime + timedelta(days=THRON_MAX_WINDOW_DAYS), toDatetime)
+        yield fromDatetime.strftime(THRON_SYNC_DATE_FORMAT), windowEnd.strftime(THRON_SYNC_DATE_FORMAT)
+        if windowEnd >= toDatetime:
+            return
+        fromDatetime = windowEnd
 
-    conn = http.client.HTTPSConnection(thronParsedUri.hostname)
-    payload = json.dumps({
-        "criteria": {
-            "fromDate": fromDate,
-            "toDate": toDate,
-            "contentType": [
-                "IMAGE",
-                "VIDEO",
-                "AUDIO"
+def create_mappings(fromDate, toDate, pageSize = THRON_PAGE_SIZE):
+    '''
+    Extracts the updated content following the nextPage cursor
+    :param int pageSize: The number of items asked for each page
+    :return: generator items: The video content from Thron, page by page
+    '''
+
+    criteria = {
+        "fromDate": fromDate,
+        "toDate": toDate,
+        "contentType": [
+            "IMAGE",
+            "VIDEO",
+            "AUDIO"
+        ],
+        "linkedCategoryOp": {
+            "linkedCategoryIds": [
+                get_thron_public_folder()
             ],
-            "linkedCategoryOp": {
-                "linkedCategoryIds": [
-                    get_thron_public_folder()
-                ],
-                "cascade": True
-            }
-        },
-        "options": {
-            "returnLinkedCategories": False,
-            "returnDeliveryInfo": True,
-            "returnItags": True,
-            "returnImetadata": False,
-            "thumbDivArea": ""
-        },
-        "nextPage": "",
-        "pageSize": maxItems
-    })
-    headers = {
-        'X-TOKENID': x_token_id,
-        'Content-Type': 'application/json'
+            "cascade": True
+        }
     }
-    conn.request("POST", thronUpdatedContentUrlPath, payload, headers)
-    res = conn.getresponse()
-    data = res.read()
-    return json.loads(data.decode("utf-8"))["items"]
-
+    return read_thron_sync_items(thronUpdatedContentUrlPath, criteria, pageSize)
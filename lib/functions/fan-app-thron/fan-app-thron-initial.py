@@ -13,15 +13,14 @@
 # by AWS under this SOW.
 
 """Process the initial content data"""
-import json
 import os
 import boto3
 import logging
 import urllib.request
 from urllib.parse import urlparse
 from datetime import date
-import http.client
-from fan_app_thron_utils import authenticate_request,get_thron_config,get_content_details,write_to_ddb,get_thron_public_folder
+from fan_app_thron_utils import get_thron_token,get_thron_config,write_to_ddb,get_thron_public_folder,read_thron_sync_pages,THRON_PAGE_SIZE
+from common_sync_state_util import load_checkpoint,save_checkpoint,clear_checkpoint
 
 """Initialise variables"""
 logger = logging.getLogger()
@@ -30,66 +29,96 @@ thron_cnf_secrets = get_thron_config()
 client_id = thron_cnf_secrets['clientId']
 thronParsedUri = urlparse(os.environ['THRON_HOST'])
 thronExportContentUrlPath = '/api/xcontents/resources/sync/export/' + client_id
+THRON_INITIAL_SYNC_ID = 'thron-initial'
+THRON_CHECKPOINT_MARGIN_MS = int(os.environ.get('THRON_CHECKPOINT_MARGIN_MS', 120000))
 
 
 def handler(event, context):
     '''
-    Lambda handler function
-    :return:
+    Lambda handler function.
+    The export is checkpointed after each page: when the remaining time gets
+    short the function returns done=False and the next invocation continues
+    from the saved cursor. Pass restart=True to drop the checkpoint
+    :return: dict the stats of the load and whether it is done, with the
+             forceRefresh and pageSize options for the next invocation
     '''
 
     logger.info(f'Authenticating the thron app')
-    x_token_id = authenticate_request()
+    get_thron_token()
 
-    maxItems = event.get('maxItems',0)
+    pageSize = event.get('pageSize',THRON_PAGE_SIZE)
+    skipUnchanged = not event.get('forceRefresh',False)
 
-    logger.info(f'Initial extraction thron items')
-    items =  create_mappings(x_token_id,maxItems)
+    if event.get('restart',False):
+        logger.info(f'Dropping the checkpoint of the previous initial load')
+        clear_checkpoint(THRON_INITIAL_SYNC_ID)
+    checkpoint, processedIds = load_checkpoint(THRON_INITIAL_SYNC_ID)
+    checkpoint = checkpoint or {}
+    pageNumber = int(checkpoint.get('pageNumber',0))
+    stats = {k: int(v) for k, v in checkpoint.get('stats',{'items': 0, 'skipped': 0, 'refreshed': 0}).items()}
+    if checkpoint and not checkpoint.get('nextPage'):
+        # the last page was saved but the checkpoint was not cleared
+        logger.info(f'Initial load already completed in {pageNumber} pages')
+        clear_checkpoint(THRON_INITIAL_SYNC_ID)
+        return dict(stats, done=True, pages=pageNumber)
 
     """Initialise datetime variables"""
     today = date.today()
 
-    logger.info(f'Writing the mappings to DynamoDB')
-    write_to_ddb(items,today)
+    logger.info(f'Initial extraction thron items')
+    for page in create_mappings(pageSize, checkpoint.get('nextPage','')):
+        pageIds = set()
+        failedIds = set()
+        logger.info(f'Writing the mappings of page {pageNumber+1} to DynamoDB')
+        pageStats = write_to_ddb(record_ids(page, pageIds),today,skipUnchanged=skipUnchanged,alreadyProcessedIds=processedIds,failedIds=failedIds)
+        for k, v in pageStats.items():
+            stats[k] = stats.get(k,0) + v
+        pageNumber += 1
+        nextPage = page.finish().get('nextPage')
+        if failedIds:
+            logger.warning(f'{len(failedIds)} items of page {pageNumber} not written: {sorted(failedIds)}')
+        # only the ids written are checkpointed, the failed ones are retried if they come again
+        save_checkpoint(THRON_INITIAL_SYNC_ID, pageNumber, nextPage, pageIds - failedIds, stats)
+        if nextPage and context.get_remaining_time_in_millis() < THRON_CHECKPOINT_MARGIN_MS:
+            logger.info(f'Stopping after page {pageNumber}, the load will continue in the next invocation')
+            # the output is the input of the next invocation: restart is not passed on
+            return dict(stats, done=False, pages=pageNumber, forceRefresh=not skipUnchanged, pageSize=pageSize)
+
+    clear_checkpoint(THRON_INITIAL_SYNC_ID)
+    logger.info(f'Initial load completed in {pageNumber} pages: {stats}')
+    return dict(stats, done=True, pages=pageNumber)
+
+
+def record_ids(items, ids):
+    '''
+    Passes the thron items through, collecting their ids
+    '''
+    for item in items:
+        id = item.get("content", {}).get("id")
+        if id:
+            ids.add(id)
+        yield item
 
 
-def create_mappings(x_token_id, maxItems = 0):
+def create_mappings(pageSize = THRON_PAGE_SIZE, nextPage = ''):
     '''
-    Extracts the initial upload
-    :param str x_token_id: The id of the app in thron
-    :return: dict items: The list of video content from Thron
+    Extracts the initial upload following the nextPage cursor
+    :param int pageSize: The number of items asked for each page
+    :param str nextPage: The cursor to start from, empty for the first page
+    :return: generator pages: The video content from Thron, each page streaming its items
     '''
 
-    conn = http.client.HTTPSConnection(thronParsedUri.hostname)
-    payload = json.dumps({
-        "criteria": {
-            "contentType": [
-                "IMAGE",
-                "VIDEO",
-                "AUDIO"
+    criteria = {
+        "contentType": [
+            "IMAGE",
+            "VIDEO",
+            "AUDIO"
+        ],
+        "linkedCategoryOp": {
+            "linkedCategoryIds": [
+                get_thron_public_folder()
             ],
-            "linkedCategoryOp": {
-                "linkedCategoryIds": [
-                    get_thron_public_folder()
-                ],
-                "cascade": True
-            }
-        },
-        "options": {
-            "returnLinkedCategories": False,
-            "returnDeliveryInfo": True,
-            "returnItags": True,
-            "returnImetadata": False,
-            "thumbDivArea": ""
-        },
-        "nextPage": "",
-        "pageSize": maxItems
-    })
-    headers = {
-        'X-TOKENID': x_token_id,
-        'Content-Type': 'application/json'
+            "cascade": True
+        }
     }
-    conn.request("POST", thronExportContentUrlPath, payload, headers)
-    res = conn.getresponse()
-    data = res.read()
-    return json.loads(data.decode("utf-8"))["items"]
+    return read_thron_sync_pages(thronExportContentUrlPath, criteria, pageSize, nextPage)
@@ -17,11 +17,18 @@ import json
 import os
 import boto3
 import logging
+import threading
+import time
 import urllib.request
-import http.client
+from urllib.error import HTTPError
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 from urllib.parse import urlparse
 import common_http_client_util as httpclientUtil
+from common_json_stream_util import JsonItemsStream
+from common_rate_limit_util import AdaptiveRateLimiter
+from common_ddb_util import batch_get_items, content_hash, BulkWriter, BatchWriteError, CONTENT_HASH_ATTRIBUTE
 
 """Initialise variables"""
 logger = logging.getLogger()
@@ -30,8 +37,26 @@ dynamodb = boto3.resource('dynamodb')
 content_table = os.environ['CONTENT_TABLE']
 secrets_manager_client = boto3.client('secretsmanager')
 thron_cnf_secrets = {}
+thron_cnf_secrets_expire_at = 0
+thron_token = {'appUserTokenId': None, 'expireAt': 0}
+thron_token_lock = threading.Lock()
 thronAdminParsedUri = urlparse(os.environ['THRON_ADMIN_HOST'])
 thronParsedUri = urlparse(os.environ['THRON_HOST'])
+THRON_DETAIL_WORKERS = int(os.environ.get('THRON_DETAIL_WORKERS', 8))
+THRON_PAGE_SIZE = int(os.environ.get('THRON_PAGE_SIZE', 100))
+THRON_TOKEN_TTL_SECONDS = int(os.environ.get('THRON_TOKEN_TTL_SECONDS', 3600))
+THRON_TOKEN_REFRESH_MARGIN_SECONDS = int(os.environ.get('THRON_TOKEN_REFRESH_MARGIN_SECONDS', 300))
+THRON_CONFIG_TTL_SECONDS = int(os.environ.get('THRON_CONFIG_TTL_SECONDS', 3600))
+THRON_AUTH_ERRORS = (401, 403)
+# 'export' builds the details from the sync payload, 'detail' asks getContentDetail for each item
+THRON_DETAILS_MODE = os.environ.get('THRON_DETAILS_MODE', 'detail')
+# Thron answers 418 when called too fast: the calls of all the workers share an adaptive rate
+THRON_MAX_RPS = float(os.environ.get('THRON_MAX_RPS', 20))
+THRON_MIN_RPS = float(os.environ.get('THRON_MIN_RPS', 1))
+THRON_MAX_RETRIES = int(os.environ.get('THRON_MAX_RETRIES', 5))
+thronRateLimiter = AdaptiveRateLimiter(THRON_MAX_RPS, minRate=THRON_MIN_RPS)
+thronConnectionPool = httpclientUtil.get_connection_pool(thronParsedUri.hostname, maxsize=THRON_DETAIL_WORKERS+1,
+                                                         rateLimiter=thronRateLimiter, maxRetries=THRON_MAX_RETRIES)
 
 contentTypeToThronChannelToSearch = {
     'video' : 'WEBHD',
@@ -39,26 +64,49 @@ contentTypeToThronChannelToSearch = {
     'image' : 'WEB'
 } 
 
+thronSyncOptions = {
+    "returnLinkedCategories": False,
+    "returnDeliveryInfo": True,
+    "returnItags": True,
+    "returnImetadata": THRON_DETAILS_MODE == 'export',
+    "thumbDivArea": ""
+}
+
 
 def get_thron_public_folder():
     return os.environ['THRON_PUBLIC_FOLDER']
 
-def get_thron_config():
-    global thron_cnf_secrets
-    if not thron_cnf_secrets:
+def get_thron_config(forceRefresh=False):
+    '''
+    Returns the thron secret, cached for THRON_CONFIG_TTL_SECONDS across warm invocations
+    :param bool forceRefresh: reads the secret again (e.g. after a rotation)
+    :return: dict thron_cnf_secrets
+    '''
+    global thron_cnf_secrets, thron_cnf_secrets_expire_at
+    if forceRefresh or not thron_cnf_secrets or time.time() >= thron_cnf_secrets_expire_at:
         thron_cnf_secrets = json.loads( 
             secrets_manager_client.get_secret_value(SecretId=os.environ.get('THRON_CONFIG_SECRET_ARN'))['SecretString'] 
         )
+        thron_cnf_secrets_expire_at = time.time() + THRON_CONFIG_TTL_SECONDS
     return thron_cnf_secrets
 
 def authenticate_request():
     '''
-    Authenticates the app to get exported/updated content
+    Authenticates the app to get exported/updated content.
+    When the login is refused the secret is read again once, in case it has been rotated
     :param str app_id: The id of the app in thron
     :param str app_key: The key use for thron authentications
     :return: str appUserTokenId: Thr authentication token from Thron server
     '''
-    thron_cnf_secrets = get_thron_config()
+    try:
+        return login_app(get_thron_config())
+    except HTTPError as e:
+        if e.code not in THRON_AUTH_ERRORS:
+            raise
+        logger.warning(f'thron login refused ({e.code}), refreshing the thron config')
+        return login_app(get_thron_config(forceRefresh=True))
+
+def login_app(thron_cnf_secrets):
     loginUrl = thronAdminParsedUri.scheme +'://'+thronAdminParsedUri.hostname + '/api/xadmin/resources/apps/loginApp/' + thron_cnf_secrets['clientId']
 
     data = {
@@ -78,6 +126,69 @@ def authenticate_request():
     response = urllib.request.urlopen(req).read()
     return json.loads(response)['appUserTokenId']
 
+def get_thron_token(forceRefresh=False):
+    '''
+    Returns the thron token cached across warm invocations.
+    The token is renewed THRON_TOKEN_REFRESH_MARGIN_SECONDS before its expiry
+    :param bool forceRefresh: authenticates again (e.g. after a 401/403)
+    :return: str appUserTokenId
+    '''
+    with thron_token_lock:
+        if forceRefresh or time.time() >= thron_token['expireAt'] - THRON_TOKEN_REFRESH_MARGIN_SECONDS:
+            loggedAt = time.time()
+            thron_token['appUserTokenId'] = authenticate_request()
+            thron_token['expireAt'] = loggedAt + THRON_TOKEN_TTL_SECONDS
+        return thron_token['appUserTokenId']
+
+def read_thron_sync_pages(urlPath, criteria, pageSize=THRON_PAGE_SIZE, nextPage=''):
+    '''
+    Walks the nextPage cursor of a Thron sync API (export or updatedContent).
+    A page refused with 401/403 is asked again once with a new token
+    :param str urlPath: The path of the sync API
+    :param dict criteria: The search criteria
+    :param int pageSize: The number of items asked for each page
+    :param str nextPage: The cursor to start from, empty for the first page
+    :return: generator of JsonItemsStream pages, each streaming its items from the socket
+    '''
+    pageCount = 0
+    reauthenticated = False
+    while True:
+        payload = json.dumps({
+            "criteria": criteria,
+            "options": thronSyncOptions,
+            "nextPage": nextPage,
+            "pageSize": pageSize
+        })
+        headers = {
+            'X-TOKENID': get_thron_token(forceRefresh=reauthenticated),
+            'Content-Type': 'application/json'
+        }
+        with thronConnectionPool.urlopen("POST", urlPath, payload, headers) as res:
+            if res.status in THRON_AUTH_ERRORS and not reauthenticated:
+                logger.warning(f'thron refused the token ({res.status}), authenticating again')
+                res.read()
+                reauthenticated = True
+                continue
+            httpclientUtil.raise_for_status(res)
+            page = JsonItemsStream(res)
+            yield page
+            nextPage = page.finish().get("nextPage")
+        reauthenticated = False
+        pageCount += 1
+        logger.info(f'read page {pageCount} with {page.itemCount} items from thron')
+        if not nextPage or not page.itemCount:
+            return
+
+
+def read_thron_sync_items(urlPath, criteria, pageSize=THRON_PAGE_SIZE):
+    '''
+    Yields the items of a Thron sync API page by page, as they arrive
+    :return: generator of dict items
+    '''
+    for page in read_thron_sync_pages(urlPath, criteria, pageSize):
+        yield from page
+
+
 def get_content_details(contentId):
     '''
     returns content details content object from thron
@@ -89,13 +200,25 @@ def get_content_details(contentId):
     pKey=thron_cnf_secrets['pKey']
     thronContentDetailUrlPath = f'/api/xcontents/resources/delivery/getContentDetail?clientId={clientId}&xcontentId={contentId}&templateId=CE1&pkey={pKey}'
     #httpclientUtil.initHttpClientDebugLevel(1)
-    conn = http.client.HTTPSConnection(thronParsedUri.hostname)
-    conn.request('GET',thronContentDetailUrlPath)
-    res = conn.getresponse()
-    data = res.read()
-    if res.status == 418:
+    status, data = thronConnectionPool.request('GET',thronContentDetailUrlPath)
+    if status == 418:
+        # still throttled once the retries are exhausted
         logger.warning(f"Problems getting content details {data}")
         return None
+    if status != 200:
+        raise httpclientUtil.HttpStatusError(status, 'getContentDetail', data)
+    content_detail = parse_content_details(json.loads(data.decode("utf-8"))["content"])
+    logger.debug((f'details: {content_detail}',content_detail))
+    return content_detail
+
+
+def parse_content_details(content_details_from_thron):
+    '''
+    Builds the content details from a Thron content object
+    :param dict content_details_from_thron: The content with its deliveryInfo and locales
+    :return: dict content_detail: The fields stored in the content cache
+    :raise KeyError: when a field is missing
+    '''
     content_detail = {
         'contentType': '',
         'contentUrl' : None,
@@ -106,7 +229,6 @@ def get_content_details(contentId):
         'creationDate': None,
         'lastUpdate' : None
     }
-    content_details_from_thron = json.loads(data.decode("utf-8"))["content"]
     content_detail['contentType'] = content_details_from_thron['contentType'].lower()
     thronChannelTypeToMatch = contentTypeToThronChannelToSearch[content_detail['contentType']]
     for deliveryInfo in content_details_from_thron["deliveryInfo"]:
@@ -123,56 +245,199 @@ def get_content_details(contentId):
        content_detail['description'] = localeEN['description']
     content_detail['creationDate'] = content_details_from_thron['creationDate']
     content_detail['lastUpdate'] = content_details_from_thron['lastUpdate']
+    return content_detail
 
-    logger.debug((f'details: {content_detail}',content_detail))
+
+def get_export_content_details(thronItem):
+    '''
+    Builds the content details from an item of the export/updatedContent payload
+    :param dict thronItem: The item from Thron
+    :return: dict content_detail: None when a field can only come from getContentDetail
+    '''
+    try:
+        content_detail = parse_content_details(dict(thronItem["content"], deliveryInfo=thronItem.get("deliveryInfo") or []))
+    except KeyError:
+        return None
+    if content_detail['contentUrl'] is None or not content_detail['thumbUrl'] \
+            or not content_detail['creationDate'] or not content_detail['lastUpdate']:
+        return None
+    # the export carries no duration for some videos
+    if content_detail['contentType'] == 'video' and not content_detail['durationMs']:
+        return None
     return content_detail
 
 
+def fetch_content_details(contentId):
+    '''
+    Fetches the details of one content isolating errors from the other items
+    :param contentId: The id of the content
+    :return: tuple (contentId, contentDetails): details are None when missing or failed
+    '''
+    try:
+        return contentId, get_content_details(contentId)
+    except Exception as e :
+        logger.error((f'errors getting detail for {contentId}'))
+        logger.exception(e)
+        return contentId, None
+
+
+def get_thron_tags(thronItem):
+    '''
+    Joins the english itags labels of a Thron item
+    :param dict thronItem: The item from Thron
+    :return: str tags: pipe-separated tags
+    '''
+    tags = ''
+    if thronItem.get('itagDefinitions'):
+        for itagDefinition in thronItem["itagDefinitions"]:
+            for tag in [x['label'] for x in itagDefinition["names"] if 'EN' in x['lang']]:
+                tags=tags+"|"+tag
+            if tags.startswith("|"):
+                tags = tags.removeprefix("|")
+    return tags
+
+
+def get_stored_contents(ids):
+    '''
+    Reads with BatchGetItem the lastUpdate and the hash of the contents already in the cache
+    :param list ids: The content ids (max 100)
+    :return: dict contentId -> (contentMetadata.lastUpdate, contentHash)
+    '''
+    items = batch_get_items(content_table, [{'contentId': id} for id in ids],
+                            projection=f'contentId, contentMetadata.lastUpdate, {CONTENT_HASH_ATTRIBUTE}')
+    return {item['contentId']: (item.get('contentMetadata', {}).get('lastUpdate'), item.get(CONTENT_HASH_ATTRIBUTE))
+            for item in items}
+
+
+def write_to_ddb(itemsFromThron,contentIngestDate=date.today(),detailWorkers=THRON_DETAIL_WORKERS,skipUnchanged=True,alreadyProcessedIds=None,detailsMode=THRON_DETAILS_MODE,failedIds=None):
+    '''
+    Creates the content cache mappings.
+    Content details are fetched by a bounded pool of workers while a
+    BulkWriter stores the results with parallel BatchWriteItem requests.
+    Items whose Thron lastUpdate is not newer than the cached one are skipped
+    without asking their details, and items whose content hash matches the
+    cached one are not written again (no stream record)
+    :param iterable items: The video content from Thron, also a generator
+    :param int detailWorkers: max number of concurrent getContentDetail calls
+    :param bool skipUnchanged: False to refresh all the items
+    :param set alreadyProcessedIds: ids written by previous calls of the same run, updated in place
+    :param str detailsMode: 'export' to call getContentDetail only when the payload misses a field
+    :param set failedIds: collects the ids that could not be written, updated in place. They are
+                          removed from alreadyProcessedIds so that a later call retries them
+    :return: dict stats: items read, skipped, refreshed, suppressed, failed and getContentDetail calls
+    '''
+    logger.info(f"writing items from thron using {detailWorkers} detail workers in {detailsMode} mode")
+    stats = {'items': 0, 'skipped': 0, 'refreshed': 0, 'suppressed': 0, 'failed': 0, 'detailCalls': 0}
+    if alreadyProcessedIds is None:
+        alreadyProcessedIds = set()
+    if failedIds is None:
+        failedIds = set()
+    candidates = []
+    pendingDetails = deque()
+
+    def write_content(writer, id, contentDetails, tags, storedHash):
+        if not contentDetails:
+            # the details could not be read (errors or throttling)
+            count_failed(id)
+            return
+        try:
+            item = {
+                'contentId': id,
+                'contentURL': contentDetails['contentUrl'],
+                'contentType': contentDetails['contentType'],
+                'contentIngestDate': contentIngestDate.strftime("%Y-%m-%d"),
+                'contentMetadata' : {
+                    'name_title' : contentDetails['name_title'] ,
+                    'description' : contentDetails['description'],
+                    'thumb':  contentDetails['thumbUrl'] ,
+                    'durationMs' : contentDetails['durationMs'],
+                    'tags' : tags,
+                    'creationDate': contentDetails['creationDate'],
+                    'lastUpdate' : contentDetails['lastUpdate']
+                }
+            }
+            item[CONTENT_HASH_ATTRIBUTE] = content_hash(item)
+            if item[CONTENT_HASH_ATTRIBUTE] == storedHash:
+                stats['suppressed'] += 1
+                return
+            try:
+                writer.put_item(Item=item)
+            except BatchWriteError as e:
+                # a batch sent before failed, this item has been buffered anyway
+                count_write_errors(e)
+            stats['refreshed'] += 1
+        except Exception as e :
+            count_failed(id)
+            logger.error((f'errors writing detail for {id}'))
+            logger.exception(e)
+
+    def count_write_errors(error):
+        stats['refreshed'] -= len(error.keys)
+        for key in error.keys:
+            count_failed(key[0])
+        logger.error(f'errors writing {[key[0] for key in error.keys]}: {error.errors}')
+
+    def count_failed(id):
+        stats['failed'] += 1
+        failedIds.add(id)
+        alreadyProcessedIds.discard(id)
+
+    def write_pending(writer):
+        future, tags, storedHash = pendingDetails.popleft()
+        write_content(writer, *future.result(), tags, storedHash)
+
+    def process_candidates(executor, writer):
+        storedContents = get_stored_contents([id for id, _, _ in candidates])
+        for id, tags, thronItem in candidates:
+            lastUpdate = thronItem["content"].get("lastUpdate")
+            storedLastUpdate, storedHash = storedContents.get(id, (None, None))
+            if skipUnchanged and lastUpdate and storedLastUpdate and lastUpdate <= storedLastUpdate:
+                stats['skipped'] += 1
+                continue
+            if detailsMode == 'export':
+                try:
+                    contentDetails = get_export_content_details(thronItem)
+                except Exception as e :
+                    logger.warning(f'cannot build the details of {id} from the export: {e}')
+                    contentDetails = None
+                if contentDetails:
+                    write_content(writer, id, contentDetails, tags, storedHash)
+                    continue
+            stats['detailCalls'] += 1
+            pendingDetails.append((executor.submit(fetch_content_details, id), tags, storedHash))
+            # keep at most a couple of requests per worker in flight
+            if len(pendingDetails) >= 2 * detailWorkers:
+                write_pending(writer)
+        candidates.clear()
 
-def write_to_ddb(itemsFromThron,contentIngestDate=date.today()):
-    '''
-    Creates the content cache mappings
-    :param dict items: The list of video content from Thron
-    :return:
-    '''
-    elementCount = len(itemsFromThron)
-    logger.info(f"itemsFromThron :{elementCount} ")
-    alreadyProcessedIds = []
-    table = dynamodb.Table(content_table)
-    with table.batch_writer() as writer:
-    # Capture the Thron URLs for the different videos available and for each get details
-        for thronItem in itemsFromThron:
-            thronChannelTypeToMatch = contentTypeToThronChannelToSearch[thronItem["content"]['contentType'].lower()]
-            id = thronItem["content"]["id"]
-            for contents in thronItem["deliveryInfo"]:
-                if contents["channelType"] == thronChannelTypeToMatch:
-                    if id not in alreadyProcessedIds:
-                        try:
-                            tags = ''
-                            if thronItem.get('itagDefinitions'):
-                                for itagDefinition in thronItem["itagDefinitions"]:
-                                    for tag in [x['label'] for x in itagDefinition["names"] if 'EN' in x['lang']]:
-                                        tags=tags+"|"+tag
-                                    if tags.startswith("|"):
-                                        tags = tags.removeprefix("|")
-                            contentDetails = get_content_details(id)
-                            if contentDetails:
-                                writer.put_item(Item={
-                                    'contentId': id,
-                                    'contentURL': contentDetails['contentUrl'],
-                                    'contentType': contentDetails['contentType'],
-                                    'contentIngestDate': contentIngestDate.strftime("%Y-%m-%d"),
-                                    'contentMetadata' : {
-                                        'name_title' : contentDetails['name_title'] ,
-                                        'description' : contentDetails['description'],
-                                        'thumb':  contentDetails['thumbUrl'] ,
-                                        'durationMs' : contentDetails['durationMs'],
-                                        'tags' : tags,
-                                        'creationDate': contentDetails['creationDate'],
-                                        'lastUpdate' : contentDetails['lastUpdate']
-                                    }
-                                })
-                            alreadyProcessedIds.append(id)
-                        except Exception as e :
-                            logger.error((f'errors getting or writing detail for {id}'))
-                            logger.exception(e)
+    try:
+        with ThreadPoolExecutor(max_workers=detailWorkers) as executor, BulkWriter(content_table, ('contentId',)) as writer:
+        # Capture the Thron URLs for the different videos available and for each get details
+            for thronItem in itemsFromThron:
+                stats['items'] += 1
+                try:
+                    thronChannelTypeToMatch = contentTypeToThronChannelToSearch[thronItem["content"]['contentType'].lower()]
+                    id = thronItem["content"]["id"]
+                    if id in alreadyProcessedIds:
+                        continue
+                    if not any(contents["channelType"] == thronChannelTypeToMatch for contents in thronItem["deliveryInfo"]):
+                        continue
+                    tags = get_thron_tags(thronItem)
+                except Exception as e :
+                    logger.error((f'errors reading thron item {thronItem.get("content", {}).get("id")}'))
+                    logger.exception(e)
+                    continue
+                alreadyProcessedIds.add(id)
+                candidates.append((id, tags, thronItem))
+                # BatchGetItem reads up to 100 keys
+                if len(candidates) == 100:
+                    process_candidates(executor, writer)
+            process_candidates(executor, writer)
+            while pendingDetails:
+                write_pending(writer)
+    except BatchWriteError as e:
+        # the last batches, written when leaving the BulkWriter
+        count_write_errors(e)
+    logger.info(f"itemsFromThron :{stats['items']} skipped :{stats['skipped']} refreshed :{stats['refreshed']} suppressed :{stats['suppressed']} failed :{stats['failed']} detailCalls :{stats['detailCalls']}")
+    logger.info(f"thron rate :{thronRateLimiter.rate:.2f} calls/s throttles :{thronRateLimiter.throttles}")
+    return stats
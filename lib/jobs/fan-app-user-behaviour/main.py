@@ -127,8 +127,9 @@ def push_to_personalize(dataset_type, dataset_group):
     dataset_arn = createDatasetResponse['datasetArn']
     logger.info(dataset_type + ' dataset arn: ' + dataset_arn)
 
-    # Allow creation of the dataset
-    time.sleep(120)
+    # Wait for the creation of the dataset
+    status = wait_for_dataset(dataset_arn)
+    logger.info(dataset_type + ' dataset status: ' + status)
 
     # Create the interactions dataset import job
     createDatasetImportResponse = personalize.create_dataset_import_job(
@@ -144,6 +145,25 @@ def push_to_personalize(dataset_type, dataset_group):
         datasetImportJobArn=dsij_arn)['datasetImportJob']
 
 
+def wait_for_dataset(dataset_arn, initial_wait=2, max_wait=30, timeout=900):
+    '''
+    Polls the dataset with exponential waits until it is created
+    :return str the final status of the dataset
+    '''
+    deadline = time.monotonic() + timeout
+    wait = initial_wait
+    while True:
+        status = personalize.describe_dataset(datasetArn=dataset_arn)['dataset']['status']
+        if status == 'ACTIVE':
+            return status
+        if status == 'CREATE FAILED':
+            raise RuntimeError(f'dataset {dataset_arn} creation failed')
+        if time.monotonic() + wait > deadline:
+            raise RuntimeError(f'dataset {dataset_arn} still {status} after {timeout}s')
+        time.sleep(wait)
+        wait = min(max_wait, wait * 2)
+
+
 def get_filenames():
     '''
     Get the interaction dataset file name
@@ -0,0 +1,72 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+"""Decoding of the DynamoDB json (low level client, streams, table exports) to plain json"""
+
+
+def _number(value):
+    '''
+    :param str value: The N attribute, e.g. "42" or "1.5"
+    :return: int, float when the number is not integral
+    '''
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def decode_value(value):
+    '''
+    Converts a typed attribute value, e.g. {"S": "abc"} or {"M": {...}}
+    :param dict value: The attribute value in DynamoDB json
+    :return: the python value: str, int/float, bool, None, dict or list (for L and the sets)
+    '''
+    for attributeType, data in value.items():
+        if attributeType == 'S':
+            return data
+        if attributeType == 'N':
+            return _number(data)
+        if attributeType == 'M':
+            return {key: decode_value(item) for key, item in data.items()}
+        if attributeType == 'L':
+            return [decode_value(item) for item in data]
+        if attributeType == 'BOOL':
+            return data
+        if attributeType == 'NULL':
+            return None
+        if attributeType == 'SS' or attributeType == 'BS':
+            return list(data)
+        if attributeType == 'NS':
+            return [_number(item) for item in data]
+        if attributeType == 'B':
+            return data
+        raise ValueError(f'unknown DynamoDB attribute type {attributeType}')
+    raise ValueError('empty DynamoDB attribute value')
+
+
+def decode_item(item):
+    '''
+    Converts an item, e.g. a scan item or the NewImage of a stream record
+    :param dict item: attribute name -> typed attribute value
+    :return: dict the item in plain json
+    '''
+    return {key: decode_value(value) for key, value in item.items()}
+
+
+def decode_items(items):
+    '''
+    :param list items: The items in DynamoDB json, e.g. the Items of a scan page
+    :return: list the items in plain json
+    '''
+    return [decode_item(item) for item in items]
@@ -0,0 +1,268 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+"""DynamoDB helpers shared by the content ingestors"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.exceptions import ClientError
+
+from common_rate_limit_util import backoff_delay
+
+logger = logging.getLogger()
+dynamodb = boto3.resource('dynamodb')
+
+CONTENT_HASH_ATTRIBUTE = 'contentHash'
+# attributes changing on every run while the content stays the same
+VOLATILE_ATTRIBUTES = ('contentIngestDate', CONTENT_HASH_ATTRIBUTE)
+# max keys of a BatchGetItem request
+BATCH_GET_MAX_KEYS = 100
+# max items of a BatchWriteItem request
+BATCH_WRITE_MAX_ITEMS = 25
+DDB_WRITE_WORKERS = int(os.environ.get('DDB_WRITE_WORKERS', 4))
+THROTTLING_ERRORS = ('ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded')
+
+
+def content_hash(item, excludedAttributes=VOLATILE_ATTRIBUTES):
+    '''
+    Stable fingerprint of an item: the same content gives the same hash whatever
+    the order of its keys and the day it has been ingested
+    :param dict item: The item as written to DynamoDB
+    :return: str hex sha256
+    '''
+    payload = {key: value for key, value in item.items() if key not in excludedAttributes}
+    serialized = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def batch_get_items(tableName, keys, projection=None, maxRetries=8):
+    '''
+    Reads items with BatchGetItem retrying the UnprocessedKeys with backoff
+    :param str tableName: The table name
+    :param list keys: The keys of the items (max BATCH_GET_MAX_KEYS, without duplicates)
+    :param str projection: The ProjectionExpression, None for the whole items
+    :return: list items: the items found
+    '''
+    items = []
+    if not keys:
+        return items
+    request = {'Keys': keys}
+    if projection:
+        request['ProjectionExpression'] = projection
+    requestItems = {tableName: request}
+    retry = 0
+    while requestItems:
+        response = dynamodb.batch_get_item(RequestItems=requestItems)
+        items.extend(response['Responses'].get(tableName, []))
+        requestItems = response.get('UnprocessedKeys')
+        if requestItems:
+            retry += 1
+            if retry > maxRetries:
+                raise RuntimeError(f'{tableName}: keys still unprocessed after {maxRetries} retries')
+            time.sleep(min(0.05 * 2 ** retry, 1))
+    return items
+
+
+def get_stored_hashes(tableName, keyName, ids):
+    '''
+    Reads the content hash of the items already stored
+    :param list ids: The values of the partition key (max BATCH_GET_MAX_KEYS)
+    :return: dict id -> contentHash
+    '''
+    items = batch_get_items(tableName, [{keyName: id} for id in ids],
+                            projection=f'{keyName}, {CONTENT_HASH_ATTRIBUTE}')
+    return {item[keyName]: item.get(CONTENT_HASH_ATTRIBUTE) for item in items}
+
+
+class BatchWriteError(Exception):
+    '''
+    Raised by BulkWriter when BatchWriteItem requests failed, carrying the keys
+    of the items not written so that the caller can report them
+    '''
+
+    def __init__(self, tableName, keys, errors):
+        '''
+        :param str tableName: The table name
+        :param list keys: The primary keys (tuples of the keyNames values) of the items not written
+        :param list errors: The exceptions of the failed batches
+        '''
+        super().__init__(f'{tableName}: {len(keys)} items not written: {errors[0]}')
+        self.tableName = tableName
+        self.keys = keys
+        self.errors = errors
+
+
+class BulkWriter:
+    '''
+    Drop-in replacement of Table.batch_writer() spreading the BatchWriteItem
+    requests over a pool of threads.
+    Items are buffered in flushes of `workers` batches: within a flush the
+    items with the same key are de-duplicated (the last one wins), and a
+    batch is sent only once the in-flight batches writing the same keys are
+    done, so the order of the writes of a key is kept. UnprocessedItems and
+    throttling errors are retried with a jittered exponential backoff.
+    A failed batch does not stop the writer: the buffered items are still
+    sent and the failure is raised once, as a BatchWriteError, by the next
+    put_item/delete_item/flush or on exit.
+    '''
+
+    def __init__(self, tableName, keyNames, workers=DDB_WRITE_WORKERS, maxRetries=10):
+        '''
+        :param str tableName: The table name
+        :param tuple keyNames: The attributes of the primary key
+        :param int workers: max number of concurrent BatchWriteItem requests
+        :param int maxRetries: max retries of a batch before failing
+        '''
+        self.tableName = tableName
+        self.keyNames = tuple(keyNames)
+        self.workers = workers
+        self.maxRetries = maxRetries
+        self.stats = {'items': 0, 'duplicates': 0, 'batches': 0, 'throttles': 0, 'failed': 0}
+        # the client of the resource serializes the python types like batch_writer() does
+        self._client = dynamodb.meta.client
+        self._statsLock = threading.Lock()
+        self._buffer = {}
+        self._inFlight = []
+        self._executor = None
+        self._startedAt = None
+
+    def __enter__(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._startedAt = time.monotonic()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        failed = []
+        try:
+            if excType is None:
+                failed = self._send_buffer()
+            failed.extend(self._wait())
+        finally:
+            self._executor.shutdown(wait=True)
+        seconds = time.monotonic() - self._startedAt
+        logger.info(f"{self.tableName}: wrote {self.stats['items']} items in {seconds:.2f}s "
+                    f"({self.items_per_second(seconds):.0f} items/s) throttles :{self.stats['throttles']} "
+                    f"duplicates :{self.stats['duplicates']} failed :{self.stats['failed']}")
+        if excType is None:
+            self._raise(failed)
+        elif failed:
+            # do not hide the error raised in the with block
+            logger.error(self._error(failed))
+
+    def items_per_second(self, seconds=None):
+        seconds = seconds if seconds is not None else time.monotonic() - self._startedAt
+        return self.stats['items'] / seconds if seconds > 0 else 0
+
+    def put_item(self, Item):
+        self._add(Item, {'PutRequest': {'Item': Item}})
+
+    def delete_item(self, Key):
+        self._add(Key, {'DeleteRequest': {'Key': Key}})
+
+    def _add(self, item, request):
+        key = tuple(item[name] for name in self.keyNames)
+        if key in self._buffer:
+            self.stats['duplicates'] += 1
+            del self._buffer[key]
+        self._buffer[key] = request
+        if len(self._buffer) >= self.workers * BATCH_WRITE_MAX_ITEMS:
+            self.flush()
+
+    def flush(self):
+        '''
+        Sends the buffered items, keeping at most two flushes in flight
+        :raise BatchWriteError: when batches sent before have failed, once the buffered items are sent
+        '''
+        self._raise(self._send_buffer())
+
+    def _send_buffer(self):
+        '''
+        :return: list (future, batchKeys): the failed batches found while waiting
+        '''
+        keys = set(self._buffer)
+        # a key written again waits for its previous write
+        failed = self._wait(lambda batchKeys: not keys.isdisjoint(batchKeys))
+        while len(self._inFlight) > self.workers:
+            failed.extend(self._done([self._inFlight.pop(0)]))
+        items = list(self._buffer.items())
+        self._buffer.clear()
+        for i in range(0, len(items), BATCH_WRITE_MAX_ITEMS):
+            batch = items[i:i + BATCH_WRITE_MAX_ITEMS]
+            future = self._executor.submit(self._write_batch, [request for _, request in batch])
+            self._inFlight.append((future, {key for key, _ in batch}))
+        return failed
+
+    def _wait(self, conflicts=None):
+        '''
+        Waits for the in-flight batches (only the conflicting ones when given) and
+        drops all the batches done from the in-flight ones, the failed ones included
+        :return: list (future, batchKeys): the failed batches
+        '''
+        done = []
+        pending = []
+        for future, batchKeys in self._inFlight:
+            if conflicts is None or future.done() or conflicts(batchKeys):
+                done.append((future, batchKeys))
+            else:
+                pending.append((future, batchKeys))
+        self._inFlight = pending
+        return self._done(done)
+
+    def _done(self, batches):
+        '''
+        :param list batches: (future, batchKeys) no longer in flight
+        :return: list (future, batchKeys): the failed ones
+        '''
+        failed = [(future, batchKeys) for future, batchKeys in batches if future.exception() is not None]
+        for _, batchKeys in failed:
+            self._count('failed', len(batchKeys))
+        return failed
+
+    def _error(self, failed):
+        return BatchWriteError(self.tableName, [key for _, batchKeys in failed for key in sorted(batchKeys)],
+                               [future.exception() for future, _ in failed])
+
+    def _raise(self, failed):
+        if failed:
+            error = self._error(failed)
+            raise error from error.errors[0]
+
+    def _write_batch(self, requests):
+        attempt = 0
+        written = len(requests)
+        while requests:
+            try:
+                response = self._client.batch_write_item(RequestItems={self.tableName: requests})
+                requests = response.get('UnprocessedItems', {}).get(self.tableName, [])
+            except ClientError as e:
+                if e.response['Error']['Code'] not in THROTTLING_ERRORS:
+                    raise
+            if requests:
+                self._count('throttles')
+                if attempt >= self.maxRetries:
+                    raise RuntimeError(f'{self.tableName}: {len(requests)} items still unprocessed after {attempt} retries')
+                time.sleep(backoff_delay(attempt, base=0.05, maxDelay=5))
+                attempt += 1
+        self._count('batches')
+        self._count('items', written)
+
+    def _count(self, name, value=1):
+        with self._statsLock:
+            self.stats[name] += value
@@ -14,6 +14,75 @@
 
 import http.client
 import logging
+import queue
+import socket
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from common_rate_limit_util import backoff_delay
+
+logger = logging.getLogger()
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_RETRIES = 5
+ACCEPT_ENCODING = 'gzip, deflate'
+# compressed bytes read from the socket at a time
+COMPRESSED_CHUNK_SIZE = 16 * 1024
+
+# statuses meaning that the server is throttling us (Thron answers 418) or is overloaded
+RETRYABLE_STATUSES = (418, 429, 500, 502, 503, 504)
+
+# errors raised when a kept-alive connection has been dropped by the server
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.CannotSendRequest,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+# errors worth a retry once the connection has been renewed
+RETRYABLE_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    # an OSError but not a TimeoutError before python 3.10: raised for the connect and read timeouts
+    socket.timeout,
+    http.client.IncompleteRead,
+    http.client.BadStatusLine,
+)
+
+
+class HttpStatusError(Exception):
+    '''
+    Raised for a response status the caller cannot handle
+    '''
+
+    def __init__(self, status, reason, body=b''):
+        super().__init__(f'HTTP {status} {reason}: {body[:200]!r}')
+        self.status = status
+        self.reason = reason
+        self.body = body
+
+
+def raise_for_status(res, expected=(200,)):
+    '''
+    Raises HttpStatusError, with the beginning of the body, when the response status is not expected
+    :param http.client.HTTPResponse res: the response
+    '''
+    if res.status not in expected:
+        raise HttpStatusError(res.status, res.reason, res.read(1024))
+
+
+def retry_after_seconds(res):
+    '''
+    :return: float the seconds asked by the Retry-After header, 0 when missing or given as a date
+    '''
+    try:
+        return float(res.getheader('Retry-After') or 0)
+    except ValueError:
+        return 0
 
 
 def initHttpClientDebugLevel(level=3):
@@ -25,4 +94,222 @@ def initHttpClientDebugLevel(level=3):
    ch.setLevel(logging.INFO)
    log.addHandler(ch)
    # print statements from `http.client.HTTPConnection` to console/stdout
-   http.client.HTTPSConnection.debuglevel = level
\ No newline at end of file
+   http.client.HTTPSConnection.debuglevel = level
+
+
+class DecodedResponse:
+    '''
+    Wraps an http.client.HTTPResponse sent with a gzip or deflate
+    Content-Encoding: read() returns the body decompressed on the fly, never
+    inflating more than the amount asked, so that a streaming reader
+    (e.g. JsonItemsStream) keeps a bounded memory.
+    The other attributes are the ones of the response.
+    '''
+
+    def __init__(self, res, encoding):
+        self._res = res
+        self._encoding = encoding
+        self._decompressor = None
+        self._tail = b''
+        self.compressedBytes = 0
+
+    def __getattr__(self, name):
+        return getattr(self._res, name)
+
+    def _new_decompressor(self, data):
+        if self._encoding == 'deflate' and not is_zlib_header(data):
+            # some servers send a raw deflate stream without the zlib header
+            return zlib.decompressobj(-zlib.MAX_WBITS)
+        # 16 + MAX_WBITS expects the gzip header, MAX_WBITS the zlib one
+        return zlib.decompressobj(16 + zlib.MAX_WBITS if self._encoding != 'deflate' else zlib.MAX_WBITS)
+
+    def _read_compressed(self):
+        if self._tail:
+            data, self._tail = self._tail, b''
+            return data
+        data = self._res.read(COMPRESSED_CHUNK_SIZE)
+        self.compressedBytes += len(data)
+        if data and self._decompressor is None:
+            self._decompressor = self._new_decompressor(data)
+        return data
+
+    def read(self, amt=None):
+        '''
+        :param int amt: max number of decompressed bytes, None for the whole body
+        :return: bytes: empty at the end of the body
+        '''
+        if amt is None:
+            return b''.join(iter(lambda: self.read(COMPRESSED_CHUNK_SIZE * 4), b''))
+        while True:
+            data = self._read_compressed()
+            if not data:
+                return self._decompressor.flush() if self._decompressor else b''
+            out = self._decompressor.decompress(data, amt)
+            self._tail = self._decompressor.unconsumed_tail
+            if out:
+                return out
+
+
+def is_zlib_header(data):
+    return len(data) >= 2 and data[0] & 0x0f == 8 and (data[0] << 8 | data[1]) % 31 == 0
+
+
+def decode_response(res):
+    '''
+    :return: the response itself, or a DecodedResponse when the body is compressed
+    '''
+    encoding = (res.getheader('Content-Encoding') or '').strip().lower()
+    if encoding in ('gzip', 'x-gzip', 'deflate'):
+        return DecodedResponse(res, encoding)
+    return res
+
+
+class HTTPSConnectionPool:
+    '''
+    Thread safe pool of kept-alive connections to a single host.
+    A connection is given back to the pool only when its response has been
+    completely read, otherwise it is closed.
+    When a rate limiter is given every request waits for it, throttled and
+    failed requests are retried with a jittered exponential backoff and slow
+    down the rate.
+    With compression the requests accept gzip/deflate bodies, decompressed
+    transparently while they are read.
+    '''
+
+    def __init__(self, host, port=None, maxsize=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT,
+                 rateLimiter=None, maxRetries=DEFAULT_MAX_RETRIES, compression=True):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.rateLimiter = rateLimiter
+        self.maxRetries = maxRetries
+        self.compression = compression
+        self._idle = queue.LifoQueue(maxsize=maxsize)
+
+    def _new_conn(self):
+        return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+
+    def _get_conn(self):
+        '''
+        :return: tuple (conn, reused): an idle connection if any, a new one otherwise
+        '''
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._new_conn(), False
+
+    def _put_conn(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _send(self, method, url, body, headers):
+        conn, reused = self._get_conn()
+        try:
+            conn.request(method, url, body, headers or {})
+            return conn, conn.getresponse()
+        except STALE_CONNECTION_ERRORS:
+            conn.close()
+            if not reused:
+                raise
+        except Exception:
+            conn.close()
+            raise
+        logger.debug('stale connection to %s, reconnecting', self.host)
+        conn = self._new_conn()
+        try:
+            conn.request(method, url, body, headers or {})
+            return conn, conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+    def _release(self, conn, res):
+        if res.isclosed() and not res.will_close:
+            self._put_conn(conn)
+        else:
+            conn.close()
+
+    def _send_with_retries(self, method, url, body, headers):
+        '''
+        Sends a request, retrying the throttled and failed ones
+        :return: tuple (conn, res): the last response, whatever its status once the retries are exhausted
+        '''
+        attempt = 0
+        while True:
+            if self.rateLimiter:
+                self.rateLimiter.acquire()
+            try:
+                conn, res = self._send(method, url, body, headers)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.maxRetries:
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f'{method} {self.host} failed with {e!r}, retry {attempt + 1} in {delay:.2f}s')
+            else:
+                if res.status not in RETRYABLE_STATUSES:
+                    if self.rateLimiter:
+                        self.rateLimiter.on_success()
+                    return conn, res
+                if attempt >= self.maxRetries:
+                    logger.warning(f'{method} {self.host} still answered {res.status} after {attempt} retries')
+                    return conn, res
+                res.read()
+                self._release(conn, res)
+                delay = max(backoff_delay(attempt), retry_after_seconds(res))
+                logger.warning(f'{method} {self.host} answered {res.status}, retry {attempt + 1} in {delay:.2f}s')
+            if self.rateLimiter:
+                self.rateLimiter.on_throttle()
+            time.sleep(delay)
+            attempt += 1
+
+    @contextmanager
+    def urlopen(self, method, url, body=None, headers=None):
+        '''
+        Sends a request on a pooled connection
+        :return: http.client.HTTPResponse: the response, readable (decompressed) within the with block
+        '''
+        if self.compression:
+            headers = dict(headers or {})
+            headers.setdefault('Accept-Encoding', ACCEPT_ENCODING)
+        conn, res = self._send_with_retries(method, url, body, headers)
+        try:
+            yield decode_response(res) if self.compression else res
+        except BaseException:
+            # includes GeneratorExit when a streaming consumer stops early
+            conn.close()
+            raise
+        self._release(conn, res)
+
+    def request(self, method, url, body=None, headers=None):
+        '''
+        Sends a request on a pooled connection and reads the whole response
+        :return: tuple (status, data)
+        '''
+        with self.urlopen(method, url, body, headers) as res:
+            data = res.read()
+        return res.status, data
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(host, **kwargs):
+    '''
+    Returns the pool of the host, shared by all the threads and kept across warm invocations
+    :param str host: the host name
+    :return: HTTPSConnectionPool
+    '''
+    with _pools_lock:
+        if host not in _pools:
+            _pools[host] = HTTPSConnectionPool(host, **kwargs)
+        return _pools[host]
@@ -0,0 +1,140 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+import codecs
+import json
+import re
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+# characters that can follow a complete number or literal
+VALUE_DELIMITERS = ',]} \t\n\r'
+
+
+class JsonItemsStream:
+    '''
+    Incremental reader of a JSON object like {"items": [...], "nextPage": "..."}.
+    Iterating it yields the elements of the items array while they are read
+    from the file-like object (e.g. an http.client.HTTPResponse), so the
+    whole payload is never held in memory.
+    The other top-level fields are collected in `fields`; the ones placed
+    after the items array are available only once the iteration is over,
+    as is the final `itemCount`.
+    '''
+
+    def __init__(self, fp, itemsKey='items', chunkSize=DEFAULT_CHUNK_SIZE):
+        self.fp = fp
+        self.itemsKey = itemsKey
+        self.chunkSize = chunkSize
+        self.fields = {}
+        self.itemCount = 0
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        self._items = self._parse()
+
+    def __iter__(self):
+        return self._items
+
+    def finish(self):
+        '''
+        Reads (and drops) the items not consumed yet
+        :return: dict fields: all the top-level fields but the items
+        '''
+        for _ in self._items:
+            pass
+        return self.fields
+
+    def _fill(self):
+        '''
+        Appends the next chunk to the buffer
+        :return: False once the end of the stream has been reached
+        '''
+        if self._eof:
+            return False
+        chunk = self.fp.read(self.chunkSize)
+        if self._pos > self.chunkSize:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        if not chunk:
+            self._eof = True
+            self._buf += self._decoder.decode(b'', final=True)
+            return False
+        self._buf += self._decoder.decode(chunk)
+        return True
+
+    def _peek(self):
+        '''
+        Skips the whitespaces
+        :return: str the next character, empty at the end of the stream
+        '''
+        while True:
+            self._pos = WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, chars):
+        c = self._peek()
+        if not c or c not in chars:
+            raise json.JSONDecodeError(f'Expecting one of {chars!r}', self._buf, self._pos)
+        self._pos += 1
+        return c
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buf, self._pos)
+                # strings, objects and arrays end with their own delimiter, while a number
+                # or a literal may continue in the next chunk (1. then 5, 1.5 then e10)
+                if self._eof or (end < len(self._buf) and
+                                 (self._buf[self._pos] in '"{[' or self._buf[end] in VALUE_DELIMITERS)):
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+    def _parse(self):
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+        else:
+            while True:
+                key = self._value()
+                self._expect(':')
+                if key == self.itemsKey and self._peek() == '[':
+                    self._pos += 1
+                    if self._peek() == ']':
+                        self._pos += 1
+                    else:
+                        while True:
+                            item = self._value()
+                            self.itemCount += 1
+                            yield item
+                            if self._expect(',]') == ']':
+                                break
+                else:
+                    self.fields[key] = self._value()
+                if self._expect(',}') == '}':
+                    break
+        # read up to the end so that the connection can be reused
+        while self.fp.read(self.chunkSize):
+            pass
@@ -0,0 +1,141 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+"""Personalize events client sharing a token bucket per API between its threads"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.exceptions import ClientError
+
+from common_rate_limit_util import TokenBucket, backoff_delay
+
+logger = logging.getLogger()
+
+# calls per second allowed for each API of the account
+PUT_ITEMS_TPS = float(os.environ.get('PERSONALIZE_PUT_ITEMS_TPS', 10))
+PUT_USERS_TPS = float(os.environ.get('PERSONALIZE_PUT_USERS_TPS', 10))
+PUT_EVENTS_TPS = float(os.environ.get('PERSONALIZE_PUT_EVENTS_TPS', 1000))
+PERSONALIZE_EVENTS_WORKERS = int(os.environ.get('PERSONALIZE_EVENTS_WORKERS', 4))
+# max items/users/events of a call
+MAX_RECORDS_PER_CALL = 10
+THROTTLING_ERRORS = ('ThrottlingException', 'TooManyRequestsException', 'LimitExceededException')
+
+
+class PersonalizeEventsClient:
+    '''
+    Sends the records to Personalize in calls of MAX_RECORDS_PER_CALL,
+    dispatched to a pool of threads so that the calls to the different
+    datasets overlap. The calls of an API share a token bucket: they are
+    sent as fast as its TPS allows, throttled calls are retried with backoff.
+    The put_* methods return one future per call, whose result is the
+    response of the call (or its error)
+    '''
+
+    def __init__(self, client=None, workers=PERSONALIZE_EVENTS_WORKERS, rates=None, maxRetries=5):
+        '''
+        :param client: The personalize-events client, a new one by default
+        :param int workers: max number of concurrent calls
+        :param dict rates: API name -> calls per second, the env defaults by default
+        :param int maxRetries: max retries of a throttled call
+        '''
+        self._client = client or boto3.client('personalize-events')
+        rates = rates or {'put_items': PUT_ITEMS_TPS, 'put_users': PUT_USERS_TPS, 'put_events': PUT_EVENTS_TPS}
+        self._buckets = {api: TokenBucket(rate) for api, rate in rates.items()}
+        self.maxRetries = maxRetries
+        self.stats = {'calls': 0, 'records': 0, 'throttles': 0, 'waited': 0.0}
+        self._statsLock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def put_items(self, datasetArn, items):
+        return self._dispatch('put_items', 'items', items, datasetArn=datasetArn)
+
+    def put_users(self, datasetArn, users):
+        return self._dispatch('put_users', 'users', users, datasetArn=datasetArn)
+
+    def put_events(self, trackingId, sessionId, eventList, userId=None):
+        kwargs = {'trackingId': trackingId, 'sessionId': sessionId}
+        if userId:
+            kwargs['userId'] = userId
+        return self._dispatch('put_events', 'eventList', eventList, **kwargs)
+
+    def _dispatch(self, api, recordsKey, records, **kwargs):
+        '''
+        :return: list of futures, one per call of MAX_RECORDS_PER_CALL records
+        '''
+        return [self._executor.submit(self._call, api, recordsKey, dict(kwargs, **{recordsKey: records[i:i + MAX_RECORDS_PER_CALL]}))
+                for i in range(0, len(records), MAX_RECORDS_PER_CALL)]
+
+    def _call(self, api, recordsKey, request):
+        attempt = 0
+        while True:
+            self._count('waited', self._buckets[api].acquire())
+            try:
+                response = getattr(self._client, api)(**request)
+            except ClientError as e:
+                if e.response['Error']['Code'] not in THROTTLING_ERRORS or attempt >= self.maxRetries:
+                    raise
+                self._count('throttles')
+                time.sleep(backoff_delay(attempt))
+                attempt += 1
+                continue
+            self._count('calls')
+            self._count('records', len(request[recordsKey]))
+            return response
+
+    def _count(self, name, value=1):
+        with self._statsLock:
+            self.stats[name] += value
+
+
+def coalesce(records, key):
+    '''
+    Last write wins: keeps only the last record of each key
+    :param list records: The records in the order of their writes (e.g. the NewImages of a stream batch)
+    :param function key: returns the item/user of a record
+    :return: list of the records kept, in the order of their last write
+    '''
+    latest = {}
+    for record in records:
+        recordKey = key(record)
+        latest.pop(recordKey, None)
+        latest[recordKey] = record
+    return list(latest.values())
+
+
+def calls_needed(recordCount):
+    '''
+    :return: int the number of calls sending recordCount records
+    '''
+    return -(-recordCount // MAX_RECORDS_PER_CALL)
+
+
+def failed_record_indexes(futures, recordCount):
+    '''
+    Waits for the calls of a put_* and finds the records of the failed ones
+    :param list futures: The futures returned by the put_*
+    :param int recordCount: The number of records given to the put_*
+    :return: list of the indexes of the records not sent
+    '''
+    indexes = []
+    for call, future in enumerate(futures):
+        error = future.exception()
+        if error is not None:
+            logger.error(f'call {call} failed: {error}')
+            indexes.extend(range(call * MAX_RECORDS_PER_CALL, min(recordCount, (call + 1) * MAX_RECORDS_PER_CALL)))
+    return indexes
+
@@ -0,0 +1,99 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+"""Bounded producer/consumer pipeline reading pages in threads ahead of their consumer"""
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# the timings are updated by the reader threads and the consumer
+_timingsLock = threading.Lock()
+
+
+def put_page(pages, stopped, page, timings=None):
+    '''
+    Waits for room in the queue (backpressure from the consumer)
+    :return: bool False when the consumer has stopped
+    '''
+    started = time.monotonic()
+    try:
+        while not stopped.is_set():
+            try:
+                pages.put(page, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    finally:
+        if timings is not None:
+            _add_seconds(timings, 'blockedSeconds', started)
+
+
+def produce_pages(read_pages, pages, stopped, timings=None):
+    '''
+    Puts the pages of a reader on the queue, then None (or the error that stopped it)
+    :param function read_pages: returns a generator of pages
+    '''
+    if stopped.is_set():
+        # the consumer stopped before this reader got a thread
+        return
+    try:
+        for page in read_pages():
+            if not put_page(pages, stopped, page, timings):
+                return
+    except Exception as e:
+        put_page(pages, stopped, e, timings)
+        return
+    put_page(pages, stopped, None, timings)
+
+
+def read_pages_in_parallel(readers, workers, prefetch=None, timings=None):
+    '''
+    Runs the readers in a pool of threads, at most `prefetch` pages ahead of the consumer
+    :param list readers: functions returning a generator of pages
+    :param int workers: The number of readers running concurrently
+    :param int prefetch: max pages read and not consumed yet, 2 per worker by default
+    :param dict timings: when given, the seconds the readers were blocked by the consumer
+                         (blockedSeconds) and the consumer waited for a page (waitingSeconds) are added to it
+    :return: generator of pages, as the readers return them (in order with a single reader)
+    '''
+    if timings is not None:
+        timings.setdefault('blockedSeconds', 0)
+        timings.setdefault('waitingSeconds', 0)
+    pages = queue.Queue(maxsize=prefetch or workers * 2)
+    stopped = threading.Event()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for read_pages in readers:
+            executor.submit(produce_pages, read_pages, pages, stopped, timings)
+        try:
+            running = len(readers)
+            while running:
+                started = time.monotonic()
+                page = pages.get()
+                if timings is not None:
+                    _add_seconds(timings, 'waitingSeconds', started)
+                if isinstance(page, Exception):
+                    raise page
+                if page is None:
+                    running -= 1
+                    continue
+                yield page
+        finally:
+            stopped.set()
+
+
+def _add_seconds(timings, name, started):
+    with _timingsLock:
+        timings[name] += time.monotonic() - started
@@ -0,0 +1,109 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger()
+
+
+class TokenBucket:
+    '''
+    Thread safe token bucket: acquire() blocks until a call is allowed by the rate.
+    Callers reserve their token in turn, so the waits are fair between threads
+    '''
+
+    def __init__(self, rate, capacity=1):
+        '''
+        :param float rate: allowed calls per second
+        :param float capacity: calls allowed in a burst
+        '''
+        self.capacity = capacity
+        self._rate = float(rate)
+        self._tokens = float(capacity)
+        self._updatedAt = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updatedAt) * self._rate)
+        self._updatedAt = now
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill(time.monotonic())
+            self._rate = float(rate)
+
+    def acquire(self, tokens=1):
+        '''
+        Waits for the tokens needed by a call
+        :return: float the seconds waited
+        '''
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= tokens
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class AdaptiveRateLimiter(TokenBucket):
+    '''
+    Token bucket whose rate follows an AIMD policy: it grows by `increase`
+    calls/s for each second of successful calls and is multiplied by
+    `decrease` when the server throttles (at most once per `cooldown` seconds,
+    so that a burst of concurrent rejections counts once)
+    '''
+
+    def __init__(self, rate, minRate=1, maxRate=None, increase=1, decrease=0.5, cooldown=1):
+        super().__init__(rate)
+        self.minRate = minRate
+        self.maxRate = maxRate or rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.throttles = 0
+        self._throttledAt = 0
+
+    def on_success(self):
+        with self._lock:
+            if self._rate < self.maxRate:
+                self._refill(time.monotonic())
+                self._rate = min(self.maxRate, self._rate + self.increase / self._rate)
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttles += 1
+            now = time.monotonic()
+            if now - self._throttledAt < self.cooldown:
+                return
+            self._throttledAt = now
+            self._refill(now)
+            self._rate = max(self.minRate, self._rate * self.decrease)
+            logger.warning(f'throttled, rate lowered to {self._rate:.2f} calls/s')
+
+
+def backoff_delay(attempt, base=0.2, maxDelay=20):
+    '''
+    Exponential backoff with full jitter
+    :param int attempt: the number of retries done so far
+    :return: float seconds to wait before the next retry
+    '''
+    return random.uniform(0, min(maxDelay, base * 2 ** attempt))
@@ -0,0 +1,151 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+"""Resolution of the SSM parameters and Personalize ARNs, cached in the warm container"""
+import logging
+import os
+import threading
+import time
+
+import boto3
+
+logger = logging.getLogger()
+personalize = boto3.client('personalize')
+ssm = boto3.client('ssm')
+
+RESOURCE_CACHE_TTL_SECONDS = int(os.environ.get('RESOURCE_CACHE_TTL_SECONDS', 900))
+# max names of a GetParameters request
+GET_PARAMETERS_MAX_NAMES = 10
+
+
+class TTLCache:
+    '''
+    Thread safe cache whose entries expire after ttl seconds
+    '''
+
+    def __init__(self, ttl=RESOURCE_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        '''
+        :return: the cached value, None when missing or expired
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expiresAt = entry
+            if expiresAt < time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+
+    def invalidate(self, key=None):
+        '''
+        :param key: The entry to drop, None to drop them all
+        '''
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+cache = TTLCache()
+
+
+def get_parameters(names):
+    '''
+    Reads SSM parameters, the ones not cached with GetParameters batches
+    :param list names: The names of the parameters
+    :return: dict name -> value
+    :raises KeyError: when a parameter does not exist
+    '''
+    values = {}
+    missing = []
+    for name in names:
+        value = cache.get(('ssm', name))
+        if value is None:
+            missing.append(name)
+        else:
+            values[name] = value
+    for i in range(0, len(missing), GET_PARAMETERS_MAX_NAMES):
+        response = ssm.get_parameters(Names=missing[i:i + GET_PARAMETERS_MAX_NAMES])
+        if response['InvalidParameters']:
+            raise KeyError(f"SSM parameters not found: {response['InvalidParameters']}")
+        for parameter in response['Parameters']:
+            cache.put(('ssm', parameter['Name']), parameter['Value'])
+            values[parameter['Name']] = parameter['Value']
+    return values
+
+
+def get_parameter(name):
+    return get_parameters([name])[name]
+
+
+def _list_all(operation, resultKey, **kwargs):
+    '''
+    :return: generator of all the summaries returned by a paginated list API
+    '''
+    for page in personalize.get_paginator(operation).paginate(**kwargs):
+        yield from page[resultKey]
+
+
+def _find(key, list_arns):
+    '''
+    Resolves an ARN from the cache or with list_arns() which returns all
+    the ARNs of its listing, so that they are all cached at once.
+    Missing resources are not cached: they can be created meanwhile
+    :param tuple key: The cache key of the resource
+    :param function list_arns: returns dict cache key -> ARN
+    :return: str the ARN, None when the resource does not exist
+    '''
+    arn = cache.get(key)
+    if arn is None:
+        for listedKey, listedArn in list_arns().items():
+            cache.put(listedKey, listedArn)
+        arn = cache.get(key)
+    return arn
+
+
+def find_schema_arn(schema_name):
+    return _find(('schema', schema_name), lambda: {
+        ('schema', schema['name']): schema['schemaArn'] for schema in _list_all('list_schemas', 'schemas')})
+
+
+def find_solution_arn(solution_name):
+    return _find(('solution', solution_name), lambda: {
+        ('solution', solution['name']): solution['solutionArn'] for solution in _list_all('list_solutions', 'solutions')})
+
+
+def find_dataset_arn(dataset_group_arn, dataset_type):
+    '''
+    :param str dataset_type: ITEMS, USERS or INTERACTIONS
+    :return: str the ARN of the dataset of this type in the dataset group, None when it does not exist
+    '''
+    return _find(('dataset', dataset_group_arn, dataset_type.upper()), lambda: {
+        ('dataset', dataset_group_arn, dataset['datasetType'].upper()): dataset['datasetArn']
+        for dataset in _list_all('list_datasets', 'datasets', datasetGroupArn=dataset_group_arn)})
+
+
+def find_dataset_import_job_arn(dataset_arn, job_name):
+    return _find(('datasetImportJob', dataset_arn, job_name), lambda: {
+        ('datasetImportJob', dataset_arn, job['jobName']): job['datasetImportJobArn']
+        for job in _list_all('list_dataset_import_jobs', 'datasetImportJobs', datasetArn=dataset_arn)})
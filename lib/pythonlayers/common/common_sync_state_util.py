@@ -0,0 +1,197 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+"""Checkpoints of the ingestion runs, stored in the sync state table"""
+import logging
+import os
+from datetime import datetime
+
+import boto3
+from boto3.dynamodb.conditions import Key
+
+logger = logging.getLogger()
+dynamodb = boto3.resource('dynamodb')
+
+CHECKPOINT_RECORD = 'checkpoint'
+PAGE_RECORD_PREFIX = 'page#'
+WATERMARK_RECORD = 'watermark'
+FAILURE_RECORD_PREFIX = 'failure#'
+DEAD_LETTER_RECORD_PREFIX = 'deadletter#'
+
+
+def get_sync_state_table():
+    return dynamodb.Table(os.environ['SYNC_STATE_TABLE'])
+
+
+def query_sync_records(syncId, recordPrefix=None, **kwargs):
+    '''
+    Reads all the records of a sync following the pagination
+    :param str syncId: The id of the sync (e.g. thron-initial)
+    :param str recordPrefix: only the records whose recordId starts with it
+    :return: generator of dict records
+    '''
+    table = get_sync_state_table()
+    keyCondition = Key('syncId').eq(syncId)
+    if recordPrefix:
+        keyCondition = keyCondition & Key('recordId').begins_with(recordPrefix)
+    response = table.query(KeyConditionExpression=keyCondition, **kwargs)
+    yield from response['Items']
+    while 'LastEvaluatedKey' in response:
+        response = table.query(KeyConditionExpression=keyCondition,
+                               ExclusiveStartKey=response['LastEvaluatedKey'], **kwargs)
+        yield from response['Items']
+
+
+def load_checkpoint(syncId):
+    '''
+    Loads the last checkpoint of a sync
+    :param str syncId: The id of the sync
+    :return: tuple (checkpoint, processedIds): checkpoint is None when the sync has to start from scratch
+    '''
+    checkpoint = None
+    processedIds = set()
+    for record in query_sync_records(syncId):
+        if record['recordId'] == CHECKPOINT_RECORD:
+            checkpoint = record
+        elif record['recordId'].startswith(PAGE_RECORD_PREFIX):
+            processedIds.update(record.get('contentIds', set()))
+    if checkpoint:
+        logger.info(f"resuming {syncId} after page {checkpoint['pageNumber']} with {len(processedIds)} ids already processed")
+    return checkpoint, processedIds
+
+
+def save_checkpoint(syncId, pageNumber, nextPage, pageIds, stats):
+    '''
+    Saves the ids processed in a page and then the cursor of the next one
+    :param str syncId: The id of the sync
+    :param int pageNumber: The number of the page just completed
+    :param str nextPage: The cursor of the next page
+    :param set pageIds: The ids processed in the page
+    :param dict stats: The counters of the sync so far
+    '''
+    table = get_sync_state_table()
+    if pageIds:
+        # one record per page keeps each item far from the 400KB limit
+        table.put_item(Item={
+            'syncId': syncId,
+            'recordId': f'{PAGE_RECORD_PREFIX}{pageNumber:06d}',
+            'contentIds': set(pageIds)
+        })
+    table.put_item(Item={
+        'syncId': syncId,
+        'recordId': CHECKPOINT_RECORD,
+        'pageNumber': pageNumber,
+        'nextPage': nextPage,
+        'stats': stats,
+        'updatedAt': datetime.utcnow().isoformat()
+    })
+
+
+def clear_checkpoint(syncId):
+    '''
+    Removes the checkpoint and the processed ids of a sync
+    :param str syncId: The id of the sync
+    '''
+    table = get_sync_state_table()
+    with table.batch_writer() as writer:
+        for record in query_sync_records(syncId, ProjectionExpression='syncId, recordId'):
+            if record['recordId'] == CHECKPOINT_RECORD or record['recordId'].startswith(PAGE_RECORD_PREFIX):
+                writer.delete_item(Key={'syncId': record['syncId'], 'recordId': record['recordId']})
+
+
+def get_watermark(syncId):
+    '''
+    Reads the watermark of an incremental sync
+    :param str syncId: The id of the sync (e.g. thron-incremental)
+    :return: str watermark: the upper bound of the last successful run, None before the first one
+    '''
+    record = get_sync_state_table().get_item(
+        Key={'syncId': syncId, 'recordId': WATERMARK_RECORD},
+        ConsistentRead=True
+    ).get('Item')
+    return record['watermark'] if record else None
+
+
+def set_watermark(syncId, watermark, stats=None):
+    '''
+    Stores the watermark of an incremental sync, to be called once all its writes succeeded
+    :param str syncId: The id of the sync
+    :param str watermark: The upper bound of the run
+    :param dict stats: The counters of the run
+    '''
+    get_sync_state_table().put_item(Item={
+        'syncId': syncId,
+        'recordId': WATERMARK_RECORD,
+        'watermark': watermark,
+        'stats': stats or {},
+        'updatedAt': datetime.utcnow().isoformat()
+    })
+
+
+def record_failures(syncId, failedIds, maxAttempts):
+    '''
+    Counts the failed attempts of the items of an incremental sync. An item failing
+    maxAttempts times is moved to a dead-letter record so that it no longer holds
+    back the watermark; delete the record to have it retried
+    :param str syncId: The id of the sync
+    :param set failedIds: The ids not written by the run
+    :param int maxAttempts: The attempts before an item is dead-lettered
+    :return: tuple (retryIds, deadLetterIds): the ids to retry and the ones dead-lettered by this run
+    '''
+    table = get_sync_state_table()
+    retryIds = set()
+    deadLetterIds = set()
+    now = datetime.utcnow().isoformat()
+    for id in failedIds:
+        attempts = table.update_item(
+            Key={'syncId': syncId, 'recordId': f'{FAILURE_RECORD_PREFIX}{id}'},
+            UpdateExpression='ADD attempts :one SET lastFailedAt = :now',
+            ExpressionAttributeValues={':one': 1, ':now': now},
+            ReturnValues='UPDATED_NEW'
+        )['Attributes']['attempts']
+        if attempts < maxAttempts:
+            retryIds.add(id)
+            continue
+        table.put_item(Item={
+            'syncId': syncId,
+            'recordId': f'{DEAD_LETTER_RECORD_PREFIX}{id}',
+            'attempts': attempts,
+            'deadLetteredAt': now
+        })
+        table.delete_item(Key={'syncId': syncId, 'recordId': f'{FAILURE_RECORD_PREFIX}{id}'})
+        deadLetterIds.add(id)
+    if deadLetterIds:
+        logger.error(f'{syncId}: {len(deadLetterIds)} items dead-lettered after {maxAttempts} attempts: {sorted(deadLetterIds)}')
+    return retryIds, deadLetterIds
+
+
+def load_dead_letters(syncId):
+    '''
+    Reads the ids dead-lettered by an incremental sync
+    :param str syncId: The id of the sync
+    :return: set ids
+    '''
+    return {record['recordId'][len(DEAD_LETTER_RECORD_PREFIX):]
+            for record in query_sync_records(syncId, DEAD_LETTER_RECORD_PREFIX, ProjectionExpression='recordId')}
+
+
+def clear_failures(syncId):
+    '''
+    Removes the failure counters of a sync, once the watermark has moved past them
+    :param str syncId: The id of the sync
+    '''
+    table = get_sync_state_table()
+    with table.batch_writer() as writer:
+        for record in query_sync_records(syncId, FAILURE_RECORD_PREFIX, ProjectionExpression='syncId, recordId'):
+            writer.delete_item(Key={'syncId': record['syncId'], 'recordId': record['recordId']})
@@ -18,6 +18,7 @@ import { thronEnvConfig, thronEnvs, cmsEnvConfig, cmsEnvs } from '../utils/env-c
 
 export interface DataIngestionContentProps extends cdk.NestedStackProps {
   readonly fanAppContentDdbTableName: string;
+  readonly fanAppSyncStateDdbTable: dynamodb.ITable;
   readonly lambdaCommonLayer: lambdapython.PythonLayerVersion;
 }
 
@@ -55,15 +56,23 @@ export class DataIngestionContentStack extends cdk.NestedStack {
           THRON_ADMIN_HOST: THRON_CONFIG.thronAdminHost,
           THRON_HOST: THRON_CONFIG.thronHost,
           THRON_PUBLIC_FOLDER: THRON_CONFIG.thronPublicFolder,
+          THRON_DETAIL_WORKERS: '8',
+          THRON_MAX_RPS: '20',
+          THRON_PAGE_SIZE: '100',
+          THRON_DETAILS_MODE: 'export',
+          SYNC_STATE_TABLE: props.fanAppSyncStateDdbTable.tableName,
+          THRON_WATERMARK_OVERLAP_MINUTES: '30',
+          THRON_MAX_ITEM_ATTEMPTS: '3',
           STAGE: env.STAGE,
           ENVIRONMENT_NAME: env.ENVIRONMENT_NAME,
-          DAYS_AGO: '1', //IF GREATER THAN 60 IT WILL BE SET TO 60
+          DAYS_AGO: '1', //USED ONLY UNTIL THE FIRST WATERMARK IS STORED
         },
       },
     );
 
     /* Granting  Access to DynamoDB Table */
     fanAppContentTable.grantReadWriteData(fanAppThronIncrementalDataLoadFunction);
+    props.fanAppSyncStateDdbTable.grantReadWriteData(fanAppThronIncrementalDataLoadFunction);
 
     /* Granting Lmabda Access  keys and Secrets */
     fanAppThronIncrementalDataLoadFunction.role?.attachInlinePolicy(
@@ -112,17 +121,21 @@ export class DataIngestionContentStack extends cdk.NestedStack {
         environment: {
           CONTENT_TABLE: fanAppContentTable.tableName,
           CMS_API_KEY: env.CMS_API_KEY,
+          CMS_MAX_RPS: '5',
           CMS_ENDPOINT: CMS_CONFIG.cmsEndpoint,
           CMS_BASE_PATH: CMS_CONFIG.cmsBasePath,
           CDN_HOST: CMS_CONFIG.cdnHost,
           STAGE: env.STAGE,
           ENVIRONMENT_NAME: env.ENVIRONMENT_NAME,
-          DAYS_AGO: '1',
+          SYNC_MODE: 'incremental',
+          SYNC_STATE_TABLE: props.fanAppSyncStateDdbTable.tableName,
+          CMS_WATERMARK_OVERLAP_MINUTES: '30',
         },
       },
     );
 
     fanAppContentTable.grantReadWriteData(fanAppCMSNewsIncrementalDataLoadFunction);
+    props.fanAppSyncStateDdbTable.grantReadWriteData(fanAppCMSNewsIncrementalDataLoadFunction);
 
     const CmsLambdaTarget = new events_targets.LambdaFunction(
       fanAppCMSNewsIncrementalDataLoadFunction,
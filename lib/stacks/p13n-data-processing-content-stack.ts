@@ -29,6 +29,7 @@ export interface DataProcessingContentProps extends cdk.NestedStackProps {
   readonly fanAppPersonalisationNewsDatasetGroup: personalize.CfnDatasetGroup;
   readonly fanAppContentDdbTableName: string;
   readonly fanAppContentDdbTable: dynamodb.Table;
+  readonly fanAppSyncStateDdbTable: dynamodb.ITable;
   readonly lambdaCommonLayer: lambdapython.PythonLayerVersion;
 }
 
@@ -192,17 +193,19 @@ export class DataProcessingContentStack extends cdk.NestedStack {
       layerVersionName: `${env.P13N}-pandas-layer-${env.STAGE}`,
     });
 
-    // Create lambda layer for dynamodb-json library
-    const fanAppDDBJsonLayer = new lambdapython.PythonLayerVersion(this, 'fanAppDDBJsonLayer', {
-      compatibleRuntimes: [
-        lambda.Runtime.PYTHON_3_9, // execution environment
-      ],
-      entry: 'lib/pythonlayers/ddbjson',
-      description: 'Lambda layer for dynamodb-json python library',
-      layerVersionName: `${env.P13N}-ddbjson-layer-${env.STAGE}`,
-    });
+    const initUserPreferencesEnvironment = {
+      P13N: env.P13N,
+      STAGE: env.STAGE,
+      ENVIRONMENT_NAME: env.ENVIRONMENT_NAME,
+      ACCOUNT_ID: cdk.Aws.ACCOUNT_ID,
+      S3_BUCKET_NAME: props.fanAppPersonalisationBucket.bucketName,
+      ROLE_IMPORT: props.fanAppPersonalisationImportRole.roleArn,
+      DATASET_VIDEO_GROUP_ARN: props.fanAppPersonalisationVideoDatasetGroup.attrDatasetGroupArn,
+      DATASET_NEWS_GROUP_ARN: props.fanAppPersonalisationNewsDatasetGroup.attrDatasetGroupArn,
+    };
 
     // Create the lambda function for the initial import of user preferences to the Personalize dataset for users
+    // it writes the users CSV and creates the datasets, the import jobs are created once the datasets are ACTIVE
     const initUserPreferencesDataImportFunction = new lambda.Function(
       this,
       `${env.P13N}-init-users-preferences-data-${env.STAGE}`,
@@ -212,19 +215,27 @@ export class DataProcessingContentStack extends cdk.NestedStack {
         handler: 'init_user_preferences_import.handler',
         functionName: `${env.P13N}-user-prefs-initial-data-ingestion-${env.STAGE}`,
         role: lambdaProcessingRole,
-        layers: [fanAppPandasLambdaLayer],
+        layers: [fanAppPandasLambdaLayer, props.lambdaCommonLayer],
         timeout: cdk.Duration.seconds(900),
         memorySize: 1024,
-        environment: {
-          P13N: env.P13N,
-          STAGE: env.STAGE,
-          ENVIRONMENT_NAME: env.ENVIRONMENT_NAME,
-          ACCOUNT_ID: cdk.Aws.ACCOUNT_ID,
-          S3_BUCKET_NAME: props.fanAppPersonalisationBucket.bucketName,
-          ROLE_IMPORT: props.fanAppPersonalisationImportRole.roleArn,
-          DATASET_VIDEO_GROUP_ARN: props.fanAppPersonalisationVideoDatasetGroup.attrDatasetGroupArn,
-          DATASET_NEWS_GROUP_ARN: props.fanAppPersonalisationNewsDatasetGroup.attrDatasetGroupArn,
-        },
+        environment: initUserPreferencesEnvironment,
+      },
+    );
+
+    // Create the lambda function creating the import jobs of the users datasets
+    const initUserPreferencesDataImportJobFunction = new lambda.Function(
+      this,
+      `${env.P13N}-init-users-preferences-import-job-${env.STAGE}`,
+      {
+        runtime: lambda.Runtime.PYTHON_3_9,
+        code: lambda.Code.fromAsset('lib/functions/data-preparation'),
+        handler: 'init_user_preferences_import.import_handler',
+        functionName: `${env.P13N}-user-prefs-initial-import-job-${env.STAGE}`,
+        role: lambdaProcessingRole,
+        layers: [fanAppPandasLambdaLayer, props.lambdaCommonLayer],
+        timeout: cdk.Duration.seconds(60),
+        memorySize: 256,
+        environment: initUserPreferencesEnvironment,
       },
     );
 
@@ -239,7 +250,7 @@ export class DataProcessingContentStack extends cdk.NestedStack {
         functionName: `${env.P13N}-user-prefs-incremental-data-ingestion-${env.STAGE}`,
         role: lambdaProcessingRole,
         timeout: cdk.Duration.seconds(600),
-        layers: [fanAppDDBJsonLayer],
+        layers: [props.lambdaCommonLayer],
         memorySize: 1024,
         environment: {
           P13N: env.P13N,
@@ -247,6 +258,7 @@ export class DataProcessingContentStack extends cdk.NestedStack {
           ENVIRONMENT_NAME: env.ENVIRONMENT_NAME,
           DATASET_VIDEO_GROUP_ARN: props.fanAppPersonalisationVideoDatasetGroup.attrDatasetGroupArn,
           DATASET_NEWS_GROUP_ARN: props.fanAppPersonalisationNewsDatasetGroup.attrDatasetGroupArn,
+          PERSONALIZE_PUT_USERS_TPS: '10',
         },
       },
     );
@@ -260,6 +272,7 @@ export class DataProcessingContentStack extends cdk.NestedStack {
           maxBatchingWindow: cdk.Duration.minutes(5),
           startingPosition: lambda.StartingPosition.TRIM_HORIZON,
           bisectBatchOnError: true,
+          reportBatchItemFailures: true, // the handler returns the records to retry
           retryAttempts: 2,
         },
       );
@@ -294,26 +307,46 @@ export class DataProcessingContentStack extends cdk.NestedStack {
     );
     content_table.grantReadWriteData(lambdaProcessingRole);
 
+    const contentInitialIngestionEnvironment = {
+      CONTENT_BUCKET: props.fanAppPersonalisationBucket.bucketName,
+      CONTENT_TABLE: props.fanAppContentDdbTableName,
+      VIDEO_GROUP_ARN: props.fanAppPersonalisationVideoDatasetGroup.attrDatasetGroupArn,
+      NEWS_GROUP_ARN: props.fanAppPersonalisationNewsDatasetGroup.attrDatasetGroupArn,
+      ROLE_IMPORT: props.fanAppPersonalisationImportRole.roleArn,
+      SCAN_SEGMENTS: '4',
+      CONTENT_SOURCE: 'scan', // 'export' reads the table export given by the exportLocation of the event
+      EXPORT_WORKERS: '4',
+      CSV_PART_SIZE_MB: '8',
+      P13N: env.P13N,
+      STAGE: env.STAGE,
+      ENVIRONMENT_NAME: env.ENVIRONMENT_NAME,
+    };
+
     // Create the lambda function to fetch initial data from content DynamoDB table and ingest data to Personalize
+    // it writes the items CSVs and creates the datasets, the import jobs are created once the datasets are ACTIVE
     const contentInitialIngestionLambda = new lambda.Function(this, 'content_data_ingestion', {
       runtime: lambda.Runtime.PYTHON_3_9,
       code: lambda.Code.fromAsset('lib/functions/data-preparation'),
       handler: 'content_data_ingestion.lambda_handler',
       functionName: `${env.P13N}-content-initial-data-ingestion-${env.STAGE}`,
       role: lambdaProcessingRole,
-      layers: [fanAppPandasLambdaLayer, fanAppDDBJsonLayer],
+      layers: [props.lambdaCommonLayer],
       timeout: cdk.Duration.seconds(900),
       memorySize: 1024,
-      environment: {
-        CONTENT_BUCKET: props.fanAppPersonalisationBucket.bucketName,
-        CONTENT_TABLE: props.fanAppContentDdbTableName,
-        VIDEO_GROUP_ARN: props.fanAppPersonalisationVideoDatasetGroup.attrDatasetGroupArn,
-        NEWS_GROUP_ARN: props.fanAppPersonalisationNewsDatasetGroup.attrDatasetGroupArn,
-        ROLE_IMPORT: props.fanAppPersonalisationImportRole.roleArn,
-        P13N: env.P13N,
-        STAGE: env.STAGE,
-        ENVIRONMENT_NAME: env.ENVIRONMENT_NAME,
-      },
+      environment: contentInitialIngestionEnvironment,
+    });
+
+    // Create the lambda function creating the import jobs of the items datasets
+    const contentInitialImportJobLambda = new lambda.Function(this, 'content_data_import_job', {
+      runtime: lambda.Runtime.PYTHON_3_9,
+      code: lambda.Code.fromAsset('lib/functions/data-preparation'),
+      handler: 'content_data_ingestion.import_handler',
+      functionName: `${env.P13N}-content-initial-import-job-${env.STAGE}`,
+      role: lambdaProcessingRole,
+      layers: [props.lambdaCommonLayer],
+      timeout: cdk.Duration.seconds(60),
+      memorySize: 256,
+      environment: contentInitialIngestionEnvironment,
     });
 
     // Create the lambda function to put incremental items to personalize datasets
@@ -326,13 +359,14 @@ export class DataProcessingContentStack extends cdk.NestedStack {
         handler: 'incremental_content_data_ingestion.lambda_handler',
         functionName: `${env.P13N}-content-incremental-data-ingestion-${env.STAGE}`,
         role: lambdaProcessingRole,
-        layers: [fanAppDDBJsonLayer],
+        layers: [props.lambdaCommonLayer],
         timeout: cdk.Duration.seconds(900),
         memorySize: 1024,
         environment: {
           P13N: env.P13N,
           STAGE: env.STAGE,
           ENVIRONMENT_NAME: env.ENVIRONMENT_NAME,
+          PERSONALIZE_PUT_ITEMS_TPS: '10',
         },
       },
     );
@@ -346,6 +380,7 @@ export class DataProcessingContentStack extends cdk.NestedStack {
           maxBatchingWindow: cdk.Duration.seconds(30),
           startingPosition: lambda.StartingPosition.TRIM_HORIZON,
           bisectBatchOnError: true,
+          reportBatchItemFailures: true, // the handler returns the records to retry
           retryAttempts: 2,
         },
       );
@@ -410,6 +445,7 @@ export class DataProcessingContentStack extends cdk.NestedStack {
         memorySize: 1024,
         functionName: `${env.P13N}-personalize-initial-solution-${env.STAGE}`,
         role: personalizeInitialSolutionRole,
+        layers: [props.lambdaCommonLayer],
         environment: {
           VIDEO_DATASET_GROUP: props.fanAppPersonalisationVideoDatasetGroup.attrDatasetGroupArn,
           NEWS_DATASET_GROUP: props.fanAppPersonalisationNewsDatasetGroup.attrDatasetGroupArn,
@@ -453,6 +489,7 @@ export class DataProcessingContentStack extends cdk.NestedStack {
         memorySize: 1024,
         functionName: `${env.P13N}-personalize-initial-campaign-${env.STAGE}`,
         role: personalizeInitialCampaignRole,
+        layers: [props.lambdaCommonLayer],
         environment: {
           CAMPAIGN_NAME_VIDEO: `fan-appvideo-similar_items-${env.STAGE}`,
           CAMPAIGN_NAME_NEWS: `fan-appnews-similar_items-${env.STAGE}`,
@@ -504,6 +541,89 @@ export class DataProcessingContentStack extends cdk.NestedStack {
       },
     );
 
+    // Define a role for the Lambda checking the status of the Personalize resources
+    const personalizeCheckStatusRole = new iam.Role(this, 'personalizeCheckStatusRole', {
+      assumedBy: new iam.ServicePrincipal('lambda.amazonaws.com'),
+      roleName: `${env.P13N}-personalize-check-status-role-${env.STAGE}`,
+    });
+
+    personalizeCheckStatusRole.addManagedPolicy(
+      iam.ManagedPolicy.fromAwsManagedPolicyName('service-role/AWSLambdaBasicExecutionRole'),
+    );
+
+    // Give the Lambda access to Amazon Personalize
+    personalizeCheckStatusRole.addManagedPolicy(
+      iam.ManagedPolicy.fromAwsManagedPolicyName('service-role/AmazonPersonalizeFullAccess'),
+    );
+
+    // Defines the function polled by the state machines until the Personalize resources are ACTIVE
+    const fanAppPersonalizeCheckStatus = new lambda.Function(this, 'fanAppPersonalizeCheckStatus', {
+      runtime: lambda.Runtime.PYTHON_3_9, // execution environment
+      code: lambda.Code.fromAsset('lib/functions/fan-app-personalize'),
+      handler: 'fan-app-personalize-check-status.handler',
+      tracing: lambda.Tracing.ACTIVE,
+      timeout: cdk.Duration.seconds(60),
+      memorySize: 256,
+      functionName: `${env.P13N}-personalize-check-status-${env.STAGE}`,
+      role: personalizeCheckStatusRole,
+      environment: {
+        STATUS_MAX_ATTEMPTS: '100',
+        STAGE: env.STAGE,
+      },
+    });
+
+    /**
+     * Polling loop moving on to `next` as soon as the resources are ACTIVE:
+     * the check Lambda returns the status and the exponential wait before the next check
+     * @param id prefix of the states
+     * @param check datasets | solutionVersions | datasetGroupImports
+     * @param arns JSON path of the ARNs to check, or the ARNs
+     * @param initialWait first wait between two checks
+     * @param maxWait max wait between two checks
+     * @param next the state following the loop
+     */
+    const waitUntilActive = (
+      id: string,
+      check: string,
+      arns: string | string[],
+      initialWait: cdk.Duration,
+      maxWait: cdk.Duration,
+      next: sfn.IChainable,
+    ): sfn.IChainable => {
+      const startCheck = new sfn.Pass(this, `${id}StartCheck`, {
+        result: sfn.Result.fromObject({ attempt: 0 }),
+        resultPath: '$.statusCheck',
+      });
+      const checkStatus = new tasks.LambdaInvoke(this, `${id}CheckStatus`, {
+        lambdaFunction: fanAppPersonalizeCheckStatus,
+        payload: sfn.TaskInput.fromObject({
+          check,
+          [typeof arns === 'string' ? 'arns.$' : 'arns']: arns,
+          'attempt.$': '$.statusCheck.attempt',
+          initialWaitSeconds: initialWait.toSeconds(),
+          maxWaitSeconds: maxWait.toSeconds(),
+        }),
+        payloadResponseOnly: true,
+        resultPath: '$.statusCheck',
+      });
+      const waitForStatus = new sfn.Wait(this, `${id}Wait`, {
+        time: sfn.WaitTime.secondsPath('$.statusCheck.waitSeconds'),
+      });
+      const isActive = new sfn.Choice(this, `${id}IsActive`)
+        .when(sfn.Condition.stringEquals('$.statusCheck.status', 'ACTIVE'), next)
+        .when(
+          sfn.Condition.stringEquals('$.statusCheck.status', 'PENDING'),
+          waitForStatus.next(checkStatus),
+        )
+        .otherwise(
+          new sfn.Fail(this, `${id}Failed`, {
+            error: 'PersonalizeResourceNotActive',
+            cause: `${check} did not become ACTIVE`,
+          }),
+        );
+      return startCheck.next(checkStatus).next(isActive);
+    };
+
     // INITIAL UPDATE FOR TRON CONTENT AND LOAD TO CONTENT DDB TABLE
     const CMS_CONFIG: cmsEnvConfig = cmsEnvs[env.CMS_ENV];
     const THRON_CONFIG: thronEnvConfig = thronEnvs[env.THRON_ENV];
@@ -524,6 +644,12 @@ export class DataProcessingContentStack extends cdk.NestedStack {
         THRON_ADMIN_HOST: THRON_CONFIG.thronAdminHost,
         THRON_HOST: THRON_CONFIG.thronHost,
         THRON_PUBLIC_FOLDER: THRON_CONFIG.thronPublicFolder,
+        THRON_DETAIL_WORKERS: '8',
+        THRON_MAX_RPS: '20',
+        THRON_PAGE_SIZE: '100',
+        THRON_DETAILS_MODE: 'export',
+        SYNC_STATE_TABLE: props.fanAppSyncStateDdbTable.tableName,
+        THRON_CHECKPOINT_MARGIN_MS: '120000',
         STAGE: env.STAGE,
         ENVIRONMENT_NAME: env.ENVIRONMENT_NAME,
       },
@@ -542,16 +668,21 @@ export class DataProcessingContentStack extends cdk.NestedStack {
       environment: {
         CONTENT_TABLE: content_table.tableName,
         CMS_API_KEY: env.CMS_API_KEY,
+        CMS_MAX_RPS: '5',
         CMS_ENDPOINT: CMS_CONFIG.cmsEndpoint,
         CMS_BASE_PATH: CMS_CONFIG.cmsBasePath,
         CDN_HOST: CMS_CONFIG.cdnHost,
         STAGE: env.STAGE,
         ENVIRONMENT_NAME: env.ENVIRONMENT_NAME,
+        SYNC_MODE: 'initial',
+        SYNC_STATE_TABLE: props.fanAppSyncStateDdbTable.tableName,
       },
     });
 
     content_table.grantReadWriteData(fanAppThronInitialFunction);
+    props.fanAppSyncStateDdbTable.grantReadWriteData(fanAppThronInitialFunction);
     content_table.grantReadWriteData(fanAppCmsNewsInitialFunction);
+    props.fanAppSyncStateDdbTable.grantReadWriteData(fanAppCmsNewsInitialFunction);
 
     /* Granting Lmabda Access  keys and Secrets */
     fanAppThronInitialFunction.role?.attachInlinePolicy(
@@ -574,30 +705,53 @@ export class DataProcessingContentStack extends cdk.NestedStack {
 
     // steps for step function
 
+    // the thron load checkpoints its progress and is invoked again until it is done:
+    // its output, echoing the forceRefresh and pageSize options, is the input of the next invocation
     const fanAppInitialThronLoad = new tasks.LambdaInvoke(this, 'fanAppInitialThronLoad', {
       lambdaFunction: fanAppThronInitialFunction,
+      payloadResponseOnly: true,
     });
 
+    const fanAppInitialThronLoadDone = new sfn.Choice(this, 'fanAppInitialThronLoadDone')
+      .when(sfn.Condition.booleanEquals('$.done', false), fanAppInitialThronLoad)
+      .otherwise(new sfn.Pass(this, 'fanAppInitialThronLoadCompleted'));
+
     const fanAppInitialCmsNewsUpdate = new tasks.LambdaInvoke(this, 'fanAppInitialCmsNewsUpdate', {
       lambdaFunction: fanAppCmsNewsInitialFunction,
     });
 
-    const initialDataLoad = new sfn.Parallel(this, 'initialDataLoad')
-      .branch(fanAppInitialThronLoad)
+    // the branch results are discarded, the next stages get the input of the execution
+    const initialDataLoad = new sfn.Parallel(this, 'initialDataLoad', {
+      resultPath: sfn.JsonPath.DISCARD,
+    })
+      .branch(fanAppInitialThronLoad.next(fanAppInitialThronLoadDone))
       .branch(fanAppInitialCmsNewsUpdate);
 
     // STEP FUNCTION
     // Create the step function for the initial model training
+    // each stage moves on as soon as the Personalize resources it waits for are ACTIVE
     const fanAppInitialImportUserPreferences = new tasks.LambdaInvoke(
       this,
       'fanAppInitialImportUserPreferences',
       {
         lambdaFunction: initUserPreferencesDataImportFunction,
+        payloadResponseOnly: true,
+      },
+    );
+
+    const fanAppInitialImportUserPreferencesJob = new tasks.LambdaInvoke(
+      this,
+      'fanAppInitialImportUserPreferencesJob',
+      {
+        lambdaFunction: initUserPreferencesDataImportJobFunction,
+        payloadResponseOnly: true,
       },
     );
 
+    // the job creates the interactions datasets and their import jobs, the state waits for its end
     const fanAppInitialGlueJob = new tasks.GlueStartJobRun(this, 'fanAppInitialGlueJob', {
       glueJobName: `${env.P13N}-user-behaviour-job-${env.STAGE}`,
+      integrationPattern: sfn.IntegrationPattern.RUN_JOB,
     });
 
     const fanAppInitialImportContentData = new tasks.LambdaInvoke(
@@ -605,17 +759,47 @@ export class DataProcessingContentStack extends cdk.NestedStack {
       'fanAppInitialImportContentData',
       {
         lambdaFunction: contentInitialIngestionLambda,
+        payloadResponseOnly: true,
       },
     );
 
-    const initialDataImport = new sfn.Parallel(this, 'initialDataImport')
-      .branch(fanAppInitialImportUserPreferences)
-      .branch(fanAppInitialGlueJob)
-      .branch(fanAppInitialImportContentData);
+    const fanAppInitialImportContentDataJob = new tasks.LambdaInvoke(
+      this,
+      'fanAppInitialImportContentDataJob',
+      {
+        lambdaFunction: contentInitialImportJobLambda,
+        payloadResponseOnly: true,
+      },
+    );
 
-    const waitForInitialImport = new sfn.Wait(this, 'fanAppInitialWaitForInitialImport', {
-      time: sfn.WaitTime.duration(cdk.Duration.seconds(900)),
-    });
+    const initialDataImport = new sfn.Parallel(this, 'initialDataImport', {
+      resultPath: sfn.JsonPath.DISCARD,
+    })
+      .branch(
+        fanAppInitialImportUserPreferences.next(
+          waitUntilActive(
+            'fanAppInitialUsersDatasets',
+            'datasets',
+            '$.datasetArns',
+            cdk.Duration.seconds(10),
+            cdk.Duration.seconds(60),
+            fanAppInitialImportUserPreferencesJob,
+          ),
+        ),
+      )
+      .branch(fanAppInitialGlueJob)
+      .branch(
+        fanAppInitialImportContentData.next(
+          waitUntilActive(
+            'fanAppInitialItemsDatasets',
+            'datasets',
+            '$.datasetArns',
+            cdk.Duration.seconds(10),
+            cdk.Duration.seconds(60),
+            fanAppInitialImportContentDataJob,
+          ),
+        ),
+      );
 
     const createSolutionVersion = new tasks.LambdaInvoke(
       this,
@@ -627,10 +811,6 @@ export class DataProcessingContentStack extends cdk.NestedStack {
       },
     );
 
-    const waitForSolutionVersion = new sfn.Wait(this, 'fanAppInitialWaitForSolutionVersion', {
-      time: sfn.WaitTime.duration(cdk.Duration.seconds(1800)),
-    });
-
     const createUpdateCampaign = new tasks.LambdaInvoke(this, 'fanAppInitialCreateUpdateCampaign', {
       lambdaFunction: fanAppPersonalizeInitialCampaign,
       // Lambda's returned result
@@ -645,16 +825,34 @@ export class DataProcessingContentStack extends cdk.NestedStack {
 
     const endExecution = new sfn.Succeed(this, 'fanAppInitialReportSuccess');
 
+    // the solution versions are trained once all the import jobs of both dataset groups are ACTIVE
+    const waitForInitialImport = waitUntilActive(
+      'fanAppInitialImport',
+      'datasetGroupImports',
+      [
+        props.fanAppPersonalisationVideoDatasetGroup.attrDatasetGroupArn,
+        props.fanAppPersonalisationNewsDatasetGroup.attrDatasetGroupArn,
+      ],
+      cdk.Duration.seconds(60),
+      cdk.Duration.seconds(300),
+      createSolutionVersion,
+    );
+
+    // the campaigns are created once the solution versions ($.Payload) are ACTIVE
+    createSolutionVersion.next(
+      waitUntilActive(
+        'fanAppInitialSolutionVersion',
+        'solutionVersions',
+        '$.Payload',
+        cdk.Duration.seconds(120),
+        cdk.Duration.seconds(600),
+        createUpdateCampaign.next(createEventTracker).next(endExecution),
+      ),
+    );
+
     //const stateMachine =
     new sfn.StateMachine(this, 'fanAppInitialPersonalizeStateMachine', {
-      definition: initialDataLoad
-        .next(initialDataImport)
-        .next(waitForInitialImport)
-        .next(createSolutionVersion)
-        .next(waitForSolutionVersion)
-        .next(createUpdateCampaign)
-        .next(createEventTracker)
-        .next(endExecution),
+      definition: initialDataLoad.next(initialDataImport).next(waitForInitialImport),
       stateMachineName: `${env.P13N}-personalize-initial-state-machine-${env.STAGE}`,
     });
 
@@ -694,6 +892,7 @@ export class DataProcessingContentStack extends cdk.NestedStack {
         timeout: cdk.Duration.seconds(600),
         functionName: `${env.P13N}-personalize-update-solution-${env.STAGE}`,
         role: personalizeUpdateSolutionRole,
+        layers: [props.lambdaCommonLayer],
         environment: {
           STAGE: env.STAGE,
           ENVIRONMENT_NAME: env.ENVIRONMENT_NAME,
@@ -734,6 +933,7 @@ export class DataProcessingContentStack extends cdk.NestedStack {
         timeout: cdk.Duration.seconds(600),
         functionName: `${env.P13N}-personalize-update-campaign-${env.STAGE}`,
         role: personalizeUpdateCampaignRole,
+        layers: [props.lambdaCommonLayer],
         environment: {
           STAGE: env.STAGE,
           ENVIRONMENT_NAME: env.ENVIRONMENT_NAME,
@@ -748,10 +948,6 @@ export class DataProcessingContentStack extends cdk.NestedStack {
       resultPath: '$',
     });
 
-    const waitForNewSolutionVersion = new sfn.Wait(this, 'fanAppUpdateWaitForSolutionVersion', {
-      time: sfn.WaitTime.duration(cdk.Duration.seconds(1800)),
-    });
-
     const updateCampaign = new tasks.LambdaInvoke(this, 'fanAppUpdateCampaign', {
       lambdaFunction: fanAppPersonalizeUpdateCampaign,
       // Lambda's returned result
@@ -760,12 +956,19 @@ export class DataProcessingContentStack extends cdk.NestedStack {
 
     const endUpdateExecution = new sfn.Succeed(this, 'fanAppUpdateReportSuccess');
 
+    // the campaigns are updated once the new solution versions ($.Payload) are ACTIVE
+    const waitForNewSolutionVersion = waitUntilActive(
+      'fanAppUpdateSolutionVersion',
+      'solutionVersions',
+      '$.Payload',
+      cdk.Duration.seconds(120),
+      cdk.Duration.seconds(600),
+      updateCampaign.next(endUpdateExecution),
+    );
+
     //const stateMachine =
     const UpdateStateMachine = new sfn.StateMachine(this, 'fanAppUpdatePersonalizeStateMachine', {
-      definition: createNewSolutionVersion
-        .next(waitForNewSolutionVersion)
-        .next(updateCampaign)
-        .next(endUpdateExecution),
+      definition: createNewSolutionVersion.next(waitForNewSolutionVersion),
       stateMachineName: `${env.P13N}-personalize-update-state-machine-${env.STAGE}`,
     });
 
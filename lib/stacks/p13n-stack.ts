@@ -21,6 +21,7 @@ export class FanAppPersonalizationStack extends cdk.Stack {
   public readonly fanAppPersonalisationNewsDatasetGroup: personalize.CfnDatasetGroup;
   public readonly fanAppContentDdbTable: dynamodb.Table;
   public readonly fanAppContentDdbTableName: string;
+  public readonly fanAppSyncStateDdbTable: dynamodb.Table;
   public readonly commonLambdaLayer: lambdapython.PythonLayerVersion;
 
   constructor(scope: cdk.App, id: string, props: cdk.StackProps) {
@@ -37,6 +38,14 @@ export class FanAppPersonalizationStack extends cdk.Stack {
 
     this.fanAppContentDdbTable = fanAppContentTable;
 
+    // DynamoDB table for storing the checkpoints and watermarks of the content ingestion
+    this.fanAppSyncStateDdbTable = new dynamodb.Table(this, 'fanAppSyncStateTable', {
+      partitionKey: { name: 'syncId', type: dynamodb.AttributeType.STRING },
+      sortKey: { name: 'recordId', type: dynamodb.AttributeType.STRING },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      tableName: `${env.P13N}-content-sync-state-${env.STAGE}`,
+    });
+
     // Create the S3 bucket to store raw user behaviour data
     // This buckets are not removed after stack destroy
     const fanAppPersonaliseBucket = new s3.Bucket(this, 'fanAppPersonalisationBucket', {
@@ -0,0 +1,89 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+
+"""Decoding of the DynamoDB json"""
+import os
+import sys
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'lib', 'pythonlayers', 'common'))
+
+import pytest
+from boto3.dynamodb.types import TypeSerializer
+
+from common_ddb_json_util import decode_item, decode_items, decode_value
+
+ITEM = {
+    'contentId': 'video/1',
+    'durationMs': 120000,
+    'ratio': 1.5,
+    'big': 12345678901234567890,
+    'published': True,
+    'thumb': None,
+    'lastUpdate': '2022-12-23T15:37:53.853Z',
+    'contentMetadata': {'tags': 'a|b', 'durationMs': 90500, 'nested': {'list': [1, 'two', {'three': 3.25}, []]}},
+    'answers': [{'questionId': 'FAVORITE_DRIVER', 'values': ['charles_leclerc', 'carlos_sainz']}],
+    'empty': {},
+}
+
+
+def serialize(value):
+    # the serializer asks for Decimal numbers, as the low level client sends them
+    if isinstance(value, float):
+        value = Decimal(str(value))
+    elif isinstance(value, dict):
+        value = {key: serialize(item) for key, item in value.items()}
+    elif isinstance(value, list):
+        value = [serialize(item) for item in value]
+    return value
+
+
+def to_ddb_json(item):
+    serializer = TypeSerializer()
+    return {key: serializer.serialize(serialize(value)) for key, value in item.items()}
+
+
+def test_item_round_trip():
+    decoded = decode_item(to_ddb_json(ITEM))
+    assert decoded == ITEM
+    assert type(decoded['durationMs']) is int and type(decoded['ratio']) is float
+    # date-like strings stay strings
+    assert decoded['lastUpdate'] == '2022-12-23T15:37:53.853Z'
+
+
+def test_stream_new_image():
+    newImage = {'contentId': {'S': 'news/published/slug'}, 'contentType': {'S': 'news'},
+                'contentMetadata': {'M': {'durationMs': {'N': '0'}, 'place': {'S': ''},
+                                          'score': {'N': '-1.5E+2'}, 'flags': {'NULL': True}}}}
+    assert decode_item(newImage) == {'contentId': 'news/published/slug', 'contentType': 'news',
+                                     'contentMetadata': {'durationMs': 0, 'place': '', 'score': -150.0, 'flags': None}}
+
+
+def test_sets_are_decoded_as_lists():
+    assert sorted(decode_value({'SS': ['b', 'a']})) == ['a', 'b']
+    assert sorted(decode_value({'NS': ['2', '1.5']})) == [1.5, 2]
+    assert decode_value({'BS': [b'x']}) == [b'x']
+    assert decode_value({'B': b'x'}) == b'x'
+
+
+def test_scan_page():
+    assert decode_items([to_ddb_json({'contentId': str(i), 'n': i}) for i in range(3)]) == \
+        [{'contentId': str(i), 'n': i} for i in range(3)]
+
+
+@pytest.mark.parametrize('value', [{'Z': 'x'}, {}])
+def test_invalid_values_raise(value):
+    with pytest.raises(ValueError):
+        decode_value(value)
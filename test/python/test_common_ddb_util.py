@@ -0,0 +1,157 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+"""BulkWriter against a moto DynamoDB table"""
+import os
+import sys
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'lib', 'pythonlayers', 'common'))
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+import common_ddb_util
+
+TABLE = 'content'
+
+
+class FailingClient:
+    '''
+    Fails the first BatchWriteItem request writing `failingId`
+    '''
+
+    def __init__(self, client, failingId):
+        self.client = client
+        self.failingId = failingId
+        self.failed = False
+
+    def batch_write_item(self, RequestItems):
+        ids = [request['PutRequest']['Item']['contentId'] for request in RequestItems[TABLE]]
+        if not self.failed and self.failingId in ids:
+            self.failed = True
+            raise ClientError({'Error': {'Code': 'ValidationException', 'Message': 'boom'}}, 'BatchWriteItem')
+        return self.client.batch_write_item(RequestItems=RequestItems)
+
+
+class UnprocessedClient:
+    '''
+    Leaves the first `unprocessed` items of each of the first `times` requests unprocessed
+    '''
+
+    def __init__(self, client, unprocessed=5, times=2):
+        self.client = client
+        self.unprocessed = unprocessed
+        self.times = times
+        self.requests = []
+
+    def batch_write_item(self, RequestItems):
+        requests = RequestItems[TABLE]
+        self.requests.append([request['PutRequest']['Item']['contentId'] for request in requests])
+        if len(self.requests) > self.times:
+            return self.client.batch_write_item(RequestItems=RequestItems)
+        if requests[self.unprocessed:]:
+            self.client.batch_write_item(RequestItems={TABLE: requests[self.unprocessed:]})
+        return {'UnprocessedItems': {TABLE: requests[:self.unprocessed]}}
+
+
+@pytest.fixture
+def table():
+    with mock_aws():
+        common_ddb_util.dynamodb = boto3.resource('dynamodb')
+        yield common_ddb_util.dynamodb.create_table(
+            TableName=TABLE, KeySchema=[{'AttributeName': 'contentId', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'contentId', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST')
+
+
+def test_failed_batch_is_reported_once_and_the_buffer_drains(table):
+    errors = []
+    writer = common_ddb_util.BulkWriter(TABLE, ('contentId',), workers=2)
+    try:
+        with writer:
+            writer._client = FailingClient(writer._client, 'id3')
+            for i in range(450):
+                try:
+                    writer.put_item(Item={'contentId': f'id{i}'})
+                except common_ddb_util.BatchWriteError as e:
+                    errors.append(e)
+            try:
+                writer.flush()
+            except common_ddb_util.BatchWriteError as e:
+                errors.append(e)
+    except common_ddb_util.BatchWriteError as e:
+        errors.append(e)
+    # the failed batch (the first 25 items) is reported once, whoever raises it
+    assert len(errors) == 1
+    assert sorted(errors[0].keys) == sorted((f'id{i}',) for i in range(25))
+    assert writer.stats['failed'] == 25
+    assert writer._buffer == {} and writer._inFlight == []
+    stored = {item['contentId'] for item in table.scan()['Items']}
+    assert stored == {f'id{i}' for i in range(25, 450)}
+
+
+def test_failure_of_the_last_batches_is_raised_on_exit(table):
+    writer = common_ddb_util.BulkWriter(TABLE, ('contentId',), workers=2)
+    with pytest.raises(common_ddb_util.BatchWriteError) as error:
+        with writer:
+            writer._client = FailingClient(writer._client, 'id3')
+            for i in range(10):
+                writer.put_item(Item={'contentId': f'id{i}'})
+    assert sorted(error.value.keys) == sorted((f'id{i}',) for i in range(10))
+    assert writer._inFlight == []
+
+
+def test_unprocessed_items_are_retried_with_backoff(table, monkeypatch):
+    delays = []
+    monkeypatch.setattr(common_ddb_util.time, 'sleep', delays.append)
+    with common_ddb_util.BulkWriter(TABLE, ('contentId',), workers=1) as writer:
+        writer._client = UnprocessedClient(writer._client)
+        for i in range(10):
+            writer.put_item(Item={'contentId': f'id{i}'})
+    # the unprocessed items only are sent again, after a growing delay
+    assert writer._client.requests == [[f'id{i}' for i in range(10)], [f'id{i}' for i in range(5)],
+                                       [f'id{i}' for i in range(5)]]
+    # full jitter: up to 0.05s, then up to 0.1s
+    assert len(delays) == 2 and 0 <= delays[0] <= 0.05 and 0 <= delays[1] <= 0.1
+    assert writer.stats['throttles'] == 2 and writer.stats['items'] == 10 and writer.stats['batches'] == 1
+    assert {item['contentId'] for item in table.scan()['Items']} == {f'id{i}' for i in range(10)}
+
+
+def test_unprocessed_items_fail_after_max_retries(table, monkeypatch):
+    monkeypatch.setattr(common_ddb_util.time, 'sleep', lambda seconds: None)
+    writer = common_ddb_util.BulkWriter(TABLE, ('contentId',), workers=1, maxRetries=3)
+    with pytest.raises(common_ddb_util.BatchWriteError) as error:
+        with writer:
+            writer._client = UnprocessedClient(writer._client, times=10)
+            for i in range(10):
+                writer.put_item(Item={'contentId': f'id{i}'})
+    assert isinstance(error.value.errors[0], RuntimeError)
+    assert len(writer._client.requests) == 4
+
+
+def test_same_key_puts_are_deduplicated_last_one_wins(table):
+    with common_ddb_util.BulkWriter(TABLE, ('contentId',), workers=2) as writer:
+        client = writer._client = UnprocessedClient(writer._client, times=0)
+        for i in range(30):
+            writer.put_item(Item={'contentId': f'id{i % 10}', 'version': i})
+    # a BatchWriteItem request with twice the same key would be rejected
+    assert client.requests == [[f'id{i}' for i in range(10)]]
+    assert writer.stats['duplicates'] == 20
+    stored = {item['contentId']: item['version'] for item in table.scan()['Items']}
+    assert stored == {f'id{i}': 20 + i for i in range(10)}
@@ -0,0 +1,187 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+
+"""HTTPSConnectionPool against a local http server"""
+import gzip
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'lib', 'pythonlayers', 'common'))
+
+import pytest
+
+import common_http_client_util as httpclientUtil
+from common_json_stream_util import JsonItemsStream
+from common_rate_limit_util import AdaptiveRateLimiter
+
+DOCUMENT = {'items': [{'id': i, 'name': f'content {i}', 'durationMs': i * 1.5} for i in range(2000)],
+            'nextPage': 'cursor'}
+BODY = json.dumps(DOCUMENT).encode('utf-8')
+
+
+def raw_deflate(data):
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+ENCODINGS = {
+    'gzip': gzip.compress,
+    'deflate': zlib.compress,
+    'raw-deflate': raw_deflate,
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, dict(self.headers)))
+            status = server.statuses.pop(0) if server.statuses else 200
+            delay = server.delays.pop(0) if server.delays else 0
+        time.sleep(delay)
+        headers = {}
+        body = BODY
+        encoding = self.path.strip('/')
+        if encoding in ENCODINGS:
+            body = ENCODINGS[encoding](BODY)
+            headers['Content-Encoding'] = 'deflate' if encoding == 'raw-deflate' else encoding
+        if status != 200:
+            body = b'{"error":"throttled"}'
+            headers = {'Retry-After': '0'}
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.statuses = []
+    server.delays = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class LocalConnectionPool(httpclientUtil.HTTPSConnectionPool):
+    '''
+    Plain http connections to the local server
+    '''
+
+    def _new_conn(self):
+        self.connections = getattr(self, 'connections', 0) + 1
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+
+def pool(server, **kwargs):
+    return LocalConnectionPool('127.0.0.1', server.server_address[1], **kwargs)
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'deflate', 'raw-deflate', 'identity'])
+def test_compressed_bodies_are_decoded(server, encoding):
+    connectionPool = pool(server)
+    status, data = connectionPool.request('GET', f'/{encoding}')
+    assert status == 200 and data == BODY
+    assert server.requests[0][1]['Accept-Encoding'] == 'gzip, deflate'
+
+
+def test_compressed_body_is_streamed_by_bounded_reads(server):
+    connectionPool = pool(server)
+    with connectionPool.urlopen('GET', '/gzip') as res:
+        assert isinstance(res, httpclientUtil.DecodedResponse)
+        stream = JsonItemsStream(res, chunkSize=1024)
+        assert list(stream) == DOCUMENT['items']
+        assert stream.finish() == {'nextPage': 'cursor'}
+        # far less than the decompressed body went over the wire
+        assert res.compressedBytes < len(BODY) / 3
+    # completely read: the connection is reused
+    connectionPool.request('GET', '/gzip')
+    assert connectionPool.connections == 1
+
+
+def test_decoded_reads_never_exceed_the_amount_asked(server):
+    with pool(server).urlopen('GET', '/deflate') as res:
+        chunks = list(iter(lambda: res.read(100), b''))
+    assert b''.join(chunks) == BODY
+    assert max(len(chunk) for chunk in chunks) <= 100
+
+
+def test_without_compression_nothing_is_negotiated(server):
+    status, data = pool(server, compression=False).request('GET', '/identity')
+    assert status == 200 and data == BODY
+    assert 'Accept-Encoding' not in server.requests[0][1] or \
+        server.requests[0][1]['Accept-Encoding'] == 'identity'
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(httpclientUtil, 'backoff_delay', lambda attempt: 0)
+
+
+def test_throttled_requests_are_retried_and_slow_down_the_rate(server, no_backoff):
+    server.statuses = [418, 429, 503]
+    rateLimiter = AdaptiveRateLimiter(100, minRate=1, cooldown=0)
+    status, data = pool(server, rateLimiter=rateLimiter).request('GET', '/identity')
+    assert status == 200 and data == BODY
+    assert len(server.requests) == 4
+    assert rateLimiter.throttles == 3 and rateLimiter.rate < 100 * 0.5 ** 2
+
+
+def test_last_response_is_returned_once_the_retries_are_exhausted(server, no_backoff):
+    server.statuses = [418] * 3
+    connectionPool = pool(server, maxRetries=2)
+    with connectionPool.urlopen('GET', '/identity') as res:
+        assert res.status == 418
+        with pytest.raises(httpclientUtil.HttpStatusError) as error:
+            httpclientUtil.raise_for_status(res)
+    assert error.value.status == 418
+    assert len(server.requests) == 3
+
+
+def test_not_retryable_status_is_returned_at_once(server, no_backoff):
+    server.statuses = [404]
+    status, _ = pool(server).request('GET', '/identity')
+    assert status == 404 and len(server.requests) == 1
+
+
+def test_read_timeouts_are_retried_on_a_new_connection(server, no_backoff):
+    server.delays = [0.5]
+    connectionPool = pool(server, timeout=0.2)
+    status, data = connectionPool.request('GET', '/identity')
+    assert status == 200 and data == BODY
+    assert connectionPool.connections == 2
+
+
+def test_retryable_errors_include_the_python_3_9_socket_timeout():
+    import socket
+    assert socket.timeout in httpclientUtil.RETRYABLE_ERRORS
+    assert TimeoutError in httpclientUtil.RETRYABLE_ERRORS
@@ -0,0 +1,75 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+
+"""JsonItemsStream fed with small chunks"""
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'lib', 'pythonlayers', 'common'))
+
+import pytest
+
+from common_json_stream_util import JsonItemsStream
+
+DOCUMENT = {
+    'count': 1.5e10,
+    'items': [
+        1.5, -0.25, 2e3, 1.5E-3, 12345678901234567890, 0, -7, True, False, None,
+        {'id': 'a', 'durationMs': 120000.5, 'ratio': 6.02e+23, 'tags': ['x', 'é€'], 'empty': {}},
+        [1.0, 2e10, [3.25]], 'texte "quoté" 1.5e10', '',
+    ],
+    'score': -3.5e-7,
+    'nextPage': 'cursor',
+}
+
+
+class ChunkedReader(io.BytesIO):
+    '''
+    Returns at most `size` bytes a read whatever the amount asked, like a socket
+    '''
+
+    def __init__(self, data, size):
+        super().__init__(data)
+        self.size = size
+
+    def read(self, amount=-1):
+        return super().read(self.size)
+
+
+@pytest.mark.parametrize('separators', [(',', ':'), (', ', ': ')])
+@pytest.mark.parametrize('chunkSize', [1, 2, 3, 5, 7, 11, 64])
+def test_items_and_fields_whatever_the_chunk_size(chunkSize, separators):
+    data = json.dumps(DOCUMENT, separators=separators, ensure_ascii=False).encode('utf-8')
+    stream = JsonItemsStream(ChunkedReader(data, chunkSize), chunkSize=chunkSize)
+    assert list(stream) == DOCUMENT['items']
+    assert stream.finish() == {key: value for key, value in DOCUMENT.items() if key != 'items'}
+    assert stream.itemCount == len(DOCUMENT['items'])
+
+
+@pytest.mark.parametrize('chunkSize', [1, 2, 4])
+@pytest.mark.parametrize('number', ['1.5', '1.55', '1e10', '1.5e10', '1.5E-10', '-12.75', '10', '2.0e+3'])
+def test_numbers_split_across_chunks(chunkSize, number):
+    data = ('{"items":[' + number + ',' + number + '],"total":' + number + '}').encode('utf-8')
+    stream = JsonItemsStream(ChunkedReader(data, chunkSize), chunkSize=chunkSize)
+    assert list(stream) == [json.loads(number)] * 2
+    assert stream.finish() == {'total': json.loads(number)}
+
+
+def test_invalid_document_raises():
+    stream = JsonItemsStream(ChunkedReader(b'{"items":[1.5x]}', 3), chunkSize=3)
+    with pytest.raises(json.JSONDecodeError):
+        list(stream)
@@ -0,0 +1,144 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+
+"""Personalize events client with its token buckets"""
+import os
+import sys
+import threading
+import time
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'lib', 'pythonlayers', 'common'))
+
+import pytest
+from botocore.exceptions import ClientError
+
+import common_personalize_events_util
+from common_personalize_events_util import PersonalizeEventsClient, calls_needed, coalesce, failed_record_indexes
+
+
+class SlowClient:
+    '''
+    Answers the put_* calls after `latency` seconds, throttling the first `throttles` ones
+    '''
+
+    def __init__(self, latency=0.05, throttles=0, error=None):
+        self.latency = latency
+        self.throttles = throttles
+        self.error = error
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _put(self, **request):
+        with self._lock:
+            self.calls.append((time.monotonic(), request))
+            throttled = len(self.calls) <= self.throttles
+        time.sleep(self.latency)
+        if throttled:
+            raise ClientError({'Error': {'Code': 'ThrottlingException'}}, 'PutItems')
+        if self.error:
+            raise ClientError({'Error': {'Code': self.error}}, 'PutItems')
+        return {}
+
+    put_items = put_users = _put
+
+
+def test_records_are_sent_ten_per_call():
+    client = SlowClient(latency=0)
+    events = PersonalizeEventsClient(client=client, rates={'put_items': 1000})
+    futures = events.put_items('dataset', [{'itemId': str(i)} for i in range(25)])
+    assert [future.result() for future in futures] == [{}] * 3
+    assert sorted(len(request['items']) for _, request in client.calls) == [5, 10, 10]
+    assert all(request['datasetArn'] == 'dataset' for _, request in client.calls)
+    assert events.stats['calls'] == 3 and events.stats['records'] == 25
+
+
+def test_calls_are_concurrent_within_the_rate():
+    client = SlowClient(latency=0.2)
+    events = PersonalizeEventsClient(client=client, workers=4, rates={'put_items': 20, 'put_users': 20})
+    startedAt = time.monotonic()
+    futures = events.put_items('items', [{'itemId': str(i)} for i in range(40)]) + \
+        events.put_users('users', [{'userId': str(i)} for i in range(40)])
+    for future in futures:
+        future.result()
+    # 8 calls of 0.2s: 1.6s one after the other, one bucket per API at 20 calls/s
+    assert time.monotonic() - startedAt < 0.8
+    # the 4 put_items calls are spread over 3 intervals of 1/20s
+    starts = sorted(at for at, request in client.calls if 'items' in request)
+    assert starts[-1] - starts[0] >= 0.14
+
+
+def test_throttled_calls_are_retried(monkeypatch):
+    monkeypatch.setattr(common_personalize_events_util, 'backoff_delay', lambda attempt: 0)
+    client = SlowClient(latency=0, throttles=2)
+    events = PersonalizeEventsClient(client=client, workers=1, rates={'put_users': 1000})
+    future, = events.put_users('users', [{'userId': '1'}])
+    assert future.result() == {}
+    assert len(client.calls) == 3 and events.stats['throttles'] == 2 and events.stats['calls'] == 1
+
+
+def test_other_errors_fail_the_call():
+    client = SlowClient(latency=0, error='InvalidInputException')
+    events = PersonalizeEventsClient(client=client, rates={'put_items': 1000})
+    future, = events.put_items('items', [{'itemId': '1'}])
+    with pytest.raises(ClientError):
+        future.result()
+    assert len(client.calls) == 1
+
+
+@pytest.mark.parametrize('records, calls', [(0, 0), (1, 1), (10, 1), (11, 2), (20, 2), (95, 10)])
+def test_calls_needed(records, calls):
+    assert calls_needed(records) == calls
+
+
+def test_coalesce_keeps_the_last_write_of_each_key_in_the_order_of_the_last_writes():
+    records = [('1', 'a', 'v1'), ('2', 'b', 'v1'), ('3', 'a', 'v2'), ('4', 'c', 'v1'), ('5', 'b', 'v2')]
+    assert coalesce(records, lambda record: record[1]) == [('3', 'a', 'v2'), ('4', 'c', 'v1'), ('5', 'b', 'v2')]
+
+
+def test_coalesced_batch_needs_fewer_calls():
+    client = SlowClient(latency=0)
+    events = PersonalizeEventsClient(client=client, rates={'put_items': 1000})
+    # 100 updates of 25 items
+    records = [{'itemId': str(i % 25), 'version': i} for i in range(100)]
+    kept = coalesce(records, lambda record: record['itemId'])
+    futures = events.put_items('items', kept)
+    for future in futures:
+        future.result()
+    assert len(kept) == 25 and len(futures) == calls_needed(25) == 3 < calls_needed(len(records))
+    assert {item['itemId']: item['version'] for _, request in client.calls for item in request['items']} == \
+        {str(i): 75 + i for i in range(25)}
+
+
+class FailingItemClient(SlowClient):
+    '''
+    Rejects the calls sending the item `failingId`
+    '''
+
+    def __init__(self, failingId):
+        super().__init__(latency=0)
+        self.failingId = failingId
+
+    def put_items(self, **request):
+        if any(item['itemId'] == self.failingId for item in request['items']):
+            raise ClientError({'Error': {'Code': 'InvalidInputException'}}, 'PutItems')
+        return self._put(**request)
+
+
+def test_failed_record_indexes_maps_the_failed_calls_to_their_records():
+    events = PersonalizeEventsClient(client=FailingItemClient('27'), rates={'put_items': 1000})
+    futures = events.put_items('items', [{'itemId': str(i)} for i in range(35)])
+    # the third call sends the records 20 to 29
+    assert failed_record_indexes(futures, 35) == list(range(20, 30))
@@ -0,0 +1,80 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+
+"""Bounded producer/consumer pipeline"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'lib', 'pythonlayers', 'common'))
+
+from common_pipeline_util import read_pages_in_parallel
+
+
+def test_single_reader_pages_are_returned_in_order():
+    pages = list(read_pages_in_parallel([lambda: iter(range(10))], 1, prefetch=2))
+    assert pages == list(range(10))
+
+
+def test_pages_of_all_the_readers_are_returned():
+    readers = [lambda start=start: iter(range(start, start + 5)) for start in (0, 100, 200)]
+    pages = list(read_pages_in_parallel(readers, 2))
+    assert sorted(pages) == list(range(0, 5)) + list(range(100, 105)) + list(range(200, 205))
+
+
+def test_reader_stays_at_most_prefetch_pages_ahead():
+    read = []
+
+    def reader():
+        for page in range(20):
+            read.append(page)
+            yield page
+
+    timings = {}
+    for page in read_pages_in_parallel([reader], 1, prefetch=3, timings=timings):
+        time.sleep(0.01)
+        # the queued pages plus the one waiting to be queued
+        assert len(read) - page - 1 <= 4
+    assert timings['blockedSeconds'] > 0 and 'waitingSeconds' in timings
+
+
+def test_reader_error_is_raised_to_the_consumer():
+    def reader():
+        yield 1
+        raise ValueError('page 2 failed')
+
+    pages = read_pages_in_parallel([reader], 1)
+    assert next(pages) == 1
+    with pytest.raises(ValueError, match='page 2 failed'):
+        next(pages)
+
+
+def test_reader_stops_when_the_consumer_stops():
+    stoppedAt = threading.Event()
+
+    def reader():
+        try:
+            for page in range(1000):
+                yield page
+        finally:
+            stoppedAt.set()
+
+    pages = read_pages_in_parallel([reader], 1, prefetch=1)
+    assert next(pages) == 0
+    pages.close()
+    assert stoppedAt.wait(5)
@@ -0,0 +1,64 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+
+"""Token bucket and AIMD rate limiter"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'lib', 'pythonlayers', 'common'))
+
+from common_rate_limit_util import AdaptiveRateLimiter, TokenBucket, backoff_delay
+
+
+def test_token_bucket_paces_the_calls_of_all_the_threads():
+    bucket = TokenBucket(50)
+    startedAt = time.monotonic()
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda _: bucket.acquire(), range(26)))
+    # one token in the bucket, then 25 calls at 50 calls/s
+    assert 0.45 <= time.monotonic() - startedAt < 1
+
+
+def test_adaptive_rate_halves_on_throttle_once_per_cooldown():
+    rateLimiter = AdaptiveRateLimiter(20, minRate=4, cooldown=60)
+    rateLimiter.on_throttle()
+    rateLimiter.on_throttle()
+    assert rateLimiter.rate == 10 and rateLimiter.throttles == 2
+
+
+def test_adaptive_rate_never_goes_below_the_min_rate():
+    rateLimiter = AdaptiveRateLimiter(20, minRate=4, cooldown=0)
+    for _ in range(10):
+        rateLimiter.on_throttle()
+    assert rateLimiter.rate == 4
+
+
+def test_adaptive_rate_grows_back_up_to_the_max_rate():
+    rateLimiter = AdaptiveRateLimiter(20, minRate=1, cooldown=0)
+    rateLimiter.on_throttle()
+    previous = rateLimiter.rate
+    rateLimiter.on_success()
+    assert previous < rateLimiter.rate < 20
+    for _ in range(1000):
+        rateLimiter.on_success()
+    assert rateLimiter.rate == 20
+
+
+def test_backoff_delay_is_jittered_and_capped():
+    delays = [backoff_delay(attempt, base=0.1, maxDelay=1) for attempt in range(10) for _ in range(20)]
+    assert all(0 <= delay <= 1 for delay in delays)
+    assert all(backoff_delay(0, base=0.1) <= 0.1 for _ in range(100))
@@ -0,0 +1,145 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+
+"""Items datasets CSVs built from a DynamoDB table export"""
+import csv
+import gzip
+import importlib.util
+import io
+import json
+import os
+import sys
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.update(P13N='p13n', STAGE='test', ENVIRONMENT_NAME='test', VIDEO_GROUP_ARN='videos-group',
+                  NEWS_GROUP_ARN='news-group', CONTENT_BUCKET='content-bucket', ROLE_IMPORT='role',
+                  CONTENT_TABLE='content')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'lib', 'pythonlayers', 'common'))
+
+import boto3
+import pytest
+from boto3.dynamodb.types import TypeSerializer
+from moto import mock_aws
+
+HANDLER = os.path.join(os.path.dirname(__file__), '..', '..', 'lib', 'functions', 'data-preparation',
+                       'content_data_ingestion.py')
+
+ITEMS = [
+    {'contentId': 'video/1', 'contentType': 'video', 'contentMetadata': {
+        'description': 'Lap of Monza', 'durationMs': 120000, 'thumb': 'v1.jpg', 'name_title': 'Monza', 'tags': 'f1|monza'}},
+    {'contentId': 'news/1', 'contentType': 'news', 'contentMetadata': {
+        'channel': 'fan-app-news', 'place': '', 'thumb': 'n1.jpg', 'name_title': 'News, "quoted"', 'tags': ''}},
+    {'contentId': 'video/2', 'contentType': 'video', 'contentMetadata': {
+        'description': '', 'durationMs': 90500, 'thumb': 'v2.jpg', 'name_title': 'Maranello', 'tags': 'sf'}},
+    # skipped: no contentId
+    {'contentId': '', 'contentType': 'video', 'contentMetadata': {}},
+]
+
+
+def export_lines(items):
+    serialize = TypeSerializer().serialize
+    return ''.join(json.dumps({'Item': {key: serialize(value) for key, value in item.items()}}) + '\n'
+                   for item in items).encode('utf-8')
+
+
+def read_csv(bucket, key):
+    body = boto3.client('s3').get_object(Bucket=bucket, Key=key)['Body'].read().decode('utf-8')
+    return list(csv.DictReader(io.StringIO(body)))
+
+
+@pytest.fixture
+def handler():
+    with mock_aws():
+        boto3.client('s3').create_bucket(Bucket='content-bucket',
+                                         CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'})
+        spec = importlib.util.spec_from_file_location('content_data_ingestion', HANDLER)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.create_personalize_dataset = lambda bucket, name, datasetGroupArn, schema: f'{name}-dataset'
+        yield module
+
+
+def check_rows():
+    videos = read_csv('content-bucket', 'video-content-meta.csv')
+    assert sorted(videos, key=lambda row: row['ITEM_ID']) == [
+        {'ITEM_ID': 'video/1', 'CONTENT_TYPE': 'video', 'DESCRIPTION': 'Lap of Monza', 'DURATION': '120000',
+         'THUMB': 'v1.jpg', 'NAME_TITLE': 'Monza', 'TAGS': 'f1|monza'},
+        {'ITEM_ID': 'video/2', 'CONTENT_TYPE': 'video', 'DESCRIPTION': '-', 'DURATION': '90500',
+         'THUMB': 'v2.jpg', 'NAME_TITLE': 'Maranello', 'TAGS': 'sf'}]
+    news = read_csv('content-bucket', 'news-content-meta.csv')
+    assert news == [{'ITEM_ID': 'news/1', 'CONTENT_TYPE': 'news', 'CHANNEL': 'fan-app-news', 'PLACE': '-',
+                     'THUMB': 'n1.jpg', 'NAME_TITLE': 'News, "quoted"', 'TAGS': ''}]
+
+
+def test_rows_from_a_local_export(handler, tmp_path):
+    data = tmp_path / 'AWSDynamoDB' / '01234-export' / 'data'
+    data.mkdir(parents=True)
+    # the items are spread over several files, as in an export
+    for i, items in enumerate((ITEMS[:2], ITEMS[2:], [])):
+        (data / f'file{i}.json.gz').write_bytes(gzip.compress(export_lines(items)))
+    (tmp_path / 'AWSDynamoDB' / '01234-export' / 'manifest-summary.json').write_text('{}')
+    response = handler.lambda_handler({'contentSource': 'export', 'exportLocation': str(tmp_path)}, None)
+    assert response == {'datasetArns': ['video-dataset', 'news-dataset']}
+    check_rows()
+
+
+def test_rows_from_an_s3_export(handler):
+    s3 = boto3.client('s3')
+    s3.put_object(Bucket='content-bucket', Key='exports/AWSDynamoDB/01234-export/data/file0.json.gz',
+                  Body=gzip.compress(export_lines(ITEMS)))
+    s3.put_object(Bucket='content-bucket', Key='exports/AWSDynamoDB/01234-export/manifest-files.json', Body=b'{}')
+    handler.lambda_handler({'contentSource': 'export', 'exportLocation': 's3://content-bucket/exports'}, None)
+    check_rows()
+
+
+def test_missing_export_raises(handler, tmp_path):
+    with pytest.raises(ValueError):
+        handler.lambda_handler({'contentSource': 'export', 'exportLocation': str(tmp_path)}, None)
+
+
+def test_csv_is_uploaded_in_parts(handler):
+    rows = [{'ITEM_ID': f'video/{i}', 'CONTENT_TYPE': 'video', 'DESCRIPTION': f'{i:0200d}', 'DURATION': str(i),
+             'THUMB': 'thumb.jpg', 'NAME_TITLE': f'video {i}', 'TAGS': 'a|b'} for i in range(60000)]
+    with handler.ItemsCsvWriter('content-bucket', 'video-content-meta.csv', handler.video_schema) as writer:
+        for row in rows:
+            writer.writerow(row)
+            # never more than a part in memory
+            assert len(writer._upload._buffer) < writer._upload.part_size
+    assert writer.rows == 60000
+    # 60000 rows of ~250 bytes: a part of 8MB and the last one
+    upload = writer._upload
+    assert len(upload._parts) == 2 and upload.part_size < upload.size < 2 * upload.part_size
+    written = read_csv('content-bucket', 'video-content-meta.csv')
+    assert written == rows
+    assert list(written[0]) == [field['name'] for field in handler.video_schema['fields']]
+
+
+def test_empty_csv_has_the_header_only(handler):
+    with handler.ItemsCsvWriter('content-bucket', 'news-content-meta.csv', handler.news_schema):
+        pass
+    body = boto3.client('s3').get_object(Bucket='content-bucket', Key='news-content-meta.csv')['Body'].read()
+    assert body.decode('utf-8').strip() == ','.join(field['name'] for field in handler.news_schema['fields'])
+
+
+def test_failed_csv_is_aborted(handler):
+    with pytest.raises(RuntimeError):
+        with handler.ItemsCsvWriter('content-bucket', 'video-content-meta.csv', handler.video_schema) as writer:
+            writer.writerow({'ITEM_ID': 'video/1'})
+            raise RuntimeError('scan failed')
+    s3 = boto3.client('s3')
+    assert 'Contents' not in s3.list_objects_v2(Bucket='content-bucket')
+    assert not s3.list_multipart_uploads(Bucket='content-bucket').get('Uploads')
@@ -0,0 +1,117 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+
+"""Watermark and dead letters of the Thron incremental sync"""
+import importlib.util
+import json
+import os
+import sys
+from datetime import datetime
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.update(CONTENT_TABLE='content', SYNC_STATE_TABLE='sync-state', THRON_HOST='https://thron.test',
+                  THRON_ADMIN_HOST='https://admin.thron.test', THRON_CONFIG_SECRET_ARN='thron-config',
+                  THRON_PUBLIC_FOLDER='public', THRON_DETAILS_MODE='detail', THRON_MAX_ITEM_ATTEMPTS='3')
+FUNCTIONS = os.path.join(os.path.dirname(__file__), '..', '..', 'lib', 'functions', 'fan-app-thron')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'lib', 'pythonlayers', 'common'))
+sys.path.insert(0, FUNCTIONS)
+
+import boto3
+import pytest
+from moto import mock_aws
+
+DETAILS = {'contentUrl': 'https://thron.test/a.mp4', 'contentType': 'VIDEO', 'name_title': 'Monza',
+           'description': '', 'thumbUrl': 'a.jpg', 'durationMs': 1000, 'creationDate': '2022-01-01',
+           'lastUpdate': '2022-01-02'}
+
+
+def thron_item(id):
+    return {'content': {'id': id, 'contentType': 'VIDEO', 'lastUpdate': '2022-01-02'},
+            'deliveryInfo': [{'channelType': 'WEBHD'}]}
+
+
+@pytest.fixture
+def handler():
+    with mock_aws():
+        boto3.client('secretsmanager').create_secret(
+            Name='thron-config', SecretString=json.dumps({'clientId': 'ferrari', 'appId': 'app', 'appKey': 'key'}))
+        dynamodb = boto3.client('dynamodb')
+        dynamodb.create_table(TableName='content', BillingMode='PAY_PER_REQUEST',
+                              AttributeDefinitions=[{'AttributeName': 'contentId', 'AttributeType': 'S'}],
+                              KeySchema=[{'AttributeName': 'contentId', 'KeyType': 'HASH'}])
+        dynamodb.create_table(TableName='sync-state', BillingMode='PAY_PER_REQUEST',
+                              AttributeDefinitions=[{'AttributeName': 'syncId', 'AttributeType': 'S'},
+                                                    {'AttributeName': 'recordId', 'AttributeType': 'S'}],
+                              KeySchema=[{'AttributeName': 'syncId', 'KeyType': 'HASH'},
+                                         {'AttributeName': 'recordId', 'KeyType': 'RANGE'}])
+        spec = importlib.util.spec_from_file_location('fan_app_thron_incremental',
+                                                      os.path.join(FUNCTIONS, 'fan-app-thron-incremental.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.get_thron_token = lambda: 'token'
+        module.create_mappings = lambda fromDate, toDate, pageSize: iter([thron_item('a'), thron_item('b')])
+        yield module
+
+
+def test_item_always_failing_is_dead_lettered_and_skipped(handler, monkeypatch):
+    import fan_app_thron_utils
+    detailCalls = []
+
+    def fetch_content_details(id):
+        detailCalls.append(id)
+        # b can never be read
+        return id, DETAILS if id == 'a' else None
+
+    monkeypatch.setattr(fan_app_thron_utils, 'fetch_content_details', fetch_content_details)
+
+    for _ in range(2):
+        result = handler.handler({}, None)
+        assert result['watermarkMoved'] is False and result['failed'] == 1
+        assert handler.get_watermark(handler.THRON_INCREMENTAL_SYNC_ID) is None
+
+    result = handler.handler({}, None)
+    assert result['watermarkMoved'] is True and result['deadLettered'] == 1
+    # the original day granularity of fromDate/toDate
+    assert handler.get_watermark(handler.THRON_INCREMENTAL_SYNC_ID) == datetime.utcnow().strftime('%Y-%m-%d')
+    assert handler.load_dead_letters(handler.THRON_INCREMENTAL_SYNC_ID) == {'b'}
+
+    detailCalls.clear()
+    result = handler.handler({}, None)
+    assert result['watermarkMoved'] is True and result['failed'] == 0
+    assert detailCalls == []
+    recordIds = [record['recordId'] for record in boto3.resource('dynamodb').Table('sync-state').scan()['Items']]
+    assert sorted(recordIds) == ['deadletter#b', 'watermark']
+
+
+def test_item_failing_once_only_holds_the_watermark_once(handler, monkeypatch):
+    import fan_app_thron_utils
+    failures = {'b': 1}
+
+    def fetch_content_details(id):
+        if failures.get(id):
+            failures[id] -= 1
+            return id, None
+        return id, DETAILS
+
+    monkeypatch.setattr(fan_app_thron_utils, 'fetch_content_details', fetch_content_details)
+
+    assert handler.handler({}, None)['watermarkMoved'] is False
+    result = handler.handler({}, None)
+    assert result['watermarkMoved'] is True and result['deadLettered'] == 0
+    # the failure counter is cleared once the watermark has moved
+    recordIds = [record['recordId'] for record in boto3.resource('dynamodb').Table('sync-state').scan()['Items']]
+    assert recordIds == ['watermark']
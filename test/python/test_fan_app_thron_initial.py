@@ -0,0 +1,119 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+
+"""Checkpoints of the Thron initial load"""
+import importlib.util
+import json
+import os
+import sys
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.update(CONTENT_TABLE='content', SYNC_STATE_TABLE='sync-state', THRON_HOST='https://thron.test',
+                  THRON_ADMIN_HOST='https://admin.thron.test', THRON_CONFIG_SECRET_ARN='thron-config',
+                  THRON_PUBLIC_FOLDER='public', THRON_DETAILS_MODE='detail')
+FUNCTIONS = os.path.join(os.path.dirname(__file__), '..', '..', 'lib', 'functions', 'fan-app-thron')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'lib', 'pythonlayers', 'common'))
+sys.path.insert(0, FUNCTIONS)
+
+import boto3
+import pytest
+from moto import mock_aws
+
+DETAILS = {'contentUrl': 'https://thron.test/a.mp4', 'contentType': 'VIDEO', 'name_title': 'Monza',
+           'description': '', 'thumbUrl': 'a.jpg', 'durationMs': 1000, 'creationDate': '2022-01-01',
+           'lastUpdate': '2022-01-02'}
+
+
+class Page(list):
+
+    def __init__(self, items, nextPage):
+        super().__init__(items)
+        self.nextPage = nextPage
+
+    def finish(self):
+        return {'nextPage': self.nextPage}
+
+
+class Context:
+    '''No time left: the handler checkpoints the first page and stops'''
+
+    def get_remaining_time_in_millis(self):
+        return 0
+
+
+def thron_item(id):
+    return {'content': {'id': id, 'contentType': 'VIDEO', 'lastUpdate': '2022-01-02'},
+            'deliveryInfo': [{'channelType': 'WEBHD'}]}
+
+
+@pytest.fixture
+def handler():
+    with mock_aws():
+        boto3.client('secretsmanager').create_secret(
+            Name='thron-config', SecretString=json.dumps({'clientId': 'ferrari', 'appId': 'app', 'appKey': 'key'}))
+        dynamodb = boto3.client('dynamodb')
+        dynamodb.create_table(TableName='content', BillingMode='PAY_PER_REQUEST',
+                              AttributeDefinitions=[{'AttributeName': 'contentId', 'AttributeType': 'S'}],
+                              KeySchema=[{'AttributeName': 'contentId', 'KeyType': 'HASH'}])
+        dynamodb.create_table(TableName='sync-state', BillingMode='PAY_PER_REQUEST',
+                              AttributeDefinitions=[{'AttributeName': 'syncId', 'AttributeType': 'S'},
+                                                    {'AttributeName': 'recordId', 'AttributeType': 'S'}],
+                              KeySchema=[{'AttributeName': 'syncId', 'KeyType': 'HASH'},
+                                         {'AttributeName': 'recordId', 'KeyType': 'RANGE'}])
+        spec = importlib.util.spec_from_file_location('fan_app_thron_initial',
+                                                      os.path.join(FUNCTIONS, 'fan-app-thron-initial.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.get_thron_token = lambda: 'token'
+        yield module
+
+
+def test_only_the_ids_written_are_checkpointed(handler, monkeypatch):
+    import fan_app_thron_utils
+    # no details for b, c misses a field of the mapping
+    details = {'a': DETAILS, 'b': None, 'c': {k: v for k, v in DETAILS.items() if k != 'contentUrl'}}
+    monkeypatch.setattr(fan_app_thron_utils, 'fetch_content_details', lambda id: (id, details[id]))
+    pages = [Page([thron_item('a'), thron_item('b'), thron_item('c')], 'cursor-2'), Page([], None)]
+    handler.create_mappings = lambda pageSize, nextPage: iter(pages)
+
+    result = handler.handler({}, Context())
+
+    assert result['refreshed'] == 1 and result['failed'] == 2 and result['done'] is False
+    checkpoint, processedIds = handler.load_checkpoint(handler.THRON_INITIAL_SYNC_ID)
+    assert checkpoint['nextPage'] == 'cursor-2'
+    assert processedIds == {'a'}
+    assert [item['contentId'] for item in boto3.resource('dynamodb').Table('content').scan()['Items']] == ['a']
+
+
+def test_failed_ids_are_retried_by_the_same_run(monkeypatch):
+    with mock_aws():
+        boto3.client('dynamodb').create_table(
+            TableName='content', BillingMode='PAY_PER_REQUEST',
+            AttributeDefinitions=[{'AttributeName': 'contentId', 'AttributeType': 'S'}],
+            KeySchema=[{'AttributeName': 'contentId', 'KeyType': 'HASH'}])
+        import fan_app_thron_utils
+        details = {'a': None}
+        monkeypatch.setattr(fan_app_thron_utils, 'fetch_content_details', lambda id: (id, details[id]))
+        processedIds = set()
+        failedIds = set()
+
+        fan_app_thron_utils.write_to_ddb([thron_item('a')], alreadyProcessedIds=processedIds, failedIds=failedIds)
+        assert failedIds == {'a'} and processedIds == set()
+
+        details['a'] = DETAILS
+        stats = fan_app_thron_utils.write_to_ddb([thron_item('a')], alreadyProcessedIds=processedIds)
+        assert stats['refreshed'] == 1 and processedIds == {'a'}
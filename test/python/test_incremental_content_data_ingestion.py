@@ -0,0 +1,104 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+
+"""Stream handler of the content table"""
+import importlib.util
+import json
+import os
+import sys
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.update(P13N='p13n', STAGE='test', ENVIRONMENT_NAME='test')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'lib', 'pythonlayers', 'common'))
+
+import boto3
+import pytest
+from boto3.dynamodb.types import TypeSerializer
+from moto import mock_aws
+
+from common_personalize_events_util import PersonalizeEventsClient
+
+HANDLER = os.path.join(os.path.dirname(__file__), '..', '..', 'lib', 'functions', 'data-preparation',
+                       'incremental_content_data_ingestion.py')
+
+
+class RecordingClient:
+    '''
+    Records the put_items calls instead of sending them to Personalize
+    '''
+
+    def __init__(self):
+        self.items = {}
+
+    def put_items(self, datasetArn, items):
+        self.items.setdefault(datasetArn, []).extend(items)
+        return {}
+
+
+def stream_record(sequenceNumber, image):
+    serialize = TypeSerializer().serialize
+    return {'eventName': 'MODIFY', 'dynamodb': {'SequenceNumber': sequenceNumber,
+                                                 'NewImage': {key: serialize(value) for key, value in image.items()}}}
+
+
+def content(contentId, contentType='video', **metadata):
+    image = {'contentId': contentId, 'contentType': contentType, 'contentMetadata': dict({
+        'thumb': 'thumb.jpg', 'name_title': contentId, 'tags': 'a|b', 'description': 'description',
+        'durationMs': 120000, 'channel': 'fan-app-news', 'place': 'Maranello'}, **metadata)}
+    if contentType is None:
+        del image['contentType']
+    return image
+
+
+@pytest.fixture
+def handler():
+    with mock_aws():
+        ssm = boto3.client('ssm')
+        ssm.put_parameter(Name='/p13n/test/videoContentDataSetArn', Value='videos', Type='String')
+        ssm.put_parameter(Name='/p13n/test/newsContentDataSetArn', Value='news', Type='String')
+        spec = importlib.util.spec_from_file_location('incremental_content_data_ingestion', HANDLER)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.events_client = PersonalizeEventsClient(client=RecordingClient())
+        yield module
+
+
+def test_record_without_content_type_is_the_only_failure(handler):
+    records = [stream_record('1', content('v1')),
+               stream_record('2', content('bad', contentType=None)),
+               stream_record('3', content('n1', 'news')),
+               stream_record('4', content('v1', name_title='renamed'))]
+    response = handler.lambda_handler({'Records': records}, None)
+    assert response == {'batchItemFailures': [{'itemIdentifier': '2'}]}
+    sent = handler.events_client._client.items
+    assert [item['itemId'] for item in sent['videos']] == ['v1']
+    assert json.loads(sent['videos'][0]['properties'])['nameTitle'] == 'renamed'
+    assert json.loads(sent['videos'][0]['properties'])['duration'] == '120000'
+    assert [item['itemId'] for item in sent['news']] == ['n1']
+
+
+def test_undecodable_record_in_a_mixed_batch_is_the_only_failure(handler):
+    records = [stream_record(str(i), content(f'v{i}')) for i in range(12)]
+    records += [stream_record(str(20 + i), content(f'n{i}', 'news')) for i in range(3)]
+    records.insert(5, {'eventName': 'MODIFY', 'dynamodb': {'SequenceNumber': '99',
+                                                          'NewImage': {'contentId': {'Z': 'unknown type'}}}})
+    records.append({'eventName': 'REMOVE', 'dynamodb': {'SequenceNumber': '100'}})
+    response = handler.lambda_handler({'Records': records}, None)
+    assert response == {'batchItemFailures': [{'itemIdentifier': '99'}]}
+    sent = handler.events_client._client.items
+    assert [item['itemId'] for item in sent['videos']] == [f'v{i}' for i in range(12)]
+    assert [item['itemId'] for item in sent['news']] == [f'n{i}' for i in range(3)]
@@ -0,0 +1,97 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+
+"""Stream handler of the user preferences table"""
+import importlib.util
+import logging
+import os
+import sys
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.update(P13N='p13n', STAGE='test', ENVIRONMENT_NAME='test',
+                  DATASET_NEWS_GROUP_ARN='news-group', DATASET_VIDEO_GROUP_ARN='videos-group')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'lib', 'pythonlayers', 'common'))
+
+import pytest
+from boto3.dynamodb.types import TypeSerializer
+
+from common_personalize_events_util import PersonalizeEventsClient
+
+HANDLER = os.path.join(os.path.dirname(__file__), '..', '..', 'lib', 'functions', 'data-preparation',
+                       'incremental_user_preferences_import.py')
+
+
+class RecordingClient:
+    '''
+    Records the put_users calls instead of sending them to Personalize
+    '''
+
+    def __init__(self):
+        self.users = {}
+        self.calls = 0
+
+    def put_users(self, datasetArn, users):
+        self.users.setdefault(datasetArn, []).extend(users)
+        self.calls += 1
+        return {}
+
+
+def stream_record(sequenceNumber, image):
+    serialize = TypeSerializer().serialize
+    return {'eventName': 'MODIFY', 'dynamodb': {'SequenceNumber': sequenceNumber,
+                                                 'NewImage': {key: serialize(value) for key, value in image.items()}}}
+
+
+def answers(personalizationId, driver='charles_leclerc'):
+    return {'personalizationId': personalizationId, 'answers': {'answers': [
+        {'questionId': 'FAVORITE_DRIVER', 'values': [driver]},
+        {'questionId': 'FAVOURITE_CAR', 'values': ['F2004']},
+        {'questionId': 'FAVOURITE_CIRCUIT', 'values': ['monza']}]}}
+
+
+@pytest.fixture
+def handler():
+    spec = importlib.util.spec_from_file_location('incremental_user_preferences_import', HANDLER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.get_dataset_arn = lambda datasetGroupArn, datasetType: f'{datasetGroupArn}/{datasetType}'
+    module.events_client = PersonalizeEventsClient(client=RecordingClient())
+    return module
+
+
+def test_calls_saved_counts_only_the_records_sent(handler, caplog):
+    # 12 records of 2 users and 9 undecodable records: 2 records sent instead of 12, 1 call instead of 2
+    records = [stream_record(str(i), answers(f'u{i % 2}')) for i in range(12)]
+    records += [{'eventName': 'MODIFY', 'dynamodb': {'SequenceNumber': str(100 + i), 'NewImage': {}}}
+                for i in range(9)]
+    with caplog.at_level(logging.INFO):
+        response = handler.handler({'Records': records}, None)
+    assert len(response['batchItemFailures']) == 9
+    assert handler.events_client._client.calls == 2
+    stats = next(record.args for record in caplog.records if record.msg.startswith('put_users stats'))
+    assert stats == {'records': 21, 'sent': 2, 'calls': 2, 'callsSaved': 2, 'failed': 9}
+
+
+def test_bad_record_in_a_mixed_batch_is_the_only_failure(handler):
+    records = [stream_record(str(i), answers(f'u{i}')) for i in range(15)]
+    # decodes but has no answers
+    records.insert(7, stream_record('99', {'personalizationId': 'bad'}))
+    response = handler.handler({'Records': records}, None)
+    assert response == {'batchItemFailures': [{'itemIdentifier': '99'}]}
+    sent = handler.events_client._client.users
+    for datasetArn in ('news-group/USERS', 'videos-group/USERS'):
+        assert [user['userId'] for user in sent[datasetArn]] == [f'u{i}' for i in range(15)]
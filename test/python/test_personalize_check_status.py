@@ -0,0 +1,77 @@
+# © 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved. This
+# AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and either Amazon Web Services, Inc. or Amazon Web Services EMEA SARL
+# or both.
+
+# Any code, applications, scripts, templates, proofs of concept, documentation
+# and other items provided by AWS under this SOW are "AWS Content," as defined
+# in the Agreement, and are provided for illustration purposes only. All such
+# AWS Content is provided solely at the option of AWS, and is subject to the
+# terms of the Addendum and the Agreement. Customer is solely responsible for
+# using, deploying, testing, and supporting any code and applications provided
+# by AWS under this SOW.
+
+
+"""Status checks of the polling loops of the state machines"""
+import importlib.util
+import os
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+import pytest
+from botocore.stub import Stubber
+
+HANDLER = os.path.join(os.path.dirname(__file__), '..', '..', 'lib', 'functions', 'fan-app-personalize',
+                       'fan-app-personalize-check-status.py')
+
+
+@pytest.fixture
+def checkStatus():
+    spec = importlib.util.spec_from_file_location('fan_app_personalize_check_status', HANDLER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.mark.parametrize('statuses, status', [
+    (['ACTIVE'], 'ACTIVE'),
+    (['ACTIVE', 'ACTIVE'], 'ACTIVE'),
+    (['ACTIVE', 'CREATE IN_PROGRESS'], 'PENDING'),
+    (['CREATE PENDING'], 'PENDING'),
+    (['ACTIVE', 'CREATE FAILED'], 'FAILED'),
+    (['CREATE IN_PROGRESS', 'CREATE STOPPED'], 'FAILED'),
+    ([], 'FAILED'),
+])
+def test_overall_status(checkStatus, statuses, status):
+    assert checkStatus.overall_status(statuses) == status
+
+
+def test_next_wait_seconds_doubles_up_to_the_max(checkStatus):
+    assert [checkStatus.next_wait_seconds(attempt, 15, 300) for attempt in range(1, 8)] == \
+        [15, 30, 60, 120, 240, 300, 300]
+
+
+def test_handler_reports_the_status_and_the_next_wait(checkStatus):
+    with Stubber(checkStatus.personalize) as stubber:
+        for status in ('ACTIVE', 'CREATE IN_PROGRESS'):
+            stubber.add_response('describe_dataset', {'dataset': {'status': status}})
+        response = checkStatus.handler({'check': 'datasets', 'arns': ['video', 'news'], 'attempt': 2,
+                                        'initialWaitSeconds': 10, 'maxWaitSeconds': 60}, None)
+    assert response == {'check': 'datasets', 'status': 'PENDING', 'statuses': ['ACTIVE', 'CREATE IN_PROGRESS'],
+                        'attempt': 3, 'waitSeconds': 40}
+
+
+def test_handler_fails_without_resources(checkStatus):
+    response = checkStatus.handler({'check': 'datasets', 'arns': []}, None)
+    assert response['status'] == 'FAILED'
+
+
+def test_handler_times_out_after_the_max_attempts(checkStatus):
+    with Stubber(checkStatus.personalize) as stubber:
+        stubber.add_response('describe_solution_version', {'solutionVersion': {'status': 'CREATE IN_PROGRESS'}})
+        response = checkStatus.handler({'check': 'solutionVersions', 'arns': ['version'],
+                                        'attempt': checkStatus.STATUS_MAX_ATTEMPTS - 1}, None)
+    assert response['status'] == 'TIMEOUT'